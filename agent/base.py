@@ -1,5 +1,6 @@
 import instructor
 from collections.abc import AsyncIterator
+import asyncio
 import base64
 import json
 import mimetypes
@@ -11,7 +12,9 @@ from typing import Any, TypeVar
 from instructor.cache import AutoCache
 from pydantic import BaseModel
 
+from agent.concurrency import AdaptiveLimiter, get_limiter, mark_attempt_end, mark_attempt_start
 from core import settings
+from schema.repair import MODEL_OUTPUT_CONTEXT
 from openai import AsyncOpenAI
 
 #OpenAi client
@@ -26,10 +29,18 @@ client = instructor.from_openai(
         maxsize=10_000
     )
 )
+# 按单次 HTTP 请求计时：校验失败后的重问不会把多次往返的总耗时算成一次高延迟
+client.on("completion:kwargs", mark_attempt_start)
+client.on("completion:response", mark_attempt_end)
 
 
 TModel = TypeVar("TModel", bound=BaseModel)
 
+# 全局 LLM 并发上限：所有 agent 的请求共享同一个 limiter，
+# 并发扩写 / 拆分 / L2 分镜同时跑时不会把网关打满
+# 每个模型另有一个自适应（AIMD）limiter，按延迟与 429/5xx 动态调整，见 agent/concurrency.py
+_llm_sem = asyncio.Semaphore(settings.LLM_MAX_CONCURRENCY)
+
 
 class BaseAgent:
     def __init__(self, model: str, prompt: str):
@@ -44,7 +55,8 @@ class BaseAgent:
         images: list[str] | None = None,
         stream: bool = False,
         max_retries: int = 3,
-        need_thinking=False
+        need_thinking=False,
+        max_tokens: int | None = None,
     ) -> TModel | AsyncIterator[TModel]:
         user_content: str | list[dict[str, Any]] = message
         if images:
@@ -58,24 +70,33 @@ class BaseAgent:
             {"role": "user", "content": user_content},
         ]
         print(messages)
+        # max_tokens: 调用方按预期输出长度给的上限（None 表示不限制）
+        extra: dict[str, Any] = {"max_tokens": int(max_tokens)} if max_tokens else {}
+        limiter = get_limiter(self.model)
         if stream:
-            return client.create(
+            return self._stream(
+                limiter,
                 model=self.model,
                 response_model=response_model,
                 messages=messages,
                 max_retries=max_retries,
+                context=MODEL_OUTPUT_CONTEXT,
                 stream=True,
                 extra_body={"chat_template_kwargs": {"thinking": need_thinking}},
+                **extra,
             )
 
         try:
-            return await client.create(
-                model=self.model,
-                response_model=response_model,
-                messages=messages,
-                max_retries=max_retries,
-                extra_body={"chat_template_kwargs": {"thinking": need_thinking}},
-            )
+            async with limiter.slot(gate=_llm_sem):
+                return await client.create(
+                    model=self.model,
+                    response_model=response_model,
+                    messages=messages,
+                    max_retries=max_retries,
+                    context=MODEL_OUTPUT_CONTEXT,
+                    extra_body={"chat_template_kwargs": {"thinking": need_thinking}},
+                    **extra,
+                )
         except Exception as e:
             msg = str(e)
             if "invalid grammar request" not in msg.lower():
@@ -90,15 +111,28 @@ class BaseAgent:
                 {"role": "system", "content": f"JSON_SCHEMA: {json.dumps(schema, ensure_ascii=False)}"},
                 {"role": "user", "content": user_content},
             ]
-            resp = await _raw_client.chat.completions.create(
-                model=self.model,
-                messages=fallback_messages,
-                response_format={"type": "json_object"},
-                extra_body={"chat_template_kwargs": {"thinking": need_thinking}},
-            )
+            async with limiter.slot(gate=_llm_sem):
+                resp = await _raw_client.chat.completions.create(
+                    model=self.model,
+                    messages=fallback_messages,
+                    response_format={"type": "json_object"},
+                    extra_body={"chat_template_kwargs": {"thinking": need_thinking}},
+                    **extra,
+                )
             content = (resp.choices[0].message.content or "").strip()
             return _parse_json_content_to_model(content, response_model)
 
+    @staticmethod
+    async def _stream(limiter: AdaptiveLimiter, **kwargs: Any) -> AsyncIterator[Any]:
+        # 流式请求同样占用模型与全局名额，直到流读完（或调用方停止迭代）才释放
+        async with limiter.slot(gate=_llm_sem):
+            result = await client.create(**kwargs)
+            if hasattr(result, "__aiter__"):
+                async for item in result:
+                    yield item
+            else:
+                yield result
+
 
 def _is_http_url(s: str) -> bool:
     try:
@@ -131,13 +165,13 @@ def _get_model_json_schema(model: type[BaseModel]) -> dict[str, Any]:
 def _parse_json_content_to_model(content: str, model: type[TModel]) -> TModel:
     if hasattr(model, "model_validate_json"):
         try:
-            return model.model_validate_json(content)  # type: ignore[return-value]
+            return model.model_validate_json(content, context=MODEL_OUTPUT_CONTEXT)  # type: ignore[return-value]
         except Exception:
             pass
     try:
         data = json.loads(content)
         if hasattr(model, "model_validate"):
-            return model.model_validate(data)  # type: ignore[return-value]
+            return model.model_validate(data, context=MODEL_OUTPUT_CONTEXT)  # type: ignore[return-value]
         return model.parse_obj(data)  # type: ignore[return-value]
     except Exception:
         m = re.search(r"\{[\s\S]*\}", content)
@@ -145,5 +179,5 @@ def _parse_json_content_to_model(content: str, model: type[TModel]) -> TModel:
             raise
         candidate = m.group(0)
         if hasattr(model, "model_validate_json"):
-            return model.model_validate_json(candidate)  # type: ignore[return-value]
+            return model.model_validate_json(candidate, context=MODEL_OUTPUT_CONTEXT)  # type: ignore[return-value]
         return model.parse_raw(candidate)  # type: ignore[return-value]
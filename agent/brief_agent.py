@@ -0,0 +1,30 @@
+from agent.base import BaseAgent
+from core import settings
+from schema.base import ContentBrief
+
+
+class ContentBriefAgent(BaseAgent):
+
+    def __init__(self):
+        super().__init__(
+            settings.L0_AGENT_MODEL,
+            "你是视频脚本团队的资料整理员。把用户提供的原文浓缩为后续分镜创作可用的简报，只保留事实，不做创作。Output ONLY valid JSON.",
+        )
+
+    async def infer_brief(self, *, content: str) -> ContentBrief:
+        msg = (
+            "阅读下面的原文，输出 ContentBrief：\n"
+            "- summary: 原文主旨，两三句话\n"
+            "- key_facts: 分镜创作必须依据的关键事实、数据、人物、情节（按原文顺序，不超过 20 条）\n"
+            "- product_attributes: 涉及的产品/品牌名称、卖点、规格、价格等；没有则为空列表\n"
+            "- tone: 原文的语气与风格\n"
+            "- must_keep: 需要原样引用的关键词句或口号；没有则为空列表\n"
+            "不得编造原文没有的信息。\n\n"
+            f"USER_CONTENT:\n{content}"
+        )
+
+        return await self.infer(
+            message=msg,
+            response_model=ContentBrief,
+            need_thinking=False,
+        )
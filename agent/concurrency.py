@@ -0,0 +1,261 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import deque
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+
+import openai
+
+from core import settings
+from util import metrics
+
+
+# 调度优先级：low 的请求（投机预生成等后台任务）只在没有普通请求排队时放行，且最多占用一半名额
+_low_priority: ContextVar[bool] = ContextVar("llm_low_priority", default=False)
+
+
+# 当前任务正在占用的名额：instructor 的 completion hook 借此按单次 HTTP 请求计时（见 mark_attempt_start / mark_attempt_end）
+_current_slot: ContextVar["_Slot | None"] = ContextVar("llm_current_slot", default=None)
+
+
+@contextmanager
+def low_priority():
+    # 在该上下文内（含其中创建的子任务）发起的 LLM 请求按低优先级调度
+    token = _low_priority.set(True)
+    try:
+        yield
+    finally:
+        _low_priority.reset(token)
+
+
+class AdaptiveLimiter:
+    """
+    单个模型的 AIMD 并发控制器：
+    - 成功且延迟不超过 latency_target：慢启动阶段（limit < ssthresh）每个请求 +1，之后每轮约 +1
+    - 遇到 429 / 5xx / 超时，或延迟超过 latency_target：limit 乘以 decrease_factor；
+      在上次下调之前发出的请求不再触发下调（每轮最多降一次）
+    limit 始终介于 [min_limit, max_limit]；所有模型另外共享 agent.base 的全局上限
+    """
+
+    def __init__(
+        self,
+        name: str,
+        *,
+        initial: int,
+        max_limit: int,
+        min_limit: int = 1,
+        latency_target: float = 60.0,
+        decrease_factor: float = 0.5,
+    ) -> None:
+        self.name = name
+        self.min_limit = max(1, int(min_limit))
+        self.max_limit = max(self.min_limit, int(max_limit))
+        self.latency_target = float(latency_target)
+        self.decrease_factor = float(decrease_factor)
+        self._limit = float(min(max(int(initial), self.min_limit), self.max_limit))
+        self._ssthresh = float(self.max_limit)
+        self._in_flight = 0
+        self._last_decrease = float("-inf")
+        self._low_in_flight = 0
+        self._waiters: deque[asyncio.Future[None]] = deque()
+        self._low_waiters: deque[asyncio.Future[None]] = deque()
+        self._report()
+
+    @property
+    def limit(self) -> int:
+        return max(self.min_limit, int(self._limit))
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def _can_enter(self, low: bool) -> bool:
+        if self._in_flight >= self.limit:
+            return False
+        if low:
+            return not self._waiters and self._low_in_flight < max(1, self.limit // 2)
+        return True
+
+    async def acquire(self) -> bool:
+        # 返回本次是否按低优先级放行（release 时需传回）
+        low = _low_priority.get()
+        waiters = self._low_waiters if low else self._waiters
+        while not self._can_enter(low):
+            fut: asyncio.Future[None] = asyncio.get_running_loop().create_future()
+            waiters.append(fut)
+            try:
+                await fut
+            except asyncio.CancelledError:
+                # 已被唤醒却被取消：把名额让给下一个等待者
+                if fut.done() and not fut.cancelled():
+                    self._wake()
+                raise
+            finally:
+                if fut in waiters:
+                    waiters.remove(fut)
+        self._in_flight += 1
+        if low:
+            self._low_in_flight += 1
+        self._report()
+        return low
+
+    def release(
+        self,
+        *,
+        started_at: float | None = None,
+        latency: float | None = None,
+        overloaded: bool = False,
+        failed: bool = False,
+        low: bool = False,
+    ) -> None:
+        self._in_flight -= 1
+        if low:
+            self._low_in_flight -= 1
+        if overloaded or (latency is not None and latency > self.latency_target):
+            if started_at is None or started_at >= self._last_decrease:
+                self._decrease()
+        elif not failed:
+            self._increase()
+        self._report()
+        self._wake()
+
+    def abandon(self, *, low: bool = False) -> None:
+        # 还没发出请求就放弃名额（例如排全局名额时被取消）：不计入延迟与成败信号
+        self._in_flight -= 1
+        if low:
+            self._low_in_flight -= 1
+        self._report()
+        self._wake()
+
+    @asynccontextmanager
+    async def slot(self, gate: asyncio.Semaphore | None = None) -> AsyncIterator["_Slot"]:
+        # gate: 模型名额之外还要排队的全局名额（agent.base 的全局上限）；拿到后才开始计时，
+        # 全局排队的时间与排队中的取消都不计入本模型的延迟信号
+        low = await self.acquire()
+        if gate is not None:
+            try:
+                await gate.acquire()
+            except BaseException:
+                self.abandon(low=low)
+                raise
+        s = _Slot()
+        _current_slot.set(s)
+        try:
+            yield s
+        except BaseException as e:
+            # 只有 429 / 5xx / 超时才是服务端在退压；取消（用户取消、租约丢失、停止读流）与校验失败等不计入延迟信号
+            overloaded = is_overload_error(e)
+            if isinstance(e, asyncio.CancelledError):
+                outcome = "cancelled"
+            else:
+                outcome = "overload" if overloaded else "error"
+            metrics.inc("llm_requests_total", model=self.name, outcome=outcome)
+            self.release(started_at=s.started_at, latency=None, overloaded=overloaded, failed=True, low=low)
+            raise
+        else:
+            latency = s.latency()
+            metrics.inc("llm_requests_total", model=self.name, outcome="ok")
+            metrics.observe("llm_request_seconds", latency, model=self.name)
+            self.release(started_at=s.started_at, latency=latency, low=low)
+        finally:
+            if _current_slot.get() is s:
+                _current_slot.set(None)
+            if gate is not None:
+                gate.release()
+
+    def _increase(self) -> None:
+        if self._limit < self._ssthresh:
+            self._limit += 1
+        else:
+            self._limit += 1 / max(1.0, self._limit)
+        self._limit = min(self._limit, float(self.max_limit))
+
+    def _decrease(self) -> None:
+        self._last_decrease = time.monotonic()
+        self._limit = max(float(self.min_limit), self._limit * self.decrease_factor)
+        self._ssthresh = max(float(self.min_limit), self._limit)
+        metrics.inc("llm_backoff_total", model=self.name)
+
+    def _wake(self) -> None:
+        # 先唤醒普通请求；被唤醒者会重新检查条件，多唤醒不会超发
+        free = self.limit - self._in_flight
+        while free > 0 and self._waiters:
+            fut = self._waiters.popleft()
+            if not fut.done():
+                fut.set_result(None)
+                free -= 1
+        low_free = min(free, max(1, self.limit // 2) - self._low_in_flight)
+        while low_free > 0 and self._low_waiters and not self._waiters:
+            fut = self._low_waiters.popleft()
+            if not fut.done():
+                fut.set_result(None)
+                low_free -= 1
+
+    def _report(self) -> None:
+        metrics.set_gauge("llm_concurrency_limit", self.limit, model=self.name)
+        metrics.set_gauge("llm_in_flight", self._in_flight, model=self.name)
+
+
+class _Slot:
+    def __init__(self) -> None:
+        self.started_at = time.monotonic()
+        self._attempt_started_at: float | None = None
+        self._attempt_latency: float | None = None
+
+    def latency(self) -> float:
+        # 取最慢的一次 HTTP 请求（instructor 的校验重问各算一次）；没有 hook 计时（缓存命中、非 instructor 调用）时取整段耗时
+        if self._attempt_latency is not None:
+            return self._attempt_latency
+        return time.monotonic() - self.started_at
+
+
+def mark_attempt_start(*_args: object, **_kwargs: object) -> None:
+    # instructor "completion:kwargs" hook：每次发出 HTTP 请求前调用
+    s = _current_slot.get()
+    if s is not None:
+        s._attempt_started_at = time.monotonic()
+
+
+def mark_attempt_end(*_args: object, **_kwargs: object) -> None:
+    # instructor "completion:response" hook：每次拿到响应后调用
+    s = _current_slot.get()
+    if s is not None and s._attempt_started_at is not None:
+        elapsed = time.monotonic() - s._attempt_started_at
+        s._attempt_latency = max(s._attempt_latency or 0.0, elapsed)
+        s._attempt_started_at = None
+
+
+def is_overload_error(e: BaseException) -> bool:
+    # 沿异常链查找 429 / 5xx / 超时 / 连接错误（instructor 会把 openai 异常包一层）
+    seen: set[int] = set()
+    err: BaseException | None = e
+    while err is not None and id(err) not in seen:
+        seen.add(id(err))
+        if isinstance(err, (asyncio.TimeoutError, openai.APITimeoutError, openai.APIConnectionError)):
+            return True
+        status = getattr(err, "status_code", None)
+        if status is None:
+            status = getattr(getattr(err, "response", None), "status_code", None)
+        if isinstance(status, int) and (status == 429 or status >= 500):
+            return True
+        err = err.__cause__ or err.__context__
+    return False
+
+
+_limiters: dict[str, AdaptiveLimiter] = {}
+
+
+def get_limiter(model: str) -> AdaptiveLimiter:
+    limiter = _limiters.get(model)
+    if limiter is None:
+        limiter = AdaptiveLimiter(
+            model,
+            initial=settings.LLM_INITIAL_CONCURRENCY,
+            max_limit=settings.LLM_MODEL_MAX_CONCURRENCY,
+            latency_target=settings.LLM_LATENCY_TARGET_SEC,
+        )
+        _limiters[model] = limiter
+    return limiter
@@ -0,0 +1,56 @@
+import asyncio
+import contextlib
+from collections.abc import AsyncIterator, Awaitable, Callable
+from typing import Any
+
+
+class EventSink:
+    """
+    工作流 -> 消费者的事件通道：
+    - put: 结果事件（await）。消费者未取走的结果事件最多积压 max_pending 个，超出时生产者等待（背压）
+    - put_nowait: 进度事件（同步回调里用）。不阻塞，也不占积压名额
+    """
+
+    def __init__(self, max_pending: int = 8) -> None:
+        self._queue: asyncio.Queue[tuple[Any, bool]] = asyncio.Queue()
+        self._slots = asyncio.Semaphore(max(1, int(max_pending)))
+
+    async def put(self, event: Any) -> None:
+        await self._slots.acquire()
+        self._queue.put_nowait((event, True))
+
+    def put_nowait(self, event: Any) -> None:
+        self._queue.put_nowait((event, False))
+
+
+async def stream_events(
+    run: Callable[[EventSink], Awaitable[Any]],
+    *,
+    max_pending: int = 8,
+) -> AsyncIterator[Any]:
+    # 在后台任务中执行 run(sink)，按产生顺序 yield 事件；run 抛出的异常在事件取完后重新抛出。
+    # 消费者提前停止迭代（break 后 aclose / 被取消）时取消后台任务，进行中的 LLM 请求随之取消。
+    sink = EventSink(max_pending)
+    task = asyncio.create_task(run(sink))
+    get: asyncio.Future | None = None
+    try:
+        while True:
+            if task.done() and sink._queue.empty():
+                break
+            get = asyncio.ensure_future(sink._queue.get())
+            done, _ = await asyncio.wait({get, task}, return_when=asyncio.FIRST_COMPLETED)
+            if get not in done:
+                get.cancel()
+                continue
+            event, bounded = get.result()
+            if bounded:
+                sink._slots.release()
+            yield event
+        task.result()
+    finally:
+        if get is not None and not get.done():
+            get.cancel()
+        if not task.done():
+            task.cancel()
+            with contextlib.suppress(BaseException):
+                await task
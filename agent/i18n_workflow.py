@@ -0,0 +1,94 @@
+import asyncio
+from collections.abc import Callable
+
+from agent.translate_agent import L2TranslateAgent
+from schema.base import ProgressEvent, Section
+
+
+# 只翻译文案类字段；时长、景别（shot）、运镜（camera_move）、item_id 原样保留
+_SECTION_TEXT_FIELDS = ("section", "rationale")
+_SEGMENT_TEXT_FIELDS = ("title", "location", "visual", "onscreen_text", "audio", "music", "transition", "compliance_notes")
+
+
+def _collect_texts(sections: list[dict]) -> list[tuple[tuple, str]]:
+    # 返回 [(路径, 原文)]；路径用于把译文写回：(i, field) / (i, j, field) / (i, j, "props", k)
+    out: list[tuple[tuple, str]] = []
+    for i, sec in enumerate(sections):
+        for f in _SECTION_TEXT_FIELDS:
+            if sec.get(f):
+                out.append(((i, f), sec[f]))
+        for j, seg in enumerate(sec.get("sub_sections") or []):
+            for f in _SEGMENT_TEXT_FIELDS:
+                if seg.get(f):
+                    out.append(((i, j, f), seg[f]))
+            for k, p in enumerate(seg.get("props") or []):
+                if p:
+                    out.append(((i, j, "props", k), p))
+    return out
+
+
+def _apply_texts(sections: list[dict], paths: list[tuple], texts: list[str]) -> None:
+    for path, text in zip(paths, texts):
+        sec = sections[path[0]]
+        if len(path) == 2:
+            sec[path[1]] = text
+        elif len(path) == 3:
+            sec["sub_sections"][path[1]][path[2]] = text
+        else:
+            sec["sub_sections"][path[1]]["props"][path[3]] = text
+
+
+def _batch_by_chars(items: list[tuple[tuple, str]], max_chars: int) -> list[list[tuple[tuple, str]]]:
+    batches: list[list[tuple[tuple, str]]] = []
+    used = 0
+    for it in items:
+        n = len(it[1])
+        if batches and used + n <= max_chars:
+            batches[-1].append(it)
+            used += n
+        else:
+            batches.append([it])
+            used = n
+    return batches
+
+
+async def l2_translate_sections(
+    sections: list[Section],
+    language: str,
+    *,
+    batch_chars: int = 4000,
+    retries_per_batch: int = 1,
+    on_progress: Callable[[ProgressEvent], None] | None = None,
+) -> list[Section]:
+    # 把一份 L2 结果翻译成 language：文案按字符预算打包成多批并发请求，结构与 item_id 不变
+    agent = L2TranslateAgent()
+    dumped = [s.model_dump() for s in sections]
+    batches = _batch_by_chars(_collect_texts(dumped), max(1, int(batch_chars)))
+
+    def _emit(event_type: str, data: dict) -> None:
+        if on_progress is not None:
+            on_progress(ProgressEvent(phase="l2_i18n", type=event_type, data={"language": language, **data}))
+
+    _emit("start", {"batches": len(batches)})
+
+    async def _run_batch(b: int, batch: list[tuple[tuple, str]]) -> None:
+        texts = [t for _, t in batch]
+        last_err: Exception | None = None
+        for t in range(retries_per_batch + 1):
+            try:
+                out = await agent.translate_infer(texts=texts, language=language)
+                if len(out) != len(texts):
+                    raise ValueError(f"translated {len(out)} texts for {len(texts)} inputs")
+                _apply_texts(dumped, [p for p, _ in batch], out)
+                _emit("batch_success", {"batch": b + 1, "texts": len(texts)})
+                return
+            except Exception as e:
+                last_err = e
+                _emit("batch_error", {"batch": b + 1, "try": t + 1, "error": repr(e)})
+        raise last_err  # type: ignore[misc]
+
+    results = await asyncio.gather(*[_run_batch(b, batch) for b, batch in enumerate(batches)], return_exceptions=True)
+    for r in results:
+        if isinstance(r, BaseException):
+            raise r
+    return [Section.model_validate(d) for d in dumped]
@@ -1,10 +1,42 @@
-from agent.l1_writer_agents import L1ScreenwriterAgent, L1SectionAdjustAgent, L1SectionSplitAgent
+from agent.l1_writer_agents import L1OutlineAgent, L1ScreenwriterAgent, L1SectionAdjustAgent, L1SectionSplitAgent
+import asyncio
 import json
+import math
+import re
 import sys
 import time
-from collections.abc import Callable
-from schema.base import L1VideoScript, ProgressEvent, ScriptSection
+from collections.abc import AsyncIterator, Awaitable, Callable
+from typing import Any, Literal
+from agent.event_stream import EventSink, stream_events
+from schema.base import (
+    L1_HIER_STAGE_STRIDE,
+    L1Checkpoint,
+    L1Outline,
+    L1OutlineSegment,
+    L1ResultEvent,
+    L1SectionsEvent,
+    L1StageCheckpoint,
+    L1VideoScript,
+    ProgressEvent,
+    ScriptSection,
+    WorkflowEvent,
+)
 from core.compass import CompassSelection, build_compass_prompt
+from schema.repair import fit_durations
+from util.base import estimate_tokens
+
+
+# serial: 逐段续写（每段依赖上一段的 previous_json，need_write_next 决定是否继续）
+# parallel: 先一次生成轻量大纲（分段标题 + 目标时长），再并发扩写各分段并合并
+# hierarchical: 长视频（10~60 分钟）先分幕，再并发把各幕细分为章节、扩写章节；某幕的章节大纲一出来就开始扩写，
+#   总耗时约等于最长的一条「幕 -> 章节」分支，而不是所有阶段之和
+L1Mode = Literal["serial", "parallel", "hierarchical"]
+
+# 超长段落拆分策略：
+# auto: 文本有清晰的句子结构时本地按句拆分，否则交给 L1SectionSplitAgent
+# rule: 优先本地拆分（句子不够时退到分句/逗号粒度），拆不开再交给模型
+# llm: 始终交给模型拆分
+SplitStrategy = Literal["auto", "rule", "llm"]
 
 
 async def l1_script_infer(
@@ -22,14 +54,38 @@ async def l1_script_infer(
     show_progress: bool = True,
 
     include_stage_result: bool = True,
+    mode: L1Mode = "serial",
+    parallel_num: int = 3,
+    outline_segment_duration: int = 90,
+    continuation_token_budget: int = 800,
+    split_strategy: SplitStrategy = "auto",
+    resume_from: L1Checkpoint | None = None,
+    on_checkpoint: Callable[[L1StageCheckpoint], Awaitable[None]] | None = None,
+    duration_budget: bool = True,
+    stage_seconds_hint: int = 120,
+    variant_hint: str | None = None,
+    act_duration: int = 600,
+    max_section_duration: int = 60,
+    on_sections_ready: Callable[[tuple[int, ...], list[ScriptSection]], Awaitable[None]] | None = None,
 
 ) -> L1VideoScript:
+    # resume_from: 从已完成的阶段/分段继续，不再重复请求模型
+    # on_checkpoint: 每个阶段（或大纲/分段）成功后 await 回调，调用方负责持久化
+    # duration_budget: 串行模式下按剩余时长规划每阶段目标时长，预算写满即停止（不再依赖 need_write_next）
+    # variant_hint: 多方案并发生成时附在提示词末尾，保持前缀一致的同时让各方案互相区分
+    # act_duration: hierarchical 模式下每幕的最大时长；max_section_duration: 收尾时超过该时长的段落会被拆分
+    # on_sections_ready: 流水线模式。每个阶段/分段/章节完成后立即做超长拆分，并 await 回调 (order, sections)；
+    #   order 为该批段落在最终 body 中的排序键（serial: (stage,)；parallel: (segment,)；hierarchical: (act, chapter)），
+    #   调用方可据此提前启动 L2。最终结果与非流水线模式一致
+    if mode not in ("serial", "parallel", "hierarchical"):
+        raise ValueError(f"unknown L1 mode: {mode}")
+
     compass_prompt = build_compass_prompt(root_dir="./compass", platform=platform, selection=compass)
     base_agent = L1ScreenwriterAgent(compass_prompt=compass_prompt)
 
-    stages: list[L1VideoScript] = []
-    previous_json: str | None = None
-    current_second: int = 0
+    stages: list[L1VideoScript] = list(resume_from.stages) if resume_from else []
+    previous_json: str | None = resume_from.previous_json if resume_from else None
+    current_second: int = resume_from.current_second if resume_from else 0
 
     user_progress = on_progress
     printer = _default_progress_printer() if (show_progress and user_progress is None) else None
@@ -40,6 +96,48 @@ async def l1_script_infer(
         if printer is not None:
             printer({"type": event_type, **data})
 
+    # 流水线模式下已拆分的各批段落（按 order 排序后即为最终 body）
+    ready: dict[tuple[int, ...], list[ScriptSection]] = {}
+
+    async def _stage_ready(order: tuple[int, ...], stage: L1VideoScript) -> None:
+        if on_sections_ready is None:
+            return
+        split = await _split_overlong_sections(
+            stage,
+            max_section_duration=max_section_duration,
+            compass_prompt=compass_prompt,
+            on_progress=_emit,
+            strategy=split_strategy,
+        )
+        ready[order] = list(split.body)
+        await on_sections_ready(order, ready[order])
+
+    async def _finalize(merged: L1VideoScript, stage_count: int) -> L1VideoScript:
+        if on_sections_ready is None:
+            merged = await _split_overlong_sections(
+                merged,
+                max_section_duration=max_section_duration,
+                compass_prompt=compass_prompt,
+                on_progress=_emit,
+                strategy=split_strategy,
+            )
+        else:
+            # 与 _split_overlong_sections 一致：总时长按拼接后的 body 重新求和，保证与分阶段模式的结果相同
+            body = [x for k in sorted(ready) for x in ready[k]]
+            merged = merged.model_copy(update={"body": body, "total_duration": sum(s.duration for s in body)})
+
+        _emit(
+            "done",
+            {
+                "stages": stage_count,
+                "merged_keywords_count": len(merged.keywords),
+                "merged_body_count": len(merged.body),
+            },
+        )
+        if printer is not None:
+            printer({"type": "newline"})
+        return merged
+
     _emit(
         "start",
         {
@@ -47,12 +145,132 @@ async def l1_script_infer(
             "retries_per_iter": retries_per_iter,
             "current_second": current_second,
             "images_count": len(images) if images else 0,
+            "mode": mode,
         },
     )
+    if resume_from is not None and not resume_from.is_empty():
+        _emit(
+            "resume",
+            {
+                "stages": len(resume_from.stages),
+                "segments": len(resume_from.segments),
+                "has_outline": resume_from.outline is not None,
+                "current_second": current_second,
+            },
+        )
+
+    resume_outline = resume_from.outline if resume_from else None
+    # 不超过一幕的视频分幕没有意义，退化为 parallel
+    if mode == "hierarchical" and max_duration > act_duration:
+        try:
+            acts = resume_outline or await _infer_l1_outline(
+                content=content,
+                max_duration=max_duration,
+                target_audience=target_audience,
+                platform=platform,
+                language=language,
+                images=images,
+                compass_prompt=compass_prompt,
+                max_segment_duration=act_duration,
+                retries=retries_per_iter,
+                emit=_emit,
+                variant_hint=variant_hint,
+            )
+        except Exception as e:
+            # 分幕失败时退回 parallel（仍比串行续写更适合长视频）
+            _emit("hierarchical_fallback", {"error": repr(e)})
+        else:
+            if resume_outline is None and on_checkpoint is not None:
+                await on_checkpoint(L1StageCheckpoint(kind="outline", stage=0, result=acts.model_dump()))
+
+            stages = await _expand_l1_acts(
+                acts,
+                agent=base_agent,
+                content=content,
+                max_duration=max_duration,
+                target_audience=target_audience,
+                platform=platform,
+                language=language,
+                images=images,
+                compass_prompt=compass_prompt,
+                chapter_duration=outline_segment_duration,
+                parallel_num=parallel_num,
+                retries=retries_per_iter,
+                include_stage_result=include_stage_result,
+                emit=_emit,
+                resume_from=resume_from,
+                on_checkpoint=on_checkpoint,
+                variant_hint=variant_hint,
+                on_chapter_done=(lambda a, c, r: _stage_ready((a, c), r)) if on_sections_ready else None,
+            )
+            return await _finalize(_merge_outlined_stages(acts, stages, max_duration=max_duration), len(stages))
+        resume_outline = None
+
+    # 短视频一段就能写完，大纲 + 扩写反而多一次往返，直接走串行
+    if resume_outline is not None or (mode != "serial" and max_duration > outline_segment_duration):
+        try:
+            outline = resume_outline or await _infer_l1_outline(
+                content=content,
+                max_duration=max_duration,
+                target_audience=target_audience,
+                platform=platform,
+                language=language,
+                images=images,
+                compass_prompt=compass_prompt,
+                max_segment_duration=outline_segment_duration,
+                retries=retries_per_iter,
+                emit=_emit,
+                variant_hint=variant_hint,
+            )
+        except Exception as e:
+            # 大纲拿不到时退回串行续写
+            _emit("parallel_fallback", {"error": repr(e)})
+        else:
+            if resume_outline is None and on_checkpoint is not None:
+                await on_checkpoint(L1StageCheckpoint(kind="outline", stage=0, result=outline.model_dump()))
+
+            stages = await _expand_l1_outline(
+                outline,
+                agent=base_agent,
+                content=content,
+                max_duration=max_duration,
+                target_audience=target_audience,
+                platform=platform,
+                language=language,
+                images=images,
+                parallel_num=parallel_num,
+                retries=retries_per_iter,
+                include_stage_result=include_stage_result,
+                emit=_emit,
+                done=resume_from.segments if resume_from else None,
+                on_checkpoint=on_checkpoint,
+                variant_hint=variant_hint,
+                on_segment_done=(lambda i, r: _stage_ready((i,), r)) if on_sections_ready else None,
+            )
+            return await _finalize(_merge_outlined_stages(outline, stages, max_duration=max_duration), len(stages))
 
-    for _ in range(max_iters):
+    # 断点恢复的串行阶段同样要交给流水线
+    for i, st in enumerate(stages):
+        await _stage_ready((i + 1,), st)
+
+    # 断点恰好落在最后一个阶段之后（例如拆分阶段失败），直接合并收尾
+    if stages and not stages[-1].need_write_next:
+        return await _finalize(_merge_l1_stages(stages), len(stages))
+
+    while len(stages) < max_iters:
         stage_index = len(stages) + 1
+        plan = (
+            _plan_next_stage(
+                max_duration=max_duration,
+                current_second=current_second,
+                finished_stages=len(stages),
+                stage_seconds_hint=stage_seconds_hint,
+            )
+            if duration_budget
+            else {}
+        )
         last_err: Exception | None = None
+        result: L1VideoScript | None = None
         for _try in range(retries_per_iter + 1):
             try:
                 _emit(
@@ -64,6 +282,8 @@ async def l1_script_infer(
                         "current_second": current_second,
                         "max_duration": max_duration,
                         "images_count": len(images) if images else 0,
+                        "previous_tokens": estimate_tokens(previous_json or ""),
+                        **plan,
                     },
                 )
 
@@ -76,52 +296,10 @@ async def l1_script_infer(
                     language=language,
                     current_second=current_second,
                     images=images,
+                    remaining_seconds=plan.get("remaining_seconds"),
+                    target_stage_duration=plan.get("target_stage_duration"),
+                    variant_hint=variant_hint,
                 )
-                stages.append(result)
-
-                stage_duration = sum((x.duration for x in (result.body or [])), 0)
-                current_second += stage_duration
-
-                # pass previous as json string to the next iteration
-                previous_json = json.dumps(result.model_dump(), ensure_ascii=False)
-
-                evt = {
-                    "stage": stage_index,
-                    "need_write_next": result.need_write_next,
-                    "title": getattr(result, "title", None),
-                    "keywords_count": len(getattr(result, "keywords", []) or []),
-                    "body_count": len(getattr(result, "body", []) or []),
-                    "stage_duration": stage_duration,
-                    "current_second": current_second,
-                    "max_duration": max_duration,
-                }
-                if include_stage_result:
-                    result_dict = result.model_dump()
-                    evt["result"] = result_dict
-                    evt["result_json"] = json.dumps(result_dict, ensure_ascii=False)
-                _emit("iter_success", evt)
-
-                if not result.need_write_next:
-                    merged = _merge_l1_stages(stages)
-
-                    merged = await _split_overlong_sections(
-                        merged,
-                        max_section_duration=60,
-                        compass_prompt=compass_prompt,
-                        on_progress=_emit,
-                    )
-
-                    _emit(
-                        "done",
-                        {
-                            "stages": len(stages),
-                            "merged_keywords_count": len(merged.keywords),
-                            "merged_body_count": len(merged.body),
-                        },
-                    )
-                    if printer is not None:
-                        printer({"type": "newline"})
-                    return merged
                 break
             except Exception as e:
                 last_err = e
@@ -133,23 +311,511 @@ async def l1_script_infer(
                         "error": repr(e),
                     },
                 )
-        else:
+
+        if result is None:
+            if printer is not None:
+                printer({"type": "newline"})
             if last_err is not None:
-                if printer is not None:
-                    printer({"type": "newline"})
                 raise last_err
+            raise RuntimeError("unreachable")
+
+        stage_duration = sum((x.duration for x in (result.body or [])), 0)
+        current_second += stage_duration
+
+        # 预算已写满：无论模型的 need_write_next 如何都在此收尾
+        if duration_budget and result.need_write_next and current_second >= max_duration - _budget_tolerance(max_duration):
+            result = result.model_copy(update={"need_write_next": False})
+
+        stages.append(result)
+
+        # pass previous as json string to the next iteration
+        # budget > 0: 只传滚动摘要（大小受预算约束）；<= 0: 沿用整段 previous
+        if continuation_token_budget > 0:
+            previous_json = _build_continuation_digest(stages, token_budget=continuation_token_budget)
+        else:
+            previous_json = json.dumps(result.model_dump(), ensure_ascii=False)
+
+        evt = {
+            "stage": stage_index,
+            "need_write_next": result.need_write_next,
+            "title": getattr(result, "title", None),
+            "keywords_count": len(getattr(result, "keywords", []) or []),
+            "body_count": len(getattr(result, "body", []) or []),
+            "stage_duration": stage_duration,
+            "current_second": current_second,
+            "max_duration": max_duration,
+        }
+        if include_stage_result:
+            result_dict = result.model_dump()
+            evt["result"] = result_dict
+            evt["result_json"] = json.dumps(result_dict, ensure_ascii=False)
+        _emit("iter_success", evt)
+
+        if on_checkpoint is not None:
+            await on_checkpoint(
+                L1StageCheckpoint(
+                    kind="stage",
+                    stage=stage_index,
+                    result=result.model_dump(),
+                    current_second=current_second,
+                    previous_json=previous_json,
+                )
+            )
+        await _stage_ready((stage_index,), result)
+
+        if not result.need_write_next:
+            return await _finalize(_merge_l1_stages(stages), len(stages))
 
     if printer is not None:
         printer({"type": "newline"})
     raise RuntimeError(f"workflow exceeded max_iters={max_iters}")
 
 
+def l1_script_infer_stream(
+    *args: Any,
+    max_pending: int = 8,
+    include_progress: bool = False,
+    **kwargs: Any,
+) -> AsyncIterator[WorkflowEvent]:
+    # l1_script_infer 的异步迭代版本（参数相同）：每个阶段/分段/章节确定后 yield L1SectionsEvent，最后 yield L1ResultEvent；
+    # include_progress=True 时同时 yield ProgressEvent。消费者停止迭代即取消生成
+    user_ready = kwargs.pop("on_sections_ready", None)
+    user_progress = kwargs.pop("on_progress", None)
+    kwargs.setdefault("show_progress", False)
+
+    async def _run(sink: EventSink) -> None:
+        async def _on_sections_ready(order: tuple[int, ...], sections: list[ScriptSection]) -> None:
+            if user_ready is not None:
+                await user_ready(order, sections)
+            await sink.put(L1SectionsEvent(order=list(order), sections=list(sections)))
+
+        def _on_progress(e: ProgressEvent) -> None:
+            if user_progress is not None:
+                user_progress(e)
+            if include_progress:
+                sink.put_nowait(e)
+
+        script = await l1_script_infer(*args, on_progress=_on_progress, on_sections_ready=_on_sections_ready, **kwargs)
+        await sink.put(L1ResultEvent(script=script))
+
+    return stream_events(_run, max_pending=max_pending)
+
+
+def _budget_tolerance(max_duration: int) -> int:
+    # 提示词允许总时长上下浮动 5s；短视频按 5% 收紧
+    return max(1, min(5, max_duration // 20))
+
+
+def _plan_next_stage(
+    *,
+    max_duration: int,
+    current_second: int,
+    finished_stages: int,
+    stage_seconds_hint: int,
+) -> dict:
+    # 根据已完成阶段的平均时长估计剩余阶段数，把剩余时长均摊成本阶段的目标时长
+    remaining = max(1, max_duration - current_second)
+    if finished_stages > 0 and current_second > 0:
+        per_stage = max(1, current_second // finished_stages)
+    else:
+        per_stage = max(1, stage_seconds_hint)
+    remaining_stages = max(1, math.ceil(remaining / per_stage))
+    return {
+        "remaining_seconds": remaining,
+        "target_stage_duration": math.ceil(remaining / remaining_stages),
+        "expected_stages": finished_stages + remaining_stages,
+    }
+
+
+async def _infer_l1_outline(
+    *,
+    content: str,
+    max_duration: int,
+    target_audience: str,
+    platform: str,
+    language: str,
+    images: list[str] | None,
+    compass_prompt: str,
+    max_segment_duration: int,
+    retries: int,
+    emit: Callable[[str, dict], None],
+    variant_hint: str | None = None,
+    parent: L1Outline | None = None,
+    parent_index: int | None = None,
+    current_second: int = 0,
+) -> L1Outline:
+    # parent/parent_index: 细分某一幕时传入分幕大纲，时长校正到该幕时长而不是 max_duration
+    agent = L1OutlineAgent(compass_prompt=compass_prompt)
+    target_duration = parent.segments[parent_index].duration if parent is not None and parent_index is not None else max_duration
+    extra = {"act_index": parent_index} if parent is not None else {}
+    last_err: Exception | None = None
+    for _try in range(retries + 1):
+        try:
+            emit("outline_start", {"try": _try + 1, "max_duration": max_duration, **extra})
+            outline = await agent.write_infer(
+                content=content,
+                max_duration=max_duration,
+                max_segment_duration=max_segment_duration,
+                target_audience=target_audience,
+                platform=platform,
+                language=language,
+                images=images,
+                variant_hint=variant_hint,
+                parent=parent,
+                parent_index=parent_index,
+                current_second=current_second,
+            )
+            if not outline.segments:
+                raise ValueError("outline segments is empty")
+
+            # 模型给的时长之和常有偏差，这里按比例校正到目标时长
+            durations = fit_durations([s.duration for s in outline.segments], target_duration)
+            segments = [s.model_copy(update={"duration": d}) for s, d in zip(outline.segments, durations)]
+            outline = outline.model_copy(update={"segments": segments})
+
+            emit(
+                "outline_done",
+                {
+                    "segments": len(outline.segments),
+                    "durations": durations,
+                    **extra,
+                },
+            )
+            return outline
+        except Exception as e:
+            last_err = e
+            emit("outline_error", {"try": _try + 1, "error": repr(e), **extra})
+
+    if last_err is not None:
+        raise last_err
+    raise RuntimeError("unreachable")
+
+
+async def _expand_l1_outline(
+    outline: L1Outline,
+    *,
+    agent: L1ScreenwriterAgent,
+    content: str,
+    max_duration: int,
+    target_audience: str,
+    platform: str,
+    language: str,
+    images: list[str] | None,
+    parallel_num: int,
+    retries: int,
+    include_stage_result: bool,
+    emit: Callable[[str, dict], None],
+    done: dict[int, L1VideoScript] | None = None,
+    on_checkpoint: Callable[[L1StageCheckpoint], Awaitable[None]] | None = None,
+    variant_hint: str | None = None,
+    semaphore: asyncio.Semaphore | None = None,
+    start_second: int = 0,
+    stage_base: int = 0,
+    act: L1OutlineSegment | None = None,
+    act_index: int | None = None,
+    on_segment_done: Callable[[int, L1VideoScript], Awaitable[None]] | None = None,
+) -> list[L1VideoScript]:
+    # semaphore/start_second/stage_base/act: hierarchical 模式下按幕复用（共享并发额度、起始秒数与断点编码）
+    starts: list[int] = []
+    acc = start_second
+    for seg in outline.segments:
+        starts.append(acc)
+        acc += seg.duration
+
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(max(1, int(parallel_num or 1)))
+    extra = {"act_index": act_index} if act_index is not None else {}
+
+    async def _run_one(index: int) -> L1VideoScript:
+        if done and index in done:
+            if on_segment_done is not None:
+                await on_segment_done(index, done[index])
+            return done[index]
+
+        result = await _expand_one(index)
+        if on_segment_done is not None:
+            await on_segment_done(index, result)
+        return result
+
+    async def _expand_one(index: int) -> L1VideoScript:
+        async with semaphore:
+            stage_index = index + 1
+            last_err: Exception | None = None
+            result: L1VideoScript | None = None
+            for _try in range(retries + 1):
+                try:
+                    emit(
+                        "iter_start",
+                        {
+                            "stage": stage_index,
+                            "segment_index": index,
+                            "try": _try + 1,
+                            "retries_per_iter": retries,
+                            "current_second": starts[index],
+                            "max_duration": max_duration,
+                            **extra,
+                        },
+                    )
+                    result = await agent.write_segment_infer(
+                        content=content,
+                        max_duration=max_duration,
+                        outline=outline,
+                        segment_index=index,
+                        current_second=starts[index],
+                        target_audience=target_audience,
+                        platform=platform,
+                        language=language,
+                        images=images,
+                        variant_hint=variant_hint,
+                        act=act,
+                    )
+                    break
+                except Exception as e:
+                    last_err = e
+                    emit(
+                        "iter_error",
+                        {
+                            "stage": stage_index,
+                            "segment_index": index,
+                            "try": _try + 1,
+                            "error": repr(e),
+                            **extra,
+                        },
+                    )
+
+            if result is None:
+                if last_err is not None:
+                    raise last_err
+                raise RuntimeError("unreachable")
+
+            stage_duration = sum((x.duration for x in (result.body or [])), 0)
+            evt = {
+                "stage": stage_index,
+                "segment_index": index,
+                "need_write_next": False,
+                "title": getattr(result, "title", None),
+                "keywords_count": len(getattr(result, "keywords", []) or []),
+                "body_count": len(getattr(result, "body", []) or []),
+                "stage_duration": stage_duration,
+                "current_second": starts[index] + stage_duration,
+                "max_duration": max_duration,
+                **extra,
+            }
+            if include_stage_result:
+                result_dict = result.model_dump()
+                evt["result"] = result_dict
+                evt["result_json"] = json.dumps(result_dict, ensure_ascii=False)
+            emit("iter_success", evt)
+
+            if on_checkpoint is not None:
+                await on_checkpoint(
+                    L1StageCheckpoint(
+                        kind="segment",
+                        stage=stage_base + stage_index,
+                        result=result.model_dump(),
+                        current_second=starts[index] + stage_duration,
+                    )
+                )
+            return result
+
+    # 某个分段失败时让其余分段跑完（各自已写入断点），再抛出第一个错误
+    results = await asyncio.gather(*[_run_one(i) for i in range(len(outline.segments))], return_exceptions=True)
+    for r in results:
+        if isinstance(r, BaseException):
+            raise r
+    return list(results)
+
+
+async def _expand_l1_acts(
+    acts: L1Outline,
+    *,
+    agent: L1ScreenwriterAgent,
+    content: str,
+    max_duration: int,
+    target_audience: str,
+    platform: str,
+    language: str,
+    images: list[str] | None,
+    compass_prompt: str,
+    chapter_duration: int,
+    parallel_num: int,
+    retries: int,
+    include_stage_result: bool,
+    emit: Callable[[str, dict], None],
+    resume_from: L1Checkpoint | None = None,
+    on_checkpoint: Callable[[L1StageCheckpoint], Awaitable[None]] | None = None,
+    variant_hint: str | None = None,
+    on_chapter_done: Callable[[int, int, L1VideoScript], Awaitable[None]] | None = None,
+) -> list[L1VideoScript]:
+    # 各幕互不等待：某幕的章节大纲一完成就开始扩写其章节；所有 LLM 调用共享同一个并发额度
+    # 提示词只带分幕大纲 + 本幕章节大纲，不带已写正文，单次请求大小与视频总时长无关
+    starts: list[int] = []
+    acc = 0
+    for seg in acts.segments:
+        starts.append(acc)
+        acc += seg.duration
+
+    semaphore = asyncio.Semaphore(max(1, int(parallel_num or 1)))
+
+    async def _run_act(index: int) -> list[L1VideoScript]:
+        chapters = resume_from.acts.get(index) if resume_from else None
+        if chapters is None:
+            async with semaphore:
+                chapters = await _infer_l1_outline(
+                    content=content,
+                    max_duration=max_duration,
+                    target_audience=target_audience,
+                    platform=platform,
+                    language=language,
+                    images=images,
+                    compass_prompt=compass_prompt,
+                    max_segment_duration=chapter_duration,
+                    retries=retries,
+                    emit=emit,
+                    variant_hint=variant_hint,
+                    parent=acts,
+                    parent_index=index,
+                    current_second=starts[index],
+                )
+            if on_checkpoint is not None:
+                await on_checkpoint(
+                    L1StageCheckpoint(
+                        kind="act",
+                        stage=index + 1,
+                        result=chapters.model_dump(),
+                        current_second=starts[index],
+                    )
+                )
+
+        stage_base = (index + 1) * L1_HIER_STAGE_STRIDE
+        done = None
+        if resume_from is not None:
+            done = {
+                k - stage_base: v
+                for k, v in resume_from.segments.items()
+                if stage_base <= k < stage_base + L1_HIER_STAGE_STRIDE
+            }
+
+        results = await _expand_l1_outline(
+            chapters,
+            agent=agent,
+            content=content,
+            max_duration=max_duration,
+            target_audience=target_audience,
+            platform=platform,
+            language=language,
+            images=images,
+            parallel_num=parallel_num,
+            retries=retries,
+            include_stage_result=include_stage_result,
+            emit=emit,
+            done=done,
+            on_checkpoint=on_checkpoint,
+            variant_hint=variant_hint,
+            semaphore=semaphore,
+            start_second=starts[index],
+            stage_base=stage_base,
+            act=acts.segments[index],
+            act_index=index,
+            on_segment_done=(lambda c, r: on_chapter_done(index, c, r)) if on_chapter_done else None,
+        )
+        emit(
+            "act_done",
+            {
+                "act_index": index,
+                "chapters": len(results),
+                "current_second": starts[index] + acts.segments[index].duration,
+                "max_duration": max_duration,
+            },
+        )
+        return results
+
+    results = await asyncio.gather(*[_run_act(i) for i in range(len(acts.segments))], return_exceptions=True)
+    for r in results:
+        if isinstance(r, BaseException):
+            raise r
+    return [chapter for act_results in results for chapter in act_results]
+
+
+def _merge_outlined_stages(outline: L1Outline, stages: list[L1VideoScript], *, max_duration: int) -> L1VideoScript:
+    merged = _merge_l1_stages(stages)
+    return L1VideoScript(
+        title=outline.title or merged.title,
+        total_duration=max_duration,
+        keywords=_dedupe_keywords([*outline.keywords, *merged.keywords]),
+        body=merged.body,
+        need_write_next=False,
+        notes=outline.notes or merged.notes,
+    )
+
+
+def _build_continuation_digest(stages: list[L1VideoScript], *, token_budget: int) -> str:
+    # 续写上下文摘要：标题/关键词/累计时间线 + 上一段原文 + 更早段落的截断摘要。
+    # 超出 token_budget 时依次压缩摘要长度、丢弃最早的摘要与时间线条目。
+    base = stages[0]
+    body = [sec for stage in stages for sec in (stage.body or [])]
+
+    timeline: list[dict] = []
+    acc = 0
+    for i, sec in enumerate(body, 1):
+        acc += sec.duration
+        timeline.append({"index": i, "duration": sec.duration, "end_second": acc})
+
+    last = body[-1] if body else None
+    earlier = body[:-1]
+    digest: dict = {
+        "title": base.title,
+        "total_duration": base.total_duration,
+        "notes": base.notes,
+        "keywords": _dedupe_keywords([kw for stage in stages for kw in stage.keywords]),
+        "written_seconds": acc,
+        "timeline": timeline,
+        "summary": [],
+        "last_section": last.model_dump(exclude={"item_id"}) if last is not None else None,
+    }
+
+    def _dump() -> str:
+        return json.dumps(digest, ensure_ascii=False)
+
+    for limit in (80, 40, 20):
+        digest["summary"] = [
+            {"index": i, "text": _clip_text(sec.section, limit)} for i, sec in enumerate(earlier, 1)
+        ]
+        if estimate_tokens(_dump()) <= token_budget:
+            return _dump()
+
+    digest["notes"] = _clip_text(base.notes, 80)
+    while digest["summary"] and estimate_tokens(_dump()) > token_budget:
+        digest["summary"].pop(0)
+    while len(timeline) > 1 and estimate_tokens(_dump()) > token_budget:
+        timeline.pop(0)
+    return _dump()
+
+
+def _clip_text(text: str, limit: int) -> str:
+    text = (text or "").strip()
+    if len(text) <= limit:
+        return text
+    return text[:limit].rstrip() + "…"
+
+
+def _dedupe_keywords(keywords: list[str]) -> list[str]:
+    seen: set[str] = set()
+    out: list[str] = []
+    for kw in keywords:
+        if kw not in seen:
+            seen.add(kw)
+            out.append(kw)
+    return out
+
+
 async def _split_overlong_sections(
     script: L1VideoScript,
     *,
     max_section_duration: int = 60,
     compass_prompt: str = "",
     on_progress: Callable[[str, dict], None] | None = None,
+    strategy: SplitStrategy = "auto",
 ) -> L1VideoScript:
     def emit(event_type: str, data: dict) -> None:
         if on_progress is not None:
@@ -157,34 +823,72 @@ async def _split_overlong_sections(
 
     splitter = L1SectionSplitAgent(compass_prompt=compass_prompt)
 
-    async def split_one(section: ScriptSection, depth: int = 0) -> list[ScriptSection]:
+    body = list(script.body or [])
+    overlong_total = sum(1 for sec in body if sec.duration > max_section_duration)
+    finished = 0
+
+    # 各超长段落（以及同一段落拆出的子段）并发拆分；LLM 并发由 agent 层的全局 limiter 约束
+    async def split_one(section: ScriptSection, section_index: int, depth: int = 0) -> list[ScriptSection]:
+        nonlocal finished
         if section.duration <= max_section_duration:
             return [section]
 
         if depth >= 6:
             return [section]
 
+        if strategy != "llm":
+            ruled = _rule_split_section(
+                section,
+                max_section_duration=max_section_duration,
+                allow_clauses=(strategy == "rule"),
+            )
+            if ruled is not None:
+                if depth == 0:
+                    finished += 1
+                emit(
+                    "section_split_done",
+                    {
+                        "section_index": section_index,
+                        "original_duration": section.duration,
+                        "parts": len(ruled),
+                        "depth": depth,
+                        "method": "rule",
+                        "finished": finished,
+                        "overlong_total": overlong_total,
+                    },
+                )
+                return ruled
+
         emit(
             "section_split_start",
-            {"duration": section.duration, "max": max_section_duration, "depth": depth},
+            {
+                "section_index": section_index,
+                "duration": section.duration,
+                "max": max_section_duration,
+                "depth": depth,
+            },
         )
         parts = await splitter.write_infer(section=section, max_section_duration=max_section_duration)
-        flattened: list[ScriptSection] = []
-        for p in parts:
-            flattened.extend(await split_one(p, depth + 1))
+        nested = await asyncio.gather(*[split_one(p, section_index, depth + 1) for p in parts])
+        flattened: list[ScriptSection] = [x for sub in nested for x in sub]
+        if depth == 0:
+            finished += 1
         emit(
             "section_split_done",
             {
+                "section_index": section_index,
                 "original_duration": section.duration,
                 "parts": len(flattened),
                 "depth": depth,
+                "method": "llm",
+                "finished": finished,
+                "overlong_total": overlong_total,
             },
         )
         return flattened
 
-    new_body: list[ScriptSection] = []
-    for sec in script.body or []:
-        new_body.extend(await split_one(sec, 0))
+    results = await asyncio.gather(*[split_one(sec, i, 0) for i, sec in enumerate(body)])
+    new_body: list[ScriptSection] = [x for sub in results for x in sub]
 
     new_total = sum(s.duration for s in new_body)
     return L1VideoScript(
@@ -197,6 +901,70 @@ async def _split_overlong_sections(
     )
 
 
+_SENTENCE_BOUNDARY_RE = re.compile(r"(?<=[。！？!?；;…])|\n+|(?<=\.)\s+")
+_CLAUSE_BOUNDARY_RE = re.compile(r"(?<=[，,、：:])")
+
+
+def _split_units(text: str, boundary: re.Pattern) -> list[str]:
+    return [u.strip() for u in boundary.split(text or "") if u and u.strip()]
+
+
+def _rule_split_section(
+    section: ScriptSection,
+    *,
+    max_section_duration: int = 60,
+    allow_clauses: bool = False,
+) -> list[ScriptSection] | None:
+    # 本地规则拆分：时长均分成 <= max_section_duration 的若干块，
+    # 文案按句子（必要时按分句）边界、与时长成比例地分配到各块。
+    # 句子数不足以覆盖块数时返回 None，交由 L1SectionSplitAgent 处理。
+    n = math.ceil(section.duration / max_section_duration)
+    if n < 2:
+        return None
+
+    units = _split_units(section.section, _SENTENCE_BOUNDARY_RE)
+    if len(units) < n and allow_clauses:
+        units = [c for u in units for c in _split_units(u, _CLAUSE_BOUNDARY_RE)]
+    if len(units) < n:
+        return None
+
+    base, extra = divmod(section.duration, n)
+    durations = [base + (1 if i < extra else 0) for i in range(n)]
+
+    # 按累计时长占比确定每块的文案切分点（至少 1 句，且给后面的块留够句子）
+    weights = [len(u) for u in units]
+    total_weight = sum(weights) or 1
+    cuts: list[int] = []
+    start = 0
+    acc_weight = 0
+    acc_duration = 0
+    for i in range(n - 1):
+        acc_duration += durations[i]
+        target = total_weight * acc_duration / section.duration
+        end = start + 1
+        acc_weight += weights[start]
+        while end < len(units) - (n - 1 - i) and acc_weight + weights[end] / 2 < target:
+            acc_weight += weights[end]
+            end += 1
+        cuts.append(end)
+        start = end
+    cuts.append(len(units))
+
+    parts: list[ScriptSection] = []
+    prev = 0
+    sep = "" if re.search(r"[\u4e00-\u9fff]", section.section or "") else " "
+    for i, (cut, d) in enumerate(zip(cuts, durations), 1):
+        parts.append(
+            ScriptSection(
+                section=sep.join(units[prev:cut]),
+                rationale=f"{section.rationale}（按时长拆分：第 {i}/{n} 段，{d}s）",
+                duration=d,
+            )
+        )
+        prev = cut
+    return parts
+
+
 async def l1_apply_section_instruction(
     *,
     script: L1VideoScript,
@@ -204,14 +972,40 @@ async def l1_apply_section_instruction(
     instruction: str,
     compass_prompt: str = "",
 ) -> L1VideoScript:
-    if section_index < 0 or section_index >= len(script.body):
-        raise IndexError(f"section_index out of range: {section_index}")
+    return await l1_apply_section_instructions(
+        script=script,
+        instructions=[(section_index, instruction)],
+        compass_prompt=compass_prompt,
+    )
+
+
+async def l1_apply_section_instructions(
+    *,
+    script: L1VideoScript,
+    instructions: list[tuple[int, str]],
+    compass_prompt: str = "",
+) -> L1VideoScript:
+    # 多个段落的修改指令并发执行（LLM 并发受全局 limiter 约束），一次性合并回原剧本
+    seen: set[int] = set()
+    for section_index, _ in instructions:
+        if section_index < 0 or section_index >= len(script.body):
+            raise IndexError(f"section_index out of range: {section_index}")
+        if section_index in seen:
+            raise ValueError(f"duplicate section_index: {section_index}")
+        seen.add(section_index)
 
     agent = L1SectionAdjustAgent(compass_prompt=compass_prompt)
-    new_section = await agent.write_infer(section=script.body[section_index], instruction=instruction)
+
+    async def _adjust_one(section_index: int, instruction: str) -> tuple[int, ScriptSection]:
+        original = script.body[section_index]
+        new_section = await agent.write_infer(section=original, instruction=instruction)
+        return section_index, new_section.model_copy(update={"item_id": original.item_id})
+
+    pairs = await asyncio.gather(*[_adjust_one(i, ins) for i, ins in instructions])
 
     new_body = list(script.body)
-    new_body[section_index] = new_section
+    for section_index, new_section in pairs:
+        new_body[section_index] = new_section
     new_total = sum(s.duration for s in new_body)
     return L1VideoScript(
         title=script.title,
@@ -223,6 +1017,48 @@ async def l1_apply_section_instruction(
     )
 
 
+def variant_hint_for(index: int, total: int) -> str | None:
+    if total <= 1:
+        return None
+    return (
+        f"这是第 {index + 1}/{total} 个备选方案。请在满足全部约束的前提下，"
+        f"尝试与其他方案不同的切入角度、结构或节奏。"
+    )
+
+
+def score_l1_script(script: L1VideoScript, *, target_duration: int, keywords: list[str] | None = None) -> float:
+    # 本地打分（0~1）：时长贴合度 0.5 + 段落时长均衡度 0.25 + 关键词覆盖度 0.25
+    body = list(script.body or [])
+    if not body:
+        return 0.0
+
+    total = sum(s.duration for s in body)
+    fit = max(0.0, 1.0 - abs(total - target_duration) / max(1, target_duration))
+
+    mean = total / len(body)
+    var = sum((s.duration - mean) ** 2 for s in body) / len(body)
+    balance = 1.0 / (1.0 + math.sqrt(var) / max(1e-6, mean))
+
+    kws = [k for k in (keywords if keywords is not None else script.keywords) if k]
+    if kws:
+        text = script.title + "".join(s.section for s in body)
+        coverage = sum(1 for k in kws if k in text) / len(kws)
+    else:
+        coverage = 0.0
+
+    return round(0.5 * fit + 0.25 * balance + 0.25 * coverage, 4)
+
+
+def rank_l1_variants(scripts: list[L1VideoScript], *, target_duration: int) -> list[tuple[int, float]]:
+    # 关键词取所有方案关键词的并集：覆盖越多共同主题的方案得分越高
+    keywords = _dedupe_keywords([k for s in scripts for k in (s.keywords or [])])
+    scored = [
+        (i, score_l1_script(s, target_duration=target_duration, keywords=keywords))
+        for i, s in enumerate(scripts)
+    ]
+    return sorted(scored, key=lambda x: x[1], reverse=True)
+
+
 def _default_progress_printer() -> Callable[[dict], None]:
     start_ts = time.time()
     state = {"last_len": 0}
@@ -269,6 +1105,19 @@ def _default_progress_printer() -> Callable[[dict], None]:
             )
             return
 
+        if et == "act_done":
+            _write_line(
+                f"[workflow] act ok | act={evt.get('act_index')} | chapters={evt.get('chapters')} | elapsed={elapsed}s"
+            )
+            return
+
+        if et == "outline_done":
+            segments = evt.get("segments")
+            _write_line(
+                f"[workflow] outline ok | segments={segments} | elapsed={elapsed}s"
+            )
+            return
+
         if et == "iter_error":
             stage = evt.get("stage")
             t = evt.get("try")
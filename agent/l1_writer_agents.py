@@ -3,13 +3,18 @@ from jinja2 import Template
 from agent.base import BaseAgent, TModel
 from pydantic import BaseModel, Field
 
-from schema.base import L1VideoScript, ScriptSection
+from schema.base import L1Outline, L1OutlineSegment, L1VideoScript, ScriptSection
 from util.base import render_prompt_template
 from core import settings
 
 PROMPT_TEMPLATE = Template(
     "## 续写参数"
     "- `current_second`（int，当前累计时长）：{{ current_second | default(0) }} "
+    "{% if remaining_seconds is not none %}"
+    "- `remaining_seconds`（int，剩余可分配时长，含本阶段）：{{ remaining_seconds }} 秒 "
+    "- `target_stage_duration`（int，本阶段目标时长）：{{ target_stage_duration }} 秒，本阶段 body.duration 之和应接近该值且不得超过 remaining_seconds；"
+    "若 remaining_seconds <= target_stage_duration，本阶段必须写完全部剩余内容并设置 need_write_next=false "
+    "{% endif %}"
     "## 系统参数 "
     "- `platform`（string，可选，默认 TikTok）：{{ platform | default('TikTok') }} "
     "- `target_audience`（string，可选，默认 18-35岁都市青年）：{{ target_audience | default('18-35岁都市青年') }} "
@@ -19,6 +24,7 @@ PROMPT_TEMPLATE = Template(
     "{{ content }} "
     "## 衔接续写(Previous) "
     "<Previous> {{ previous }} </Previous>"
+    "{% if variant_hint %} ## 备选方案(Variant) {{ variant_hint }}{% endif %}"
 )
 
 class L1ScreenwriterAgent(BaseAgent):
@@ -51,7 +57,7 @@ class L1ScreenwriterAgent(BaseAgent):
             self.prompt = f"{self.prompt}\n\n{compass_prompt}".strip() + "\n"
         super().__init__(settings.L0_AGENT_MODEL, self.prompt)
 
-    async def write_infer(self,content:str,max_duration:int,previous=None,target_audience="青年人",platform="抖音",language="中文",current_second=0,images: list[str] | None = None):
+    async def write_infer(self,content:str,max_duration:int,previous=None,target_audience="青年人",platform="抖音",language="中文",current_second=0,images: list[str] | None = None,remaining_seconds: int | None = None,target_stage_duration: int | None = None,variant_hint: str | None = None):
         user_infer_prompt = PROMPT_TEMPLATE.render(
             platform=platform,
             target_audience=target_audience,
@@ -59,7 +65,10 @@ class L1ScreenwriterAgent(BaseAgent):
             language=language,
             content=content,
             previous=previous,
-            current_second=current_second
+            current_second=current_second,
+            remaining_seconds=remaining_seconds,
+            target_stage_duration=target_stage_duration,
+            variant_hint=variant_hint,
         )
         return await self.infer(
             message=user_infer_prompt,
@@ -68,6 +77,147 @@ class L1ScreenwriterAgent(BaseAgent):
             need_thinking=False
         )
 
+    async def write_segment_infer(
+        self,
+        *,
+        content: str,
+        max_duration: int,
+        outline: L1Outline,
+        segment_index: int,
+        current_second: int = 0,
+        target_audience="青年人",
+        platform="抖音",
+        language="中文",
+        images: list[str] | None = None,
+        variant_hint: str | None = None,
+        act: L1OutlineSegment | None = None,
+    ) -> L1VideoScript:
+        # act: 分层模式下该章节所属的幕（outline 为该幕的章节大纲）
+        segment = outline.segments[segment_index]
+        msg = _SEGMENT_EXPAND_TEMPLATE.render(
+            segment_no=segment_index + 1,
+            segment_total=len(outline.segments),
+            current_second=current_second,
+            segment_duration=segment.duration,
+            platform=platform,
+            target_audience=target_audience,
+            max_duration=max_duration,
+            language=language,
+            content=content,
+            outline_json=outline.model_dump_json(),
+            segment_json=segment.model_dump_json(),
+            act_json=act.model_dump_json() if act is not None else None,
+            variant_hint=variant_hint,
+        )
+        return await self.infer(
+            message=msg,
+            response_model=L1VideoScript,
+            images=images,
+            need_thinking=False,
+        )
+
+
+_SEGMENT_EXPAND_TEMPLATE = Template(
+    "## 分段扩写参数\n"
+    "- 你只负责整体大纲(Outline)中的第 {{ segment_no }}/{{ segment_total }} 段，不要写其他段的内容。\n"
+    "- `current_second`（int，本段起始秒数）：{{ current_second }}\n"
+    "- 本段目标时长：{{ segment_duration }} 秒，body.duration 之和必须等于该值。\n"
+    "- need_write_next 固定为 false；title / notes 沿用整体大纲，total_duration 等于 max_duration。\n\n"
+    "## 系统参数\n"
+    "- `platform`（string，可选，默认 TikTok）：{{ platform | default('TikTok') }}\n"
+    "- `target_audience`（string，可选，默认 18-35岁都市青年）：{{ target_audience | default('18-35岁都市青年') }}\n"
+    "- `max_duration`（int 秒，可选，默认 60）：{{ max_duration | default(60) }} 秒\n"
+    "- `language`（string，可选，默认 中文）：{{ language | default('中文') }}\n\n"
+    "## 故事原文(Content)\n"
+    "{{ content }}\n\n"
+    "{% if act_json %}## 所属幕(Act)\n<Act> {{ act_json }} </Act>\n\n## 本幕章节大纲(Outline)\n{% else %}## 整体大纲(Outline)\n{% endif %}"
+    "<Outline> {{ outline_json }} </Outline>\n\n"
+    "## 本段大纲(Segment)\n"
+    "<Segment> {{ segment_json }} </Segment>\n"
+    "{% if variant_hint %}\n## 备选方案(Variant)\n{{ variant_hint }}\n{% endif %}"
+)
+
+
+_OUTLINE_TEMPLATE = Template(
+    "## 任务\n"
+    "{% if parent_json %}"
+    "整条视频已划分为若干幕(Acts)，你只负责把第 {{ parent_no }}/{{ parent_total }} 幕细分为若干章节，不要写具体脚本正文。\n"
+    "本幕从第 {{ current_second }} 秒开始，时长 {{ target_duration }} 秒。\n"
+    "{% else %}"
+    "先为整条视频规划一个轻量大纲，不要写具体脚本正文。\n"
+    "{% endif %}"
+    "把内容按时间顺序划分为若干连续的段落（segments），每段给出标题、一两句要点（brief）和目标时长（duration）。\n\n"
+    "## 约束\n"
+    "- 输出 JSON，格式为 L1Outline：{\"title\", \"keywords\", \"segments\": [{\"title\", \"brief\", \"duration\"}], \"notes\"}。\n"
+    "{% if parent_json %}"
+    "- segments.duration 之和必须等于本幕时长 {{ target_duration }} 秒。\n"
+    "{% else %}"
+    "- segments.duration 之和必须等于 max_duration。\n"
+    "{% endif %}"
+    "- 每段 duration 为整数秒，1 <= duration <= {{ max_segment_duration }}。\n"
+    "- 各段之间要能独立扩写：brief 需写清本段承接什么、交代什么，避免与相邻段重复。\n"
+    "- title / keywords / notes 是对整条视频的总结。\n\n"
+    "## 系统参数\n"
+    "- `platform`（string，可选，默认 TikTok）：{{ platform | default('TikTok') }}\n"
+    "- `target_audience`（string，可选，默认 18-35岁都市青年）：{{ target_audience | default('18-35岁都市青年') }}\n"
+    "- `max_duration`（int 秒，可选，默认 60）：{{ max_duration | default(60) }} 秒\n"
+    "- `language`（string，可选，默认 中文）：{{ language | default('中文') }}\n\n"
+    "## 故事原文(Content)\n"
+    "{{ content }}\n"
+    "{% if parent_json %}\n## 分幕大纲(Acts)\n<Acts> {{ parent_json }} </Acts>\n{% endif %}"
+    "{% if variant_hint %}\n## 备选方案(Variant)\n{{ variant_hint }}\n{% endif %}"
+)
+
+
+class L1OutlineAgent(BaseAgent):
+    def __init__(self, *, compass_prompt: str = ""):
+        prompt = render_prompt_template(
+            "./tips/level_zero.txt",
+            params={},
+            strict=False,
+        )
+        if compass_prompt:
+            prompt = f"{prompt}\n\n{compass_prompt}".strip() + "\n"
+        super().__init__(settings.L0_AGENT_MODEL, prompt)
+
+    async def write_infer(
+        self,
+        *,
+        content: str,
+        max_duration: int,
+        max_segment_duration: int = 90,
+        target_audience="青年人",
+        platform="抖音",
+        language="中文",
+        images: list[str] | None = None,
+        variant_hint: str | None = None,
+        parent: L1Outline | None = None,
+        parent_index: int | None = None,
+        current_second: int = 0,
+    ) -> L1Outline:
+        # parent/parent_index: 分层模式下把分幕大纲中的某一幕细分为章节（max_duration 仍为整条视频时长）
+        parent_segment = parent.segments[parent_index] if parent is not None and parent_index is not None else None
+        msg = _OUTLINE_TEMPLATE.render(
+            platform=platform,
+            target_audience=target_audience,
+            max_duration=max_duration,
+            language=language,
+            content=content,
+            max_segment_duration=max_segment_duration,
+            variant_hint=variant_hint,
+            parent_json=parent.model_dump_json() if parent_segment is not None else None,
+            parent_no=(parent_index or 0) + 1,
+            parent_total=len(parent.segments) if parent is not None else 0,
+            target_duration=parent_segment.duration if parent_segment is not None else max_duration,
+            current_second=current_second,
+        )
+        return await self.infer(
+            message=msg,
+            response_model=L1Outline,
+            images=images,
+            need_thinking=False,
+        )
+
 
 _SECTION_ADJUST_TEMPLATE = Template(
     "## 任务\n"
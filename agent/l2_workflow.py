@@ -1,12 +1,32 @@
-from agent.l2_writer_agents import L2ScreenwriterAgent
+from agent.concurrency import get_limiter
+from agent.l2_writer_agents import L2ScreenwriterAgent, estimate_l2_output_tokens
 from schema.base import L1VideoScript
+from schema.base import ScriptSection
 from schema.base import Section
+from schema.base import Segment
 from schema.base import ProgressEvent
+from schema.base import ContentBrief
+from schema.base import L2ResultEvent, L2SectionEvent, WorkflowEvent
+from agent.event_stream import EventSink, stream_events
+from schema.repair import fit_section
 from core.compass import CompassSelection, build_compass_prompt
+from core import settings
 
 import json
 import asyncio
-from collections.abc import Callable
+import contextlib
+from collections.abc import AsyncIterator, Awaitable, Callable
+from typing import Any
+
+
+class L2PartialError(RuntimeError):
+    # 部分章节重试耗尽：其余章节已全部完成
+    # sections 与 L1 body 一一对应，失败的位置为 None；errors: chapter_index -> 最后一次异常
+    def __init__(self, sections: list[Section | None], errors: dict[int, BaseException]):
+        self.sections = sections
+        self.errors = errors
+        failed = sorted(errors)
+        super().__init__(f"L2 {len(failed)}/{len(sections)} chapters failed: {failed}; first error: {errors[failed[0]]!r}")
 
 
 async def l2_script_infer(
@@ -22,18 +42,31 @@ async def l2_script_infer(
     on_progress: Callable[[ProgressEvent], None] | None = None,
     include_stage_result: bool = False,
     retries_per_stage: int = 1,
+    done: dict[int, Section] | None = None,
+    on_chapter_done: Callable[[int, Section], Awaitable[None]] | None = None,
+    pack_token_budget: int | None = None,
+    brief: ContentBrief | None = None,
 ) -> list[Section]:
     # L2: 将 L1 的章节（base_script.body）进一步拆成“可拍摄的分镜/镜头脚本”。
     #
     # 重要约定：
     # - L2 输出是 Section；默认 1 个 L1 ScriptSection -> 1 个 L2 Section。
     # - batch_num 用于控制并发（一次最多同时跑多少个 L2 请求），而不是控制 L2 输出数量。
+    #   batch_num 为 None 或 <= 0 时按模型的自适应并发（AIMD）放行，事件里的 concurrency 为当时的并发上限。
+    # - done: 已生成的章节（chapter_index -> Section），直接复用不再请求模型。
+    # - on_chapter_done: 每个章节成功后 await 回调，调用方负责逐章持久化。
+    # - 某些章节重试耗尽时，其余章节照常跑完，最后抛出 L2PartialError（携带已完成的章节）。
+    # - pack_token_budget（默认 settings.L2_PACK_TOKEN_BUDGET，<=0 关闭）：相邻的短章节按预估输出 token
+    #   打包成一次请求（system prompt / content / images 只发一次），结果按章节序号映射回去；
+    #   打包请求重试耗尽或返回数量不符时退回逐章请求。
+    # - brief: 原文的内容简报；提供时各章节 prompt 用简报代替整篇原文（调用方决定小输入是否保留原文）。
     #
     # on_progress 回调事件：
-    # - start: {type, total_chapters, batch_num, images_count}
-    # - stage_start: {type, stage, chapter_index}
-    # - stage_success: {type, stage, chapter_index, stage_duration, result/result_json?}
-    # - stage_error: {type, stage, chapter_index, error, try}
+    # - start: {type, total_chapters, skipped, batch_num, images_count, requests}
+    # - stage_start: {type, stage, chapter_index, pack?}
+    # - stage_success: {type, stage, chapter_index, stage_duration, pack?, result/result_json?}
+    # - stage_error: {type, stage, chapter_index | pack, error, try}
+    # - pack_fallback: {type, pack, error}
 
     compass_prompt = build_compass_prompt(root_dir="./compass", platform=platform, selection=compass)
     agent = L2ScreenwriterAgent(compass_prompt=compass_prompt)
@@ -48,85 +81,573 @@ async def l2_script_infer(
     if not chapters:
         return []
 
-    if batch_num is None or int(batch_num) <= 0:
-        batch_num = 1
-    batch_num = int(batch_num)
+    semaphore, concurrency = _l2_concurrency(agent, batch_num)
+    brief_text = str(brief) if brief is not None else None
+    budget = settings.L2_PACK_TOKEN_BUDGET if pack_token_budget is None else pack_token_budget
+    pending = [i for i in range(len(chapters)) if not (done and i in done)]
+    packs = _pack_l2_chapters(chapters, pending, budget)
 
     _emit(
         "start",
         {
             "total_chapters": len(chapters),
-            "batch_num": batch_num,
+            "skipped": len(done or {}),
+            "batch_num": int(batch_num) if semaphore is not None else None,
+            "adaptive": semaphore is None,
+            "concurrency": concurrency(),
             "images_count": len(images) if images else 0,
+            "requests": len(packs),
+            "brief": brief is not None,
+        },
+    )
+
+    async def _run_one(chapter_index: int) -> Section:
+        async with semaphore or contextlib.nullcontext():
+            section = await _infer_l2_chapter(
+                agent,
+                chapters[chapter_index],
+                content=content,
+                target_audience=target_audience,
+                platform=platform,
+                language=language,
+                images=images,
+                brief=brief_text,
+                retries_per_stage=retries_per_stage,
+                include_stage_result=include_stage_result,
+                emit=_emit,
+                stage_no=chapter_index + 1,
+                event_data={"chapter_index": chapter_index},
+                concurrency=concurrency,
+            )
+        if on_chapter_done is not None:
+            await on_chapter_done(chapter_index, section)
+        return section
+
+    async def _run_pack(pack: list[int]) -> list[Section | BaseException]:
+        if len(pack) == 1:
+            return await asyncio.gather(_run_one(pack[0]), return_exceptions=True)
+        try:
+            async with semaphore or contextlib.nullcontext():
+                sections = await _infer_l2_pack(
+                    agent,
+                    [chapters[i] for i in pack],
+                    content=content,
+                    target_audience=target_audience,
+                    platform=platform,
+                    language=language,
+                    images=images,
+                    brief=brief_text,
+                    retries_per_stage=retries_per_stage,
+                    include_stage_result=include_stage_result,
+                    emit=_emit,
+                    stage_nos=[i + 1 for i in pack],
+                    event_data=[{"chapter_index": i} for i in pack],
+                    concurrency=concurrency,
+                )
+        except Exception as e:
+            _emit("pack_fallback", {"pack": pack, "error": repr(e)})
+            return await asyncio.gather(*[_run_one(i) for i in pack], return_exceptions=True)
+
+        out: list[Section | BaseException] = []
+        for i, section in zip(pack, sections):
+            try:
+                if on_chapter_done is not None:
+                    await on_chapter_done(i, section)
+                out.append(section)
+            except Exception as e:
+                out.append(e)
+        return out
+
+    results: list[Section | BaseException | None] = [None] * len(chapters)
+    for i, section in (done or {}).items():
+        if 0 <= i < len(chapters):
+            results[i] = section
+    for pack, pack_results in zip(packs, await asyncio.gather(*[_run_pack(p) for p in packs])):
+        for i, r in zip(pack, pack_results):
+            results[i] = r
+    return _collect_l2_results(results)
+
+
+def _estimate_l2_tokens(chapter: ScriptSection) -> int:
+    # 章节打包按预估输出 token 装箱（紧凑 schema 下同样的预算能装更多章节）
+    return estimate_l2_output_tokens(chapter.duration, compact=settings.L2_COMPACT_SCHEMA)
+
+
+def _pack_l2_chapters(chapters: list[ScriptSection], pending: list[int], budget: int) -> list[list[int]]:
+    # 只把相邻（中间没有已完成章节）的章节贪心装箱，单个章节超出预算时独占一次请求
+    if budget is None or int(budget) <= 0:
+        return [[i] for i in pending]
+    packs: list[list[int]] = []
+    used = 0
+    for i in pending:
+        cost = _estimate_l2_tokens(chapters[i])
+        if packs and packs[-1][-1] == i - 1 and used + cost <= budget:
+            packs[-1].append(i)
+            used += cost
+        else:
+            packs.append([i])
+            used = cost
+    return packs
+
+
+def l2_script_infer_stream(
+    *args: Any,
+    max_pending: int = 8,
+    include_progress: bool = False,
+    **kwargs: Any,
+) -> AsyncIterator[WorkflowEvent]:
+    # l2_script_infer 的异步迭代版本（参数相同）：每个章节完成即 yield L2SectionEvent（完成顺序），最后 yield L2ResultEvent；
+    # 部分章节失败时先 yield 已完成的章节，再抛出 L2PartialError。消费者停止迭代即取消进行中的请求
+    user_done = kwargs.pop("on_chapter_done", None)
+    user_progress = kwargs.pop("on_progress", None)
+
+    async def _run(sink: EventSink) -> None:
+        async def _on_chapter_done(chapter_index: int, section: Section) -> None:
+            if user_done is not None:
+                await user_done(chapter_index, section)
+            await sink.put(L2SectionEvent(index=chapter_index, order=[chapter_index], section=section))
+
+        def _on_progress(e: ProgressEvent) -> None:
+            if user_progress is not None:
+                user_progress(e)
+            if include_progress:
+                sink.put_nowait(e)
+
+        sections = await l2_script_infer(*args, on_progress=_on_progress, on_chapter_done=_on_chapter_done, **kwargs)
+        await sink.put(L2ResultEvent(sections=sections))
+
+    return stream_events(_run, max_pending=max_pending)
+
+
+def _collect_l2_results(results: list) -> list[Section]:
+    errors = {i: r for i, r in enumerate(results) if isinstance(r, BaseException)}
+    if errors:
+        raise L2PartialError([None if isinstance(r, BaseException) else r for r in results], errors)
+    return list(results)
+
+
+def _l2_concurrency(agent: L2ScreenwriterAgent, batch_num) -> tuple[asyncio.Semaphore | None, Callable[[], int]]:
+    # 固定 batch_num -> 信号量；None/<=0 -> 不另设上限，由该模型的自适应 limiter 决定同时跑几个章节
+    if batch_num is None or int(batch_num) <= 0:
+        limiter = get_limiter(agent.model)
+        return None, lambda: limiter.limit
+    n = int(batch_num)
+    return asyncio.Semaphore(n), lambda: n
+
+
+async def _infer_l2_chapter(
+    agent: L2ScreenwriterAgent,
+    target_chapter: ScriptSection,
+    *,
+    content: str,
+    target_audience: str,
+    platform: str,
+    language: str,
+    images: list[str] | None,
+    brief: str | None = None,
+    retries_per_stage: int,
+    include_stage_result: bool,
+    emit: Callable[[str, dict], None],
+    stage_no: int,
+    event_data: dict,
+    concurrency: Callable[[], int] | None = None,
+) -> Section:
+    # 单个 L1 ScriptSection -> 单个 L2 Section
+    chapter_text = _l2_chapter_text(target_chapter)
+
+    emit(
+        "stage_start",
+        {
+            "stage": stage_no,
+            **event_data,
+            **({"concurrency": concurrency()} if concurrency is not None else {}),
         },
     )
 
-    semaphore = asyncio.Semaphore(batch_num)
+    last_err: Exception | None = None
+    for t in range(retries_per_stage + 1):
+        try:
+            section = await agent.write_infer(
+                content=content,
+                max_duration=target_chapter.duration,
+                chapter=chapter_text,
+                target_audience=target_audience,
+                platform=platform,
+                language=language,
+                images=images,
+                brief=brief,
+            )
+            section = fit_section(section, target_chapter.duration)
+
+            stage_duration = 0
+            for seg in section.sub_sections or []:
+                stage_duration += int(seg.duration_s)
 
-    async def _run_one(chapter_index: int) -> tuple[int, Section]:
-        async with semaphore:
-            # 单个 L1 ScriptSection -> 单个 L2 Section
-            # 只传递目标 ScriptSection 和其时长，移除无关字段
-            target_chapter = chapters[chapter_index]
-            chapter_payload = {
-                "chapter": target_chapter.model_dump(),
+            evt = {
+                "stage": stage_no,
+                **event_data,
+                "stage_duration": stage_duration,
+                **({"concurrency": concurrency()} if concurrency is not None else {}),
             }
-            chapter_text = json.dumps(chapter_payload, ensure_ascii=False)
+            if include_stage_result:
+                d = section.model_dump()
+                evt["result"] = d
+                evt["result_json"] = json.dumps(d, ensure_ascii=False)
+            emit("stage_success", evt)
 
-            stage_no = chapter_index + 1
-            _emit(
-                "stage_start",
+            return section
+        except Exception as e:
+            last_err = e
+            emit(
+                "stage_error",
                 {
                     "stage": stage_no,
-                    "chapter_index": chapter_index,
+                    **event_data,
+                    "try": t + 1,
+                    "error": repr(e),
                 },
             )
 
-            last_err: Exception | None = None
-            for t in range(retries_per_stage + 1):
-                try:
-                    section = await agent.write_infer(
-                        content=content,
-                        max_duration=target_chapter.duration,
-                        chapter=chapter_text,
-                        target_audience=target_audience,
-                        platform=platform,
-                        language=language,
-                        images=images,
-                    )
-
-                    stage_duration = 0
-                    for seg in section.sub_sections or []:
-                        stage_duration += int(seg.duration_s)
-
-                    evt = {
-                        "stage": stage_no,
-                        "chapter_index": chapter_index,
-                        "stage_duration": stage_duration,
-                    }
-                    if include_stage_result:
-                        d = section.model_dump()
-                        evt["result"] = d
-                        evt["result_json"] = json.dumps(d, ensure_ascii=False)
-                    _emit("stage_success", evt)
-
-                    return chapter_index, section
-                except Exception as e:
-                    last_err = e
-                    _emit(
-                        "stage_error",
-                        {
-                            "stage": stage_no,
-                            "chapter_index": chapter_index,
-                            "try": t + 1,
-                            "error": repr(e),
-                        },
-                    )
-
-            if last_err is not None:
-                raise last_err
-            raise RuntimeError("unreachable")
-
-    pairs = await asyncio.gather(*[_run_one(i) for i in range(len(chapters))])
-    pairs.sort(key=lambda x: x[0])
-    return [s for _, s in pairs]
+    if last_err is not None:
+        raise last_err
+    raise RuntimeError("unreachable")
+
+
+def _shot_text(shot: Segment | None) -> str | None:
+    if shot is None:
+        return None
+    return json.dumps(shot.model_dump(exclude={"item_id"}), ensure_ascii=False)
+
+
+async def l2_regenerate_section(
+    *,
+    section: Section,
+    content: str,
+    prev_shot: Segment | None = None,
+    next_shot: Segment | None = None,
+    instruction: str | None = None,
+    target_audience="青年人",
+    platform="抖音",
+    language="中文",
+    images: list[str] | None = None,
+    compass: CompassSelection | None = None,
+    brief: ContentBrief | None = None,
+) -> Section:
+    # 单段重写：只发送该段落和前后相邻镜头；总时长与段落 item_id 保持不变，镜头 item_id 由调用方重新分配
+    # 提示词里不带任何 item_id，避免模型把旧镜头的 id 抄到新镜头上
+    compass_prompt = build_compass_prompt(root_dir="./compass", platform=platform, selection=compass)
+    agent = L2ScreenwriterAgent(compass_prompt=compass_prompt)
+    new_section = await agent.regenerate_infer(
+        content=content,
+        brief=str(brief) if brief is not None else None,
+        section=json.dumps(
+            section.model_dump(exclude={"item_id": True, "sub_sections": {"__all__": {"item_id"}}}),
+            ensure_ascii=False,
+        ),
+        duration=int(section.duration),
+        prev_shot=_shot_text(prev_shot),
+        next_shot=_shot_text(next_shot),
+        instruction=instruction,
+        target_audience=target_audience,
+        platform=platform,
+        language=language,
+        images=images,
+    )
+    new_section = fit_section(new_section, section.duration)
+    shots = [s.model_copy(update={"item_id": None}) for s in new_section.sub_sections]
+    return new_section.model_copy(update={"item_id": section.item_id, "sub_sections": shots})
+
+
+async def l2_regenerate_shot(
+    *,
+    section: Section,
+    shot_index: int,
+    content: str,
+    prev_shot: Segment | None = None,
+    next_shot: Segment | None = None,
+    instruction: str | None = None,
+    target_audience="青年人",
+    platform="抖音",
+    language="中文",
+    images: list[str] | None = None,
+    compass: CompassSelection | None = None,
+    brief: ContentBrief | None = None,
+) -> Section:
+    # 单镜头重写：时长与 item_id 不变，段落内其余镜头原样保留
+    # prev_shot / next_shot 缺省取段落内相邻镜头（段首/段尾由调用方传入相邻段落的镜头）
+    shots = list(section.sub_sections)
+    if shot_index < 0 or shot_index >= len(shots):
+        raise IndexError(f"shot_index out of range: {shot_index}")
+    old = shots[shot_index]
+    if shot_index > 0:
+        prev_shot = shots[shot_index - 1]
+    if shot_index < len(shots) - 1:
+        next_shot = shots[shot_index + 1]
+
+    compass_prompt = build_compass_prompt(root_dir="./compass", platform=platform, selection=compass)
+    agent = L2ScreenwriterAgent(compass_prompt=compass_prompt)
+    new_shot = await agent.regenerate_infer(
+        content=content,
+        brief=str(brief) if brief is not None else None,
+        section=json.dumps(section.model_dump(exclude={"item_id"}), ensure_ascii=False),
+        shot=_shot_text(old),
+        duration=int(old.duration_s),
+        prev_shot=_shot_text(prev_shot),
+        next_shot=_shot_text(next_shot),
+        instruction=instruction,
+        target_audience=target_audience,
+        platform=platform,
+        language=language,
+        images=images,
+    )
+    shots[shot_index] = new_shot.model_copy(update={"item_id": old.item_id, "duration_s": old.duration_s})
+    return section.model_copy(update={"sub_sections": shots})
+
+
+def _l2_chapter_text(chapter: ScriptSection) -> str:
+    # 只传递目标 ScriptSection 和其时长，移除无关字段
+    return json.dumps({"chapter": chapter.model_dump()}, ensure_ascii=False)
+
+
+async def _infer_l2_pack(
+    agent: L2ScreenwriterAgent,
+    pack: list[ScriptSection],
+    *,
+    content: str,
+    target_audience: str,
+    platform: str,
+    language: str,
+    images: list[str] | None,
+    brief: str | None = None,
+    retries_per_stage: int,
+    include_stage_result: bool,
+    emit: Callable[[str, dict], None],
+    stage_nos: list[int],
+    event_data: list[dict],
+    concurrency: Callable[[], int] | None = None,
+) -> list[Section]:
+    # 多个相邻 L1 ScriptSection -> 一次请求 -> 按顺序对应的 L2 Section 列表
+    pack_ids = [d.get("chapter_index", d.get("order")) for d in event_data]
+    extra = {"concurrency": concurrency()} if concurrency is not None else {}
+    for stage_no, data in zip(stage_nos, event_data):
+        emit("stage_start", {"stage": stage_no, **data, "pack": pack_ids, **extra})
+
+    last_err: Exception | None = None
+    for t in range(retries_per_stage + 1):
+        try:
+            sections = await agent.write_pack_infer(
+                content=content,
+                chapters=[(_l2_chapter_text(c), int(c.duration)) for c in pack],
+                target_audience=target_audience,
+                platform=platform,
+                language=language,
+                images=images,
+                brief=brief,
+            )
+            if len(sections) != len(pack):
+                raise ValueError(f"packed L2 returned {len(sections)} sections for {len(pack)} chapters")
+            sections = [fit_section(sec, c.duration) for sec, c in zip(sections, pack)]
+
+            extra = {"concurrency": concurrency()} if concurrency is not None else {}
+            for stage_no, data, section in zip(stage_nos, event_data, sections):
+                evt = {
+                    "stage": stage_no,
+                    **data,
+                    "pack": pack_ids,
+                    "stage_duration": sum(int(seg.duration_s) for seg in section.sub_sections or []),
+                    **extra,
+                }
+                if include_stage_result:
+                    d = section.model_dump()
+                    evt["result"] = d
+                    evt["result_json"] = json.dumps(d, ensure_ascii=False)
+                emit("stage_success", evt)
+            return sections
+        except Exception as e:
+            last_err = e
+            emit("stage_error", {"stage": stage_nos[0], "pack": pack_ids, "try": t + 1, "error": repr(e)})
+
+    if last_err is not None:
+        raise last_err
+    raise RuntimeError("unreachable")
+
+
+class L2Pipeline:
+    """
+    L1 -> L2 流水线：L1 每确定一批段落（已完成超长拆分）就 submit，对应的 L2 立即开始扩写；
+    results() 按 L1 最终 body 的顺序返回，与 L1 全部完成后再调用 l2_script_infer 的结果一致。
+
+    submit 可直接作为 l1_script_infer(on_sections_ready=...) 的回调。
+    on_chapter_done(order, section): 每个章节完成后 await 回调，order 为 submit 时的排序键 (*order, i)。
+    """
+
+    def __init__(
+        self,
+        content: str,
+        batch_num=1,
+        target_audience="青年人",
+        platform="抖音",
+        language="中文",
+        images: list[str] | None = None,
+        compass: CompassSelection | None = None,
+        *,
+        on_progress: Callable[[ProgressEvent], None] | None = None,
+        include_stage_result: bool = False,
+        retries_per_stage: int = 1,
+        pack_token_budget: int | None = None,
+        brief: ContentBrief | None = None,
+        on_chapter_done: Callable[[tuple[int, ...], Section], Awaitable[None]] | None = None,
+    ) -> None:
+        compass_prompt = build_compass_prompt(root_dir="./compass", platform=platform, selection=compass)
+        self._agent = L2ScreenwriterAgent(compass_prompt=compass_prompt)
+        self._content = content
+        self._target_audience = target_audience
+        self._platform = platform
+        self._language = language
+        self._images = images
+        self._brief = str(brief) if brief is not None else None
+        self._on_progress = on_progress
+        self._include_stage_result = include_stage_result
+        self._retries_per_stage = retries_per_stage
+        self._pack_budget = settings.L2_PACK_TOKEN_BUDGET if pack_token_budget is None else pack_token_budget
+        self._on_chapter_done = on_chapter_done
+
+        self._semaphore, self._concurrency = _l2_concurrency(self._agent, batch_num)
+        self._tasks: dict[tuple[int, ...], asyncio.Future[Section]] = {}
+        self._packs: list[asyncio.Task[list[Section | BaseException]]] = []
+
+        self._emit(
+            "start",
+            {
+                "pipeline": True,
+                "batch_num": int(batch_num) if self._semaphore is not None else None,
+                "adaptive": self._semaphore is None,
+                "concurrency": self._concurrency(),
+                "images_count": len(images) if images else 0,
+                "brief": brief is not None,
+            },
+        )
+
+    def _emit(self, event_type: str, data: dict) -> None:
+        if self._on_progress is None:
+            return
+        self._on_progress(ProgressEvent(phase="l2", type=event_type, data=data))
+
+    async def submit(
+        self,
+        order: tuple[int, ...],
+        sections: list[ScriptSection],
+        *,
+        done: dict[int, Section] | None = None,
+    ) -> None:
+        # 同一批段落内相邻的短章节按 token 预算打包成一次请求；
+        # done: 本批中已有结果的章节（批内下标 -> Section，如重启续跑时已落盘的章节），直接视为完成，不回调 on_chapter_done
+        for i, section in (done or {}).items():
+            key = (*order, i)
+            if key not in self._tasks:
+                self._tasks[key] = asyncio.get_running_loop().create_future()
+                self._tasks[key].set_result(section)
+        pending = [i for i in range(len(sections)) if (*order, i) not in self._tasks]
+        for pack in _pack_l2_chapters(sections, pending, self._pack_budget):
+            if len(pack) == 1:
+                key = (*order, pack[0])
+                self._tasks[key] = asyncio.create_task(
+                    self._notify(key, self._run_one(key, sections[pack[0]], len(self._tasks) + 1))
+                )
+                continue
+            keys = [(*order, i) for i in pack]
+            stage_nos = [len(self._tasks) + j + 1 for j in range(len(pack))]
+            pack_task = asyncio.create_task(self._run_pack(keys, [sections[i] for i in pack], stage_nos))
+            self._packs.append(pack_task)
+            for j, key in enumerate(keys):
+                self._tasks[key] = asyncio.create_task(self._notify(key, self._pick(pack_task, j)))
+
+    async def _notify(self, key: tuple[int, ...], coro: Awaitable[Section]) -> Section:
+        section = await coro
+        if self._on_chapter_done is not None:
+            await self._on_chapter_done(key, section)
+        return section
+
+    async def _run_pack(
+        self,
+        keys: list[tuple[int, ...]],
+        chapters: list[ScriptSection],
+        stage_nos: list[int],
+    ) -> list[Section | BaseException]:
+        try:
+            async with self._semaphore or contextlib.nullcontext():
+                return await _infer_l2_pack(
+                    self._agent,
+                    chapters,
+                    content=self._content,
+                    target_audience=self._target_audience,
+                    platform=self._platform,
+                    language=self._language,
+                    images=self._images,
+                    brief=self._brief,
+                    retries_per_stage=self._retries_per_stage,
+                    include_stage_result=self._include_stage_result,
+                    emit=self._emit,
+                    stage_nos=stage_nos,
+                    event_data=[{"order": list(k)} for k in keys],
+                    concurrency=self._concurrency,
+                )
+        except Exception as e:
+            self._emit("pack_fallback", {"pack": [list(k) for k in keys], "error": repr(e)})
+            return await asyncio.gather(
+                *[self._run_one(k, c, n) for k, c, n in zip(keys, chapters, stage_nos)],
+                return_exceptions=True,
+            )
+
+    @staticmethod
+    async def _pick(pack_task: asyncio.Task[list[Section | BaseException]], j: int) -> Section:
+        r = (await asyncio.shield(pack_task))[j]
+        if isinstance(r, BaseException):
+            raise r
+        return r
+
+    async def _run_one(self, key: tuple[int, ...], chapter: ScriptSection, stage_no: int) -> Section:
+        async with self._semaphore or contextlib.nullcontext():
+            return await _infer_l2_chapter(
+                self._agent,
+                chapter,
+                content=self._content,
+                target_audience=self._target_audience,
+                platform=self._platform,
+                language=self._language,
+                images=self._images,
+                brief=self._brief,
+                retries_per_stage=self._retries_per_stage,
+                include_stage_result=self._include_stage_result,
+                emit=self._emit,
+                stage_no=stage_no,
+                event_data={"order": list(key)},
+                concurrency=self._concurrency,
+            )
+
+    async def results(self) -> list[Section]:
+        # L1 已结束、不会再有新的 submit 时调用
+        keys = sorted(self._tasks)
+        try:
+            results = await asyncio.gather(*[self._tasks[k] for k in keys], return_exceptions=True)
+        except BaseException:
+            self.cancel()
+            raise
+        return _collect_l2_results(results)
+
+    def chapter_index(self) -> dict[tuple[int, ...], int]:
+        # 排序键 -> 章节序号（L1 最终 body 中的位置）；L1 结束、不会再有新的 submit 后才确定
+        return {k: i for i, k in enumerate(sorted(self._tasks))}
+
+    def partial_results(self) -> list[Section | None]:
+        # 按 L1 最终顺序返回已完成的章节（未完成 / 失败 / 已取消的为 None），用于取消后保留部分结果
+        out: list[Section | None] = []
+        for k in sorted(self._tasks):
+            t = self._tasks[k]
+            out.append(t.result() if t.done() and not t.cancelled() and t.exception() is None else None)
+        return out
+
+    def cancel(self) -> None:
+        for task in [*self._packs, *self._tasks.values()]:
+            if not task.done():
+                task.cancel()
@@ -1,7 +1,8 @@
 from typing import AsyncIterator
 from jinja2 import Template
 from agent.base import BaseAgent, TModel
-from schema.base import Section
+from schema.base import L2SectionPack, Section, Segment
+from schema.compact import COMPACT_HINT, CompactSection, CompactSectionPack
 from util.base import render_prompt_template
 from core import settings
 
@@ -11,15 +12,87 @@ PROMPT_TEMPLATE = Template(
         "- `target_audience`（string，可选，默认 18-35岁都市青年）：{{ target_audience | default('18-35岁都市青年') }} "
         "- `max_duration`（int 秒，可选，默认 60）：{{ max_duration | default(60) }} 秒 "
         "- `language`（string，可选，默认 中文）：{{ language | default('中文') }} "
+    "{% if brief %}"
+    "## 内容简报(Brief) "
+        "{{ brief }} "
+    "{% else %}"
     "## 故事原文(Content) "
         "{{ content }} "
+    "{% endif %}"
     "## 本节内容 "
         "<Chapter> {{ chapter }} </Chapter>"
 )
 
+PACK_PROMPT_TEMPLATE = Template(
+    "## 系统参数 "
+        "- `platform`（string，可选，默认 TikTok）：{{ platform | default('TikTok') }} "
+        "- `target_audience`（string，可选，默认 18-35岁都市青年）：{{ target_audience | default('18-35岁都市青年') }} "
+        "- `language`（string，可选，默认 中文）：{{ language | default('中文') }} "
+    "{% if brief %}"
+    "## 内容简报(Brief) "
+        "{{ brief }} "
+    "{% else %}"
+    "## 故事原文(Content) "
+        "{{ content }} "
+    "{% endif %}"
+    "## 本次要扩写的章节（共 {{ chapters | length }} 个） "
+        "{% for c in chapters %}"
+        "<Chapter index=\"{{ loop.index }}\" max_duration=\"{{ c.duration }}\"> {{ c.text }} </Chapter> "
+        "{% endfor %}"
+    "## 输出要求 "
+        "sections 必须恰好包含 {{ chapters | length }} 个段落，按 index 顺序与上面的章节一一对应；"
+        "每个段落各自独立扩写，其 duration 等于对应章节的 max_duration。"
+)
+
+REGENERATE_PROMPT_TEMPLATE = Template(
+    "## 系统参数 "
+        "- `platform`（string，可选，默认 TikTok）：{{ platform | default('TikTok') }} "
+        "- `target_audience`（string，可选，默认 18-35岁都市青年）：{{ target_audience | default('18-35岁都市青年') }} "
+        "- `language`（string，可选，默认 中文）：{{ language | default('中文') }} "
+    "{% if brief %}"
+    "## 内容简报(Brief) "
+        "{{ brief }} "
+    "{% else %}"
+    "## 故事原文(Content) "
+        "{{ content }} "
+    "{% endif %}"
+    "## 所在段落（当前版本） "
+        "<Section> {{ section }} </Section> "
+    "{% if shot %}"
+    "## 需要重写的镜头 "
+        "<Shot> {{ shot }} </Shot> "
+    "{% endif %}"
+    "## 前后衔接 "
+        "- 上一个镜头：{{ prev_shot or '无（开篇）' }} "
+        "- 下一个镜头：{{ next_shot or '无（结尾）' }} "
+    "## 修改要求 "
+        "{{ instruction or '保持叙事目标不变，重新创作，提升可拍性与节奏。' }} "
+    "## 输出要求 "
+    "{% if shot %}"
+        "只输出重写后的这一个镜头，duration_s 必须为 {{ duration }}，与前后镜头自然衔接。"
+    "{% else %}"
+        "输出重写后的整个段落，section 与 rationale 可以微调，duration 必须为 {{ duration }}，且等于 sub_sections.duration_s 之和；"
+        "首尾镜头与前后衔接的镜头自然过渡。"
+    "{% endif %}"
+)
+
+# L2 输出 token 预估：每个章节的固定开销 + 按时长线性增长（镜头数大致与时长成正比）；
+# 紧凑 schema 的输出约为完整 Section 的 COMPACT_OUTPUT_RATIO（见 bench_compact_schema.py）
+L2_TOKENS_PER_CHAPTER = 300
+L2_TOKENS_PER_SECOND = 80
+COMPACT_OUTPUT_RATIO = 0.6
+
+
+def estimate_l2_output_tokens(duration: int, *, chapters: int = 1, compact: bool = False) -> int:
+    tokens = L2_TOKENS_PER_CHAPTER * chapters + L2_TOKENS_PER_SECOND * int(duration)
+    return int(tokens * COMPACT_OUTPUT_RATIO) if compact else tokens
+
+
 class L2ScreenwriterAgent(BaseAgent):
 
-    def __init__(self, *, compass_prompt: str = ""):
+    def __init__(self, *, compass_prompt: str = "", compact: bool | None = None):
+        # compact: 使用紧凑输出 schema（默认 settings.L2_COMPACT_SCHEMA），结果在本地展开为 Section
+        self.compact = settings.L2_COMPACT_SCHEMA if compact is None else compact
         # Render prompt template (empty path for now, can be updated later)
         self.prompt = render_prompt_template(
             "./tips/level_one_source.txt",
@@ -30,7 +103,8 @@ class L2ScreenwriterAgent(BaseAgent):
             self.prompt = f"{self.prompt}\n\n{compass_prompt}".strip() + "\n"
         super().__init__(settings.L1_AGENT_MODEL, self.prompt)
 
-    async def write_infer(self,content:str,max_duration:int,chapter:str=None,target_audience="青年人",platform="抖音",language="中文",images: list[str] | None = None):
+    async def write_infer(self,content:str,max_duration:int,chapter:str=None,target_audience="青年人",platform="抖音",language="中文",images: list[str] | None = None,brief: str | None = None):
+        # brief 非空时用内容简报代替整篇原文
         if chapter is None or len(chapter.strip())==0:
             raise Exception("sorry the chapter is none")
 
@@ -40,11 +114,80 @@ class L2ScreenwriterAgent(BaseAgent):
             max_duration=max_duration,
             language=language,
             content=content,
+            brief=brief,
             chapter=chapter
         )
+        if self.compact:
+            compact = await self.infer(
+                message=f"{user_infer_prompt} {COMPACT_HINT}",
+                response_model=CompactSection,
+                images=images,
+                need_thinking=False,
+                max_tokens=self._max_tokens(max_duration),
+            )
+            return compact.to_section()
         return await self.infer(
             message=user_infer_prompt,
             response_model=Section,
             images=images,
             need_thinking=False
         )
+
+    def _max_tokens(self, duration: int, chapters: int = 1) -> int | None:
+        # 只在紧凑模式下按章节时长给出 max_tokens（预估值 × L2_MAX_TOKENS_FACTOR，<=0 不限制）
+        if settings.L2_MAX_TOKENS_FACTOR <= 0:
+            return None
+        est = estimate_l2_output_tokens(duration, chapters=chapters, compact=True)
+        return max(1024, int(est * settings.L2_MAX_TOKENS_FACTOR))
+
+    async def write_pack_infer(self,content:str,chapters:list[tuple[str,int]],target_audience="青年人",platform="抖音",language="中文",images: list[str] | None = None,brief: str | None = None) -> list[Section]:
+        # chapters: [(chapter_json, max_duration), ...]；system prompt / content / images 只发送一次
+        if not chapters:
+            raise Exception("sorry the chapters is empty")
+
+        user_infer_prompt = PACK_PROMPT_TEMPLATE.render(
+            platform=platform,
+            target_audience=target_audience,
+            language=language,
+            content=content,
+            brief=brief,
+            chapters=[{"text": text, "duration": duration} for text, duration in chapters],
+        )
+        if self.compact:
+            compact_pack = await self.infer(
+                message=f"{user_infer_prompt} {COMPACT_HINT}段落列表字段为 xs（对应上文的 sections）。",
+                response_model=CompactSectionPack,
+                images=images,
+                need_thinking=False,
+                max_tokens=self._max_tokens(sum(d for _, d in chapters), chapters=len(chapters)),
+            )
+            return [x.to_section() for x in compact_pack.xs]
+        pack = await self.infer(
+            message=user_infer_prompt,
+            response_model=L2SectionPack,
+            images=images,
+            need_thinking=False
+        )
+        return list(pack.sections)
+
+    async def regenerate_infer(self,content:str,section:str,duration:int,shot:str | None = None,prev_shot:str | None = None,next_shot:str | None = None,instruction:str | None = None,target_audience="青年人",platform="抖音",language="中文",images: list[str] | None = None,brief: str | None = None) -> Section | Segment:
+        # shot 为空时重写整个段落（返回 Section），否则只重写该镜头（返回 Segment）
+        user_infer_prompt = REGENERATE_PROMPT_TEMPLATE.render(
+            platform=platform,
+            target_audience=target_audience,
+            language=language,
+            content=content,
+            brief=brief,
+            section=section,
+            shot=shot,
+            prev_shot=prev_shot,
+            next_shot=next_shot,
+            instruction=instruction,
+            duration=duration,
+        )
+        return await self.infer(
+            message=user_infer_prompt,
+            response_model=Segment if shot else Section,
+            images=images,
+            need_thinking=False
+        )
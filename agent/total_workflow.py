@@ -1,9 +1,21 @@
-from collections.abc import Callable
+from collections.abc import AsyncIterator, Awaitable, Callable
+from typing import Any
 
-from agent.l1_workflow import l1_script_infer
-from agent.l2_workflow import l2_script_infer
+from agent.event_stream import EventSink, stream_events
+from agent.l1_workflow import L1Mode, SplitStrategy, l1_script_infer
+from agent.l2_workflow import L2Pipeline, l2_script_infer
 from agent.compass_agent import CompassChoicesAgent
-from schema.base import TotalVideoScript, ProgressEvent
+from schema.base import (
+    CompassEvent,
+    L1SectionsEvent,
+    L2SectionEvent,
+    ProgressEvent,
+    ScriptSection,
+    Section,
+    TotalResultEvent,
+    TotalVideoScript,
+    WorkflowEvent,
+)
 from core.compass import CompassSelection
 
 
@@ -18,14 +30,22 @@ async def total_script_infer(
     *,
     l1_max_iters: int = 10,
     l1_retries_per_iter: int = 2,
+    l1_mode: L1Mode = "serial",
+    l1_parallel_num: int = 3,
+    l1_split_strategy: SplitStrategy = "auto",
     l2_batch_num: int = 2,
     l2_retries_per_stage: int = 1,
     on_progress: Callable[[ProgressEvent], None] | None = None,
+    pipeline: bool = False,
+    on_event: Callable[[WorkflowEvent], Awaitable[None]] | None = None,
 ) -> TotalVideoScript:
     # total workflow:
     # 1) L1: 生成宏观章节（L1VideoScript）
     # 2) L2: 将每个章节扩写成可拍摄分镜（Section 列表）
     # 3) 返回统一结构：{title, keywords, sections}
+    #
+    # pipeline=True: L1 每个阶段的段落拆分完成后立即开始对应的 L2，不必等整个 L1 结束；结果与分阶段执行一致
+    # on_event: 结果事件回调（await，可做背压）：CompassEvent / L1SectionsEvent / L2SectionEvent / TotalResultEvent
 
     def progress(evt: ProgressEvent) -> None:
         if on_progress is None:
@@ -46,36 +66,79 @@ async def total_script_infer(
                     },
                 )
             )
+        if on_event is not None:
+            await on_event(CompassEvent(director=inferred.director, style=inferred.style))
 
-    l1 = await l1_script_infer(
-        content=content,
-        max_duration=max_duration,
-        target_audience=target_audience,
-        platform=platform,
-        language=language,
-        images=images,
-        compass=compass,
-        max_iters=l1_max_iters,
-        retries_per_iter=l1_retries_per_iter,
-        on_progress=(lambda e: progress(ProgressEvent(phase="l1", type=e.type, data=e.data))) if on_progress else None,
-        show_progress=False,
-        include_stage_result=False,
-    )
+    async def _on_l2_section(order: tuple[int, ...], section: Section, index: int | None) -> None:
+        if on_event is not None:
+            await on_event(L2SectionEvent(index=index, order=list(order), section=section))
 
-    sections = await l2_script_infer(
-        base_script=l1,
-        content=content,
-        batch_num=l2_batch_num,
-        target_audience=target_audience,
-        platform=platform,
-        language=language,
-        images=images,
-        compass=compass,
-        on_progress=(lambda e: progress(ProgressEvent(phase="l2", type=e.type, data=e.data))) if on_progress else None,
-        include_stage_result=False,
-        retries_per_stage=l2_retries_per_stage,
+    l2_pipeline = (
+        L2Pipeline(
+            content=content,
+            batch_num=l2_batch_num,
+            target_audience=target_audience,
+            platform=platform,
+            language=language,
+            images=images,
+            compass=compass,
+            on_progress=(lambda e: progress(ProgressEvent(phase="l2", type=e.type, data=e.data))) if on_progress else None,
+            include_stage_result=False,
+            retries_per_stage=l2_retries_per_stage,
+            on_chapter_done=(lambda order, sec: _on_l2_section(order, sec, None)) if on_event else None,
+        )
+        if pipeline
+        else None
     )
 
+    async def _on_sections_ready(order: tuple[int, ...], sections: list[ScriptSection]) -> None:
+        if l2_pipeline is not None:
+            await l2_pipeline.submit(order, sections)
+        if on_event is not None:
+            await on_event(L1SectionsEvent(order=list(order), sections=list(sections)))
+
+    try:
+        l1 = await l1_script_infer(
+            content=content,
+            max_duration=max_duration,
+            target_audience=target_audience,
+            platform=platform,
+            language=language,
+            images=images,
+            compass=compass,
+            max_iters=l1_max_iters,
+            retries_per_iter=l1_retries_per_iter,
+            on_progress=(lambda e: progress(ProgressEvent(phase="l1", type=e.type, data=e.data))) if on_progress else None,
+            show_progress=False,
+            include_stage_result=False,
+            mode=l1_mode,
+            parallel_num=l1_parallel_num,
+            split_strategy=l1_split_strategy,
+            on_sections_ready=_on_sections_ready if (l2_pipeline is not None or on_event is not None) else None,
+        )
+    except BaseException:
+        if l2_pipeline is not None:
+            l2_pipeline.cancel()
+        raise
+
+    if l2_pipeline is not None:
+        sections = await l2_pipeline.results()
+    else:
+        sections = await l2_script_infer(
+            base_script=l1,
+            content=content,
+            batch_num=l2_batch_num,
+            target_audience=target_audience,
+            platform=platform,
+            language=language,
+            images=images,
+            compass=compass,
+            on_progress=(lambda e: progress(ProgressEvent(phase="l2", type=e.type, data=e.data))) if on_progress else None,
+            include_stage_result=False,
+            retries_per_stage=l2_retries_per_stage,
+            on_chapter_done=(lambda i, sec: _on_l2_section((i,), sec, i)) if on_event else None,
+        )
+
     # keywords dedupe (preserve order)
     seen = set()
     keywords = []
@@ -84,10 +147,45 @@ async def total_script_infer(
             seen.add(kw)
             keywords.append(kw)
 
-    return TotalVideoScript(
+    result = TotalVideoScript(
         title=l1.title,
         total_duration=l1.total_duration,
         keywords=keywords,
         sections=sections,
         notes=l1.notes,
     )
+    if on_event is not None:
+        await on_event(TotalResultEvent(script=result))
+    return result
+
+
+def total_script_infer_stream(
+    *args: Any,
+    max_pending: int = 8,
+    include_progress: bool = False,
+    **kwargs: Any,
+) -> AsyncIterator[WorkflowEvent]:
+    """
+    total_script_infer 的异步迭代版本（参数相同），依次 yield：
+    CompassEvent（需要推断时）-> L1SectionsEvent（每个 L1 阶段）-> L2SectionEvent（每个 L2 段落，完成顺序）-> TotalResultEvent
+
+    - 消费者处理不过来时，未取走的结果事件最多积压 max_pending 个，之后工作流在回调处等待（背压）
+    - include_progress=True 时同时 yield ProgressEvent（不参与背压）
+    - 消费者停止迭代（break 后关闭生成器，推荐 contextlib.aclosing）即取消工作流，进行中的 LLM 请求随之取消
+
+        async with contextlib.aclosing(total_script_infer_stream(content, 60, pipeline=True)) as events:
+            async for evt in events:
+                ...
+    """
+    user_progress = kwargs.pop("on_progress", None)
+
+    async def _run(sink: EventSink) -> None:
+        def _on_progress(e: ProgressEvent) -> None:
+            if user_progress is not None:
+                user_progress(e)
+            if include_progress:
+                sink.put_nowait(e)
+
+        await total_script_infer(*args, on_progress=_on_progress, on_event=sink.put, **kwargs)
+
+    return stream_events(_run, max_pending=max_pending)
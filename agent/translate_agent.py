@@ -0,0 +1,41 @@
+from jinja2 import Template
+from pydantic import BaseModel, Field
+
+from agent.base import BaseAgent
+from core import settings
+
+TRANSLATE_PROMPT_TEMPLATE = Template(
+    "## 任务 "
+        "把下面编号的每条文本翻译为：{{ language }}。\n"
+    "## 翻译要求 "
+        "- 恰好输出 {{ count }} 条译文，顺序与编号一致，译文中不要带 [n] 编号 "
+        "- 数字、品牌/产品名称、单位和表情符号保持原样 "
+        "- 译文要自然、可拍，适合短视频脚本；不增加、不遗漏信息 "
+        "- 已经是目标语言的文本原样返回\n"
+    "## 待翻译文本\n"
+        "{{ numbered }}"
+)
+
+
+class L2TranslateAgent(BaseAgent):
+
+    def __init__(self):
+        super().__init__(
+            settings.L0_AGENT_MODEL,
+            "你是专业的字幕与剧本译者，翻译忠实、简洁。Output ONLY valid JSON.",
+        )
+
+    class _TranslationResponse(BaseModel):
+        translations: list[str] = Field(default_factory=list)
+
+    async def translate_infer(self, *, texts: list[str], language: str) -> list[str]:
+        # texts 与返回值一一对应；调用方负责校验数量
+        numbered = "\n".join(f"[{i + 1}] {t}" for i, t in enumerate(texts))
+        msg = TRANSLATE_PROMPT_TEMPLATE.render(language=language, count=len(texts), numbered=numbered)
+
+        resp = await self.infer(
+            message=msg,
+            response_model=self._TranslationResponse,
+            need_thinking=False,
+        )
+        return list(resp.translations)
@@ -0,0 +1,105 @@
+# bench_compact_schema.py
+# 对比 L2 完整 Section schema 与紧凑 schema 的输出 token / 延迟
+#
+#   python bench_compact_schema.py                      # 离线：用内置样例估算每章输出 token
+#   python bench_compact_schema.py --from-json l2.json  # 离线：用已有 L2 结果（TaskRun.result_json）估算
+#   python bench_compact_schema.py --live 3             # 在线：对样例章节各请求 3 次，比较真实延迟
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+from schema.base import ScriptSection, Section
+from schema.compact import CompactSection
+from util.base import estimate_tokens
+
+
+_SAMPLE = {
+    "section": "开场：餐桌上的小惊喜",
+    "rationale": "前 3 秒用产品特写抓住注意力，再用家庭场景建立使用情境",
+    "duration": 15,
+    "sub_sections": [
+        {"title": "产品特写", "duration_s": 3, "shot": "特写", "camera_move": "推", "location": "居家餐桌",
+         "props": ["Hello Kitty 餐盘"], "visual": "镜头缓推餐盘边缘的立体浮雕，阳光在釉面上反光",
+         "onscreen_text": "", "audio": "", "music": "轻快钢琴", "transition": "", "compliance_notes": ""},
+        {"title": "摆盘", "duration_s": 4, "shot": "中景", "camera_move": "静止", "location": "居家餐桌",
+         "props": ["餐盘", "早餐"], "visual": "妈妈把煎蛋和水果摆进分格餐盘，孩子在一旁期待",
+         "onscreen_text": "分格设计 不串味", "audio": "", "music": "", "transition": "", "compliance_notes": ""},
+        {"title": "孩子反应", "duration_s": 3, "shot": "近景", "camera_move": "手持", "location": "居家餐桌",
+         "props": [], "visual": "孩子看到餐盘露出笑容，伸手去拿勺子",
+         "onscreen_text": "", "audio": "", "music": "", "transition": "", "compliance_notes": ""},
+        {"title": "材质展示", "duration_s": 3, "shot": "特写", "camera_move": "摇", "location": "厨房水槽",
+         "props": ["餐盘"], "visual": "清水冲洗餐盘，油渍轻松滑落",
+         "onscreen_text": "易清洗", "audio": "", "music": "", "transition": "叠化", "compliance_notes": ""},
+        {"title": "收尾", "duration_s": 2, "shot": "全景", "camera_move": "拉", "location": "居家餐厅",
+         "props": [], "visual": "一家人围坐用餐，画面拉远",
+         "onscreen_text": "", "audio": "", "music": "", "transition": "", "compliance_notes": "避免宣称材质安全等级"},
+    ],
+}
+
+
+def _tokens_full(section: Section) -> int:
+    return estimate_tokens(json.dumps(section.model_dump(exclude={"item_id"}), ensure_ascii=False))
+
+
+def _tokens_compact(section: Section) -> int:
+    compact = CompactSection.from_section(section)
+    return estimate_tokens(json.dumps(compact.model_dump(exclude_none=True), ensure_ascii=False))
+
+
+def _offline(sections: list[Section]) -> None:
+    rows = []
+    for i, sec in enumerate(sections):
+        full, compact = _tokens_full(sec), _tokens_compact(sec)
+        rows.append((i, sec.duration, len(sec.sub_sections), full, compact))
+        print(f"chapter {i:>3}  {sec.duration:>4}s  {len(sec.sub_sections):>2} shots  "
+              f"full={full:>5}  compact={compact:>5}  saved={1 - compact / max(1, full):.0%}")
+
+    full_total = sum(r[3] for r in rows)
+    compact_total = sum(r[4] for r in rows)
+    print(f"\ntotal output tokens: full={full_total} compact={compact_total} "
+          f"ratio={compact_total / max(1, full_total):.2f}")
+    print(f"schema tokens:       full={estimate_tokens(json.dumps(Section.model_json_schema(), ensure_ascii=False))} "
+          f"compact={estimate_tokens(json.dumps(CompactSection.model_json_schema(), ensure_ascii=False))}")
+
+
+async def _live(n: int) -> None:
+    from agent.l2_writer_agents import L2ScreenwriterAgent
+
+    sample = Section.model_validate(_SAMPLE)
+    chapter = ScriptSection(section=sample.section, rationale=sample.rationale, duration=sample.duration)
+    chapter_text = json.dumps({"chapter": chapter.model_dump()}, ensure_ascii=False)
+    content = "Hello Kitty 餐盘 Amazon 产品介绍视频，重场景以及人群调性"
+
+    for compact in (False, True):
+        agent = L2ScreenwriterAgent(compact=compact)
+        latencies, tokens = [], []
+        for _ in range(n):
+            t0 = time.monotonic()
+            sec = await agent.write_infer(content=content, max_duration=chapter.duration, chapter=chapter_text)
+            latencies.append(time.monotonic() - t0)
+            tokens.append(_tokens_compact(sec) if compact else _tokens_full(sec))
+        print(f"{'compact' if compact else 'full':>7}: latency p50={statistics.median(latencies):.1f}s "
+              f"mean={statistics.mean(latencies):.1f}s  output≈{statistics.mean(tokens):.0f} tokens")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="L2 full vs compact output schema benchmark")
+    parser.add_argument("--from-json", help="L2 结果文件（list[Section] 的 JSON）")
+    parser.add_argument("--live", type=int, default=0, help="在线请求次数（每种 schema），0 表示只做离线估算")
+    args = parser.parse_args()
+
+    if args.from_json:
+        with open(args.from_json, "r", encoding="utf-8") as f:
+            sections = [Section.model_validate(x) for x in json.load(f) if x]
+    else:
+        sections = [Section.model_validate(_SAMPLE)]
+    _offline(sections)
+
+    if args.live > 0:
+        asyncio.run(_live(args.live))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+from __future__ import annotations
+
+import hashlib
+import json
+from collections.abc import Awaitable, Callable
+from datetime import datetime, timedelta, timezone
+from typing import Any, TypeVar
+
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import delete, select, update
+from sqlalchemy.exc import IntegrityError
+
+from core import settings
+from database.base import AsyncSessionLocal
+from database.models import IdempotencyKey
+from util import metrics
+
+
+T = TypeVar("T")
+
+# 第一次请求仍在处理中、但超过该时间没有完成的记录视为遗留（进程退出），允许重新执行
+_PENDING_TIMEOUT = timedelta(minutes=5)
+_MAX_KEY_CHARS = 128
+
+
+class NotAdmitted(Exception):
+    """
+    handler 未受理本次请求（如任务正忙）：response 原样返回给客户端，但不作为该 key 的重放结果，
+    key 随即释放，之后可以用同一个 key 重试
+    """
+
+    def __init__(self, response: Any):
+        super().__init__("request not admitted")
+        self.response = response
+
+
+def _aware(ts: datetime) -> datetime:
+    # SQLite 读回的时间不带时区（写入时均为 UTC）
+    return ts if ts.tzinfo is not None else ts.replace(tzinfo=timezone.utc)
+
+
+def _fingerprint(params: Any) -> str:
+    payload = json.dumps(jsonable_encoder(params), ensure_ascii=False, sort_keys=True)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+async def run_idempotent(
+    scope: str,
+    key: str | None,
+    params: Any,
+    handler: Callable[[], Awaitable[T]],
+) -> T:
+    """
+    Idempotency-Key：同一 scope 下同一 key 的请求只执行一次，重复请求（客户端重试、重复点击）直接返回第一次的响应。
+    - key 为空时直接执行
+    - 同一 key 搭配不同参数返回 422；第一次请求仍在处理中返回 409
+    - 第一次请求失败（抛出异常，含 HTTPException）或未被受理（NotAdmitted）时删除记录，允许用同一 key 重试
+    - 记录保留 IDEMPOTENCY_TTL_SEC 秒
+    """
+    key = (key or "").strip()
+    if not key:
+        try:
+            return await handler()
+        except NotAdmitted as e:
+            return e.response
+    if len(key) > _MAX_KEY_CHARS:
+        raise HTTPException(status_code=422, detail=f"Idempotency-Key 过长（最多 {_MAX_KEY_CHARS} 个字符）")
+
+    name = scope.split(":", 1)[0]
+    fingerprint = _fingerprint(params)
+    replay = await _reserve(scope, key, fingerprint)
+    if replay is not None:
+        metrics.inc("idempotent_replays_total", endpoint=name)
+        return replay["body"]
+
+    try:
+        result = await handler()
+    except NotAdmitted as e:
+        await _release(scope, key)
+        return e.response
+    except BaseException:
+        await _release(scope, key)
+        raise
+
+    async with AsyncSessionLocal() as session:
+        await session.execute(
+            update(IdempotencyKey)
+            .where(IdempotencyKey.scope == scope, IdempotencyKey.key == key)
+            .values(response_json={"body": jsonable_encoder(result)})
+        )
+        await session.commit()
+    return result
+
+
+async def _release(scope: str, key: str) -> None:
+    # 删除未完成的占位记录
+    async with AsyncSessionLocal() as session:
+        await session.execute(
+            delete(IdempotencyKey).where(
+                IdempotencyKey.scope == scope,
+                IdempotencyKey.key == key,
+                IdempotencyKey.response_json.is_(None),
+            )
+        )
+        await session.commit()
+
+
+async def _reserve(scope: str, key: str, fingerprint: str) -> dict | None:
+    # 插入占位记录（scope + key 唯一）；已有完成的记录时返回其响应
+    for _ in range(3):
+        async with AsyncSessionLocal() as session:
+            row = (
+                await session.execute(
+                    select(IdempotencyKey).where(IdempotencyKey.scope == scope, IdempotencyKey.key == key)
+                )
+            ).scalar_one_or_none()
+            if row is not None:
+                age = datetime.now(timezone.utc) - _aware(row.created_at)
+                stale = age > timedelta(seconds=settings.IDEMPOTENCY_TTL_SEC) or (
+                    row.response_json is None and age > _PENDING_TIMEOUT
+                )
+                if stale:
+                    await session.execute(delete(IdempotencyKey).where(IdempotencyKey.id == row.id))
+                    await session.commit()
+                    continue
+                if row.fingerprint != fingerprint:
+                    raise HTTPException(status_code=422, detail="Idempotency-Key 已用于参数不同的请求")
+                if row.response_json is None:
+                    raise HTTPException(status_code=409, detail="相同 Idempotency-Key 的请求仍在处理中")
+                return row.response_json
+
+            session.add(IdempotencyKey(scope=scope, key=key, fingerprint=fingerprint, response_json=None))
+            try:
+                await session.commit()
+            except IntegrityError:
+                # 并发的重复请求抢先插入：重新读取
+                await session.rollback()
+                continue
+            return None
+    raise HTTPException(status_code=409, detail="相同 Idempotency-Key 的请求仍在处理中")
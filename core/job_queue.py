@@ -0,0 +1,403 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import os
+import socket
+import uuid
+from collections.abc import Awaitable, Callable
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import exists, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core import settings
+from database.base import AsyncSessionLocal
+from database.models import ScriptTask, TaskJob, TaskRun
+from util import metrics
+
+
+# handler(task_id, run_id, payload)：run 的实际执行逻辑，由各 router 按 kind 注册
+JobHandler = Callable[[str, str, dict], Awaitable[None]]
+
+# CANCELLING：已请求取消，执行该任务的 worker 下次轮询时停止
+_ACTIVE = ("QUEUED", "RUNNING", "CANCELLING")
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class JobQueue:
+    """
+    基于 task_jobs 表的持久化任务队列：
+    - enqueue 与创建 run 在同一事务内写入，提交后 notify() 立即唤醒本进程的 worker
+    - worker 用条件 UPDATE（status=QUEUED）认领任务并持有租约，运行期间定期续租；
+      租约过期（进程崩溃）的任务重新入队，回收次数达到 JOB_MAX_ATTEMPTS 后置 ERROR
+    - 单个进程同时执行的任务数不超过 concurrency，其余在表里排队
+    - stop() 停止认领并等待在跑任务完成；超时后取消并释放租约，由下一个进程立即接手（handler 从断点继续）
+    - request_cancel() 取消排队中的任务，或让执行任务的 worker（本进程立即、其他进程在下次轮询时）取消其 asyncio 任务；
+      handler 可在 CancelledError 中用 cancel_reason() 区分用户取消与停机，保存已完成的部分结果
+    """
+
+    def __init__(self) -> None:
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.concurrency = 1
+        self._handlers: dict[str, JobHandler] = {}
+        self._running: dict[str, asyncio.Task] = {}  # job_id -> 执行中的任务
+        self._run_jobs: dict[str, str] = {}  # run_id -> job_id
+        self._cancel_reasons: dict[str, str] = {}  # job_id -> 取消原因（用户取消，区别于停机）
+        self._wakeup: asyncio.Event | None = None
+        self._loop_task: asyncio.Task | None = None
+        self._heartbeat_task: asyncio.Task | None = None
+
+    def register(self, kind: str, handler: JobHandler) -> None:
+        self._handlers[kind] = handler
+
+    def enqueue(self, db: AsyncSession, *, task_id: str, run_id: str, kind: str, payload: dict | None = None) -> TaskJob:
+        # 只加入调用方的会话，随 run 一起提交；提交后调用 notify()
+        job = TaskJob(task_id=task_id, run_id=run_id, kind=kind, payload=payload or {}, status="QUEUED", attempts=0)
+        db.add(job)
+        return job
+
+    def notify(self) -> None:
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def is_active(self, db: AsyncSession, run_id: str) -> bool:
+        # run 对应的任务仍在排队或执行（含其他进程持有租约的任务）
+        if run_id in self._run_jobs:
+            return True
+        status = (await db.execute(select(TaskJob.status).where(TaskJob.run_id == run_id))).scalar_one_or_none()
+        return status in _ACTIVE
+
+    def cancel_reason(self, run_id: str) -> str | None:
+        # 本进程内该 run 的任务是否因用户取消而被取消（None 表示停机或租约丢失，任务会被重新执行）
+        job_id = self._run_jobs.get(run_id)
+        return self._cancel_reasons.get(job_id) if job_id else None
+
+    async def request_cancel(self, run_id: str, *, reason: str = "cancelled by user") -> str | None:
+        # 返回 CANCELLED（未开始，或在本进程内已停止）/ CANCELLING（由其他进程执行，对方下次轮询时停止）/ None（没有进行中的任务）
+        async with AsyncSessionLocal() as session:
+            job = (await session.execute(select(TaskJob).where(TaskJob.run_id == run_id))).scalar_one_or_none()
+            if job is None or job.status not in _ACTIVE:
+                return None
+            res = await session.execute(
+                update(TaskJob)
+                .where(TaskJob.id == job.id, TaskJob.status == "QUEUED")
+                .values(status="CANCELLED", error_message=reason)
+            )
+            if res.rowcount:
+                await self._settle_cancelled(session, job.task_id, job.run_id, reason)
+                await session.commit()
+                metrics.inc("jobs_total", kind=job.kind, outcome="cancelled")
+                return "CANCELLED"
+            # 已被认领：标记 CANCELLING，由持有租约的 worker 停止执行
+            await session.execute(
+                update(TaskJob)
+                .where(TaskJob.id == job.id, TaskJob.status == "RUNNING")
+                .values(status="CANCELLING", error_message=reason)
+            )
+            await session.commit()
+
+        local = self._running.get(job.id)
+        if local is None:
+            return "CANCELLING"
+        self._cancel_reasons[job.id] = reason
+        local.cancel()
+        with contextlib.suppress(BaseException):
+            await local
+        return "CANCELLED"
+
+    def start(self, *, concurrency: int | None = None) -> None:
+        if self._loop_task is not None:
+            return
+        self.concurrency = max(1, int(concurrency or settings.JOB_WORKER_CONCURRENCY))
+        self._wakeup = asyncio.Event()
+        self._loop_task = asyncio.create_task(self._worker_loop())
+        self._heartbeat_task = asyncio.create_task(self._heartbeat_loop())
+
+    async def stop(self, *, timeout: float | None = None) -> None:
+        # 停止认领 -> 等待在跑任务 -> 超时则取消（_execute 会释放租约，任务回到 QUEUED）
+        if self._loop_task is not None:
+            self._loop_task.cancel()
+            with contextlib.suppress(BaseException):
+                await self._loop_task
+        self._loop_task = None
+
+        pending = list(self._running.values())
+        if pending:
+            _, not_done = await asyncio.wait(pending, timeout=timeout)
+            for t in not_done:
+                t.cancel()
+            if not_done:
+                await asyncio.gather(*not_done, return_exceptions=True)
+
+        if self._heartbeat_task is not None:
+            self._heartbeat_task.cancel()
+            with contextlib.suppress(BaseException):
+                await self._heartbeat_task
+        self._heartbeat_task = None
+        self._wakeup = None
+
+    async def recover(self) -> None:
+        # 启动时清理没有任务记录的 RUNNING run（队列上线前创建、随进程退出而丢失的），
+        # 以及没有在跑任务却仍处于 *_RUNNING 的 task，便于用户 resume_l1 / retry_l2
+        async with AsyncSessionLocal() as session:
+            has_job = exists().where(TaskJob.run_id == TaskRun.id, TaskJob.status.in_(_ACTIVE))
+            parent_has_job = exists().where(TaskJob.run_id == TaskRun.parent_run_id, TaskJob.status.in_(_ACTIVE))
+            res = await session.execute(
+                update(TaskRun)
+                .where(TaskRun.status == "RUNNING", ~has_job, ~parent_has_job)
+                .values(status="ERROR", error_message="interrupted (process restarted)")
+                .execution_options(synchronize_session=False)
+            )
+            if res.rowcount:
+                metrics.inc("job_orphaned_runs_total", res.rowcount)
+            await self._settle_tasks(session)
+            await session.commit()
+
+    async def _settle_tasks(self, session: AsyncSession, task_ids: list[str] | None = None, status: str = "ERROR") -> None:
+        # 仍处于 *_RUNNING 但已没有进行中任务的 task 置为 status
+        task_has_job = exists().where(TaskJob.task_id == ScriptTask.id, TaskJob.status.in_(_ACTIVE))
+        query = update(ScriptTask).where(ScriptTask.status.in_(("L1_RUNNING", "L2_RUNNING")), ~task_has_job)
+        if task_ids is not None:
+            query = query.where(ScriptTask.id.in_(task_ids))
+        await session.execute(query.values(status=status).execution_options(synchronize_session=False))
+
+    async def _settle_cancelled(self, session: AsyncSession, task_id: str, run_id: str, reason: str) -> None:
+        # 任务的 run 及其子 run（L1 备选方案、流水线中的 L2）中仍为 RUNNING 的置为 CANCELLED；
+        # handler 已保存部分结果的 run 不受影响
+        await session.execute(
+            update(TaskRun)
+            .where(or_(TaskRun.id == run_id, TaskRun.parent_run_id == run_id), TaskRun.status == "RUNNING")
+            .values(status="CANCELLED", error_message=reason)
+        )
+        await self._settle_tasks(session, [task_id], status="CANCELLED")
+
+    async def _worker_loop(self) -> None:
+        assert self._wakeup is not None
+        while True:
+            self._wakeup.clear()
+            try:
+                await self._reclaim_expired()
+                await self._check_cancelling()
+                free = self.concurrency - len(self._running)
+                if free > 0:
+                    await self._claim(free)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # 数据库暂时不可用等：下一轮继续
+                metrics.inc("job_queue_errors_total", stage="poll")
+            with contextlib.suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(self._wakeup.wait(), timeout=settings.JOB_POLL_INTERVAL_SEC)
+
+    async def _check_cancelling(self) -> None:
+        # 其他进程请求取消的任务：取消本地的 asyncio 任务（排队与在途的 LLM 请求随之取消）
+        job_ids = list(self._running)
+        if not job_ids:
+            return
+        async with AsyncSessionLocal() as session:
+            rows = (
+                await session.execute(
+                    select(TaskJob.id, TaskJob.error_message).where(
+                        TaskJob.id.in_(job_ids), TaskJob.status == "CANCELLING"
+                    )
+                )
+            ).all()
+        for job_id, reason in rows:
+            job = self._running.get(job_id)
+            if job is not None and job_id not in self._cancel_reasons:
+                self._cancel_reasons[job_id] = reason or "cancelled"
+                job.cancel()
+
+    async def _claim(self, limit: int) -> None:
+        lease_until = _now() + timedelta(seconds=settings.JOB_LEASE_SEC)
+        async with AsyncSessionLocal() as session:
+            candidates = (
+                await session.execute(
+                    select(TaskJob.id)
+                    .where(TaskJob.status == "QUEUED", TaskJob.kind.in_(list(self._handlers)))
+                    .order_by(TaskJob.created_at)
+                    .limit(limit)
+                )
+            ).scalars().all()
+            claimed: list[str] = []
+            for job_id in candidates:
+                # 条件 UPDATE：多个 worker 同时看到同一任务时只有一个能认领成功
+                res = await session.execute(
+                    update(TaskJob)
+                    .where(TaskJob.id == job_id, TaskJob.status == "QUEUED")
+                    .values(status="RUNNING", lease_owner=self.worker_id, lease_expires_at=lease_until)
+                )
+                if res.rowcount:
+                    claimed.append(job_id)
+            await session.commit()
+            if not claimed:
+                return
+            jobs = (await session.execute(select(TaskJob).where(TaskJob.id.in_(claimed)))).scalars().all()
+
+        for job in jobs:
+            task = asyncio.create_task(
+                self._execute(job.id, job.task_id, job.run_id, job.kind, dict(job.payload or {}))
+            )
+            self._running[job.id] = task
+            self._run_jobs[job.run_id] = job.id
+            metrics.inc("jobs_claimed_total", kind=job.kind)
+        metrics.set_gauge("jobs_running", len(self._running), worker=self.worker_id)
+
+    async def _execute(self, job_id: str, task_id: str, run_id: str, kind: str, payload: dict) -> None:
+        status: str | None = "DONE"
+        error: str | None = None
+        try:
+            handler = self._handlers.get(kind)
+            if handler is None:
+                raise RuntimeError(f"no handler for job kind: {kind}")
+            await handler(task_id, run_id, payload)
+        except asyncio.CancelledError:
+            # 用户取消 -> CANCELLED；停机 / 租约丢失 -> 释放租约重新排队
+            error = self._cancel_reasons.get(job_id)
+            status = "CANCELLED" if error is not None else None
+        except Exception as e:
+            status, error = "ERROR", repr(e)
+        finally:
+            self._running.pop(job_id, None)
+            self._run_jobs.pop(run_id, None)
+            self._cancel_reasons.pop(job_id, None)
+            metrics.set_gauge("jobs_running", len(self._running), worker=self.worker_id)
+
+        try:
+            await self._finish(job_id, task_id, run_id, status, error)
+        except Exception:
+            metrics.inc("job_queue_errors_total", stage="finish")
+        metrics.inc("jobs_total", kind=kind, outcome=(status or "released").lower())
+        self.notify()
+
+    async def _finish(self, job_id: str, task_id: str, run_id: str, status: str | None, error: str | None) -> None:
+        # 只更新仍由本 worker 持有的任务（租约已被回收的不覆盖）
+        async with AsyncSessionLocal() as session:
+            owned = (TaskJob.id == job_id, TaskJob.lease_owner == self.worker_id)
+            released = {"lease_owner": None, "lease_expires_at": None}
+            if status is None:
+                # 停机释放；若期间已被请求取消，则直接记为取消
+                res = await session.execute(
+                    update(TaskJob).where(*owned, TaskJob.status == "RUNNING").values(status="QUEUED", **released)
+                )
+                if not res.rowcount:
+                    error = (
+                        await session.execute(
+                            select(TaskJob.error_message).where(*owned, TaskJob.status == "CANCELLING")
+                        )
+                    ).scalar_one_or_none()
+                    if error is not None:
+                        status = "CANCELLED"
+            if status is not None:
+                res = await session.execute(
+                    update(TaskJob).where(*owned).values(status=status, error_message=error, **released)
+                )
+            if res.rowcount and status == "CANCELLED":
+                await self._settle_cancelled(session, task_id, run_id, error or "cancelled")
+            if res.rowcount and status == "ERROR":
+                # handler 未能自行落状态（例如源 run 不存在）时兜底，避免 run 永远停在 RUNNING
+                await session.execute(
+                    update(TaskRun)
+                    .where(TaskRun.id == run_id, TaskRun.status == "RUNNING")
+                    .values(status="ERROR", error_message=error)
+                )
+            await session.commit()
+
+    async def _reclaim_expired(self) -> None:
+        now = _now()
+        async with AsyncSessionLocal() as session:
+            expired = (
+                await session.execute(
+                    select(TaskJob).where(TaskJob.status.in_(("RUNNING", "CANCELLING")), TaskJob.lease_expires_at < now)
+                )
+            ).scalars().all()
+            if not expired:
+                return
+            failed_tasks: list[str] = []
+            for job in expired:
+                if job.status == "CANCELLING":
+                    # 执行者已退出，取消即完成
+                    res = await session.execute(
+                        update(TaskJob)
+                        .where(TaskJob.id == job.id, TaskJob.status == "CANCELLING")
+                        .values(status="CANCELLED", lease_owner=None, lease_expires_at=None)
+                    )
+                    if res.rowcount:
+                        await self._settle_cancelled(session, job.task_id, job.run_id, job.error_message or "cancelled")
+                    continue
+                attempts = int(job.attempts or 0) + 1
+                give_up = attempts >= settings.JOB_MAX_ATTEMPTS
+                res = await session.execute(
+                    update(TaskJob)
+                    .where(
+                        TaskJob.id == job.id,
+                        TaskJob.status == "RUNNING",
+                        TaskJob.lease_owner == job.lease_owner,
+                    )
+                    .values(
+                        status="ERROR" if give_up else "QUEUED",
+                        attempts=attempts,
+                        lease_owner=None,
+                        lease_expires_at=None,
+                        error_message=f"lease expired {attempts} times" if give_up else job.error_message,
+                    )
+                )
+                if not res.rowcount:
+                    continue
+                metrics.inc("jobs_reclaimed_total", kind=job.kind, outcome="error" if give_up else "requeued")
+                if give_up:
+                    await session.execute(
+                        update(TaskRun)
+                        .where(TaskRun.id == job.run_id, TaskRun.status == "RUNNING")
+                        .values(status="ERROR", error_message=f"job lease expired {attempts} times")
+                    )
+                    failed_tasks.append(job.task_id)
+            if failed_tasks:
+                await session.flush()
+                await self._settle_tasks(session, failed_tasks)
+            await session.commit()
+
+    async def _heartbeat_loop(self) -> None:
+        interval = max(1.0, settings.JOB_LEASE_SEC / 3)
+        while True:
+            await asyncio.sleep(interval)
+            job_ids = list(self._running)
+            if not job_ids:
+                continue
+            try:
+                async with AsyncSessionLocal() as session:
+                    await session.execute(
+                        update(TaskJob)
+                        .where(
+                            TaskJob.id.in_(job_ids),
+                            TaskJob.status.in_(("RUNNING", "CANCELLING")),
+                            TaskJob.lease_owner == self.worker_id,
+                        )
+                        .values(lease_expires_at=_now() + timedelta(seconds=settings.JOB_LEASE_SEC))
+                    )
+                    owned = set(
+                        (
+                            await session.execute(
+                                select(TaskJob.id).where(
+                                    TaskJob.id.in_(job_ids), TaskJob.lease_owner == self.worker_id
+                                )
+                            )
+                        ).scalars().all()
+                    )
+                    await session.commit()
+            except Exception:
+                metrics.inc("job_queue_errors_total", stage="heartbeat")
+                continue
+            for job_id in job_ids:
+                job = self._running.get(job_id)
+                if job is not None and job_id not in owned:
+                    # 租约已被其他 worker 回收（例如本进程长时间卡顿）：停止本地执行，避免重复生成
+                    metrics.inc("jobs_lease_lost_total")
+                    job.cancel()
+
+
+job_queue = JobQueue()
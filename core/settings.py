@@ -40,6 +40,14 @@ async_database_url = os.getenv("DATABASE_URL", "sqlite+aiosqlite:///./app.db")
 # LLM / OpenAI 兼容接口
 OPENAI_HOST = os.getenv("OPENAI_HOST", "")
 OPENAI_KEY = os.getenv("OPENAI_KEY", "")
+# - LLM_MAX_CONCURRENCY: 进程内同时在途的 LLM 请求上限（所有 agent 共享）
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+# - LLM_MODEL_MAX_CONCURRENCY: 单个模型的自适应并发上限（AIMD，不超过 LLM_MAX_CONCURRENCY 才有意义）
+# - LLM_INITIAL_CONCURRENCY: 单个模型的初始并发（空闲时按成功请求逐步放大）
+# - LLM_LATENCY_TARGET_SEC: 单次请求延迟超过该值（秒）视为网关过载，并发减半
+LLM_MODEL_MAX_CONCURRENCY = int(os.getenv("LLM_MODEL_MAX_CONCURRENCY", str(LLM_MAX_CONCURRENCY)))
+LLM_INITIAL_CONCURRENCY = int(os.getenv("LLM_INITIAL_CONCURRENCY", "2"))
+LLM_LATENCY_TARGET_SEC = float(os.getenv("LLM_LATENCY_TARGET_SEC", "90"))
 
 
 # Agent / Workflow 模型选择
@@ -49,6 +57,54 @@ L0_AGENT_MODEL = os.getenv("L0_AGENT_MODEL", "qwen/qwen3-235b-a22b")
 L1_AGENT_MODEL = os.getenv("L1_AGENT_MODEL", "moonshotai/kimi-k2.5")
 
 
+# Workflow
+# - L1_MODE: L1 生成模式（serial=逐段续写；parallel=先出大纲再并发扩写；hierarchical=长视频分幕 -> 章节 -> 段落）
+# - L1_PARALLEL_NUM: parallel 模式下同时扩写的大纲分段数
+# - L1_CONTINUATION_TOKEN_BUDGET: 串行续写时 Previous 摘要的 token 预算（<=0 则传整段上一阶段 JSON）
+L1_MODE = os.getenv("L1_MODE", "serial")
+L1_PARALLEL_NUM = int(os.getenv("L1_PARALLEL_NUM", "3"))
+L1_CONTINUATION_TOKEN_BUDGET = int(os.getenv("L1_CONTINUATION_TOKEN_BUDGET", "800"))
+# - L1_SPLIT_STRATEGY: 超长段落拆分策略（auto=句子结构清晰时本地拆分；rule=优先本地拆分；llm=始终用模型拆分）
+L1_SPLIT_STRATEGY = os.getenv("L1_SPLIT_STRATEGY", "auto")
+# - L1_MAX_VARIANTS: run_l1 的 variants 参数上限（多方案并发生成）
+L1_MAX_VARIANTS = int(os.getenv("L1_MAX_VARIANTS", "4"))
+# - L1_ACT_DURATION: hierarchical 模式下每幕的最大时长（秒），不超过一幕的视频退化为 parallel
+# - L1_MAX_SECTION_DURATION: L1 收尾时超过该时长（秒）的段落会被拆分
+L1_ACT_DURATION = int(os.getenv("L1_ACT_DURATION", "600"))
+L1_MAX_SECTION_DURATION = int(os.getenv("L1_MAX_SECTION_DURATION", "60"))
+# - L2_BATCH_NUM: L2 同时扩写的章节数；<=0 表示按模型的自适应并发（AIMD）决定
+L2_BATCH_NUM = int(os.getenv("L2_BATCH_NUM", "0"))
+# - L2_SPECULATIVE: L1 完成后以低优先级提前生成 L2（params.l2Speculative 可按任务覆盖）
+L2_SPECULATIVE = _env_bool("L2_SPECULATIVE", False)
+# - L2_PACK_TOKEN_BUDGET: 相邻短章节打包成一次 L2 请求的预估输出 token 上限；<=0 关闭（逐章请求）
+L2_PACK_TOKEN_BUDGET = int(os.getenv("L2_PACK_TOKEN_BUDGET", "0"))
+# - L2_BRIEF_MIN_CHARS: 原文字符数达到该值时先生成一次内容简报，L2 各章节用简报代替整篇原文；<=0 关闭（始终用原文）
+L2_BRIEF_MIN_CHARS = int(os.getenv("L2_BRIEF_MIN_CHARS", "6000"))
+# - L2_COMPACT_SCHEMA: L2 使用紧凑输出 schema（短字段名 + 景别/运镜代码 + 省略空字段），本地展开为 Section
+# - L2_MAX_TOKENS_FACTOR: 紧凑模式下按章节时长预估输出 token，乘以该系数作为 max_tokens；<=0 不限制
+L2_COMPACT_SCHEMA = _env_bool("L2_COMPACT_SCHEMA", False)
+L2_MAX_TOKENS_FACTOR = float(os.getenv("L2_MAX_TOKENS_FACTOR", "2.5"))
+# - L2_TRANSLATE_BATCH_CHARS: L2 多语言翻译时每次请求打包的原文字符数上限
+L2_TRANSLATE_BATCH_CHARS = int(os.getenv("L2_TRANSLATE_BATCH_CHARS", "4000"))
+
+
+# 后台任务队列（L1/L2 等 run 的执行，见 core/job_queue.py）
+# - JOB_WORKER_CONCURRENCY: 单个进程同时执行的 run 上限，超出的在 task_jobs 表中排队
+# - JOB_LEASE_SEC: 认领任务的租约时长（秒），运行期间每 1/3 租约续租一次；进程崩溃后租约过期即被重新认领
+# - JOB_POLL_INTERVAL_SEC: 轮询新任务的间隔（秒）；本进程入队的任务会立即唤醒 worker
+# - JOB_MAX_ATTEMPTS: 同一任务因租约过期被回收的次数上限，达到后置 ERROR（避免反复拖垮进程的任务无限重试）
+# - JOB_DRAIN_TIMEOUT_SEC: 停机时等待在跑任务完成的时间（秒），超时则取消并释放租约，由下次启动的进程从断点继续
+# - JOB_WORKER_IN_API: API 进程是否同时执行任务；false 时 API 只负责入队与读取，任务由独立的 worker 进程（python -m worker）执行
+JOB_WORKER_CONCURRENCY = int(os.getenv("JOB_WORKER_CONCURRENCY", "4"))
+JOB_LEASE_SEC = int(os.getenv("JOB_LEASE_SEC", "60"))
+JOB_POLL_INTERVAL_SEC = float(os.getenv("JOB_POLL_INTERVAL_SEC", "1.0"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_DRAIN_TIMEOUT_SEC = float(os.getenv("JOB_DRAIN_TIMEOUT_SEC", "30"))
+JOB_WORKER_IN_API = _env_bool("JOB_WORKER_IN_API", True)
+# - IDEMPOTENCY_TTL_SEC: Idempotency-Key 记录的保留时长（秒），过期后同一 key 视为新请求
+IDEMPOTENCY_TTL_SEC = int(os.getenv("IDEMPOTENCY_TTL_SEC", "86400"))
+
+
 # 文件上传与解析
 # - FILE_UPLOAD_DIR: 上传文件落盘目录（用于 save_image 等）
 # - FILE_MAX_BYTES: 单文件大小限制（bytes）
@@ -1,6 +1,6 @@
 
 from sqlalchemy.orm import Mapped, mapped_column
-from sqlalchemy import String, Text, DateTime, JSON, Integer, ForeignKey
+from sqlalchemy import String, Text, DateTime, JSON, Integer, ForeignKey, UniqueConstraint
 from datetime import datetime, timezone
 import uuid
 
@@ -26,7 +26,7 @@ class ScriptTask(Base):
     # compass 选择（用户绑定或自动推断后缓存），供 L1/L2 复用
     compass: Mapped[dict | None] = mapped_column(JSON, nullable=True)
 
-    status: Mapped[str] = mapped_column(String(32), default="CREATED")  # CREATED / PARAMS_READY / L1_RUNNING / L1_DONE / L2_RUNNING / DONE / ERROR
+    status: Mapped[str] = mapped_column(String(32), default="CREATED")  # CREATED / PARAMS_READY / L1_RUNNING / L1_DONE / L2_RUNNING / DONE / PARTIAL / ERROR / CANCELLED
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
     updated_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True),
@@ -42,7 +42,7 @@ class TaskRun(Base):
     task_id: Mapped[str] = mapped_column(String(32), ForeignKey("tasks.id"), index=True)
 
     phase: Mapped[str] = mapped_column(String(16))  # l1 / l2
-    status: Mapped[str] = mapped_column(String(32), default="RUNNING")  # RUNNING / DONE / ERROR
+    status: Mapped[str] = mapped_column(String(32), default="RUNNING")  # RUNNING / DONE / PARTIAL(仅 L2) / CANCELLED / ERROR
 
     parent_run_id: Mapped[str | None] = mapped_column(String(32), ForeignKey("task_runs.id"), nullable=True)
 
@@ -73,3 +73,60 @@ class TaskProgressEvent(Base):
     data: Mapped[dict | None] = mapped_column(JSON, nullable=True)
 
 
+class TaskRunStage(Base):
+    # run 内已完成的中间结果（断点），用于失败/重启后续跑
+    __tablename__ = "task_run_stages"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    task_id: Mapped[str] = mapped_column(String(32), ForeignKey("tasks.id"), index=True)
+    run_id: Mapped[str] = mapped_column(String(32), ForeignKey("task_runs.id"), index=True)
+
+    phase: Mapped[str] = mapped_column(String(16))  # l1 / l2
+    kind: Mapped[str] = mapped_column(String(16))  # l1: stage / outline / segment / act；l2: chapter
+    stage: Mapped[int] = mapped_column(Integer)
+
+    result_json: Mapped[dict | list | None] = mapped_column(JSON, nullable=True)
+    current_second: Mapped[int] = mapped_column(Integer, default=0)
+    previous_json: Mapped[str | None] = mapped_column(Text, nullable=True)
+
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
+
+
+class TaskJob(Base):
+    # 持久化的后台任务：每个 run 一条，由 core.job_queue 的 worker 认领执行；进程重启后未完成的任务会被重新认领
+    __tablename__ = "task_jobs"
+
+    id: Mapped[str] = mapped_column(String(32), primary_key=True, default=new_id)
+    task_id: Mapped[str] = mapped_column(String(32), ForeignKey("tasks.id"), index=True)
+    run_id: Mapped[str] = mapped_column(String(32), ForeignKey("task_runs.id"), unique=True)
+
+    kind: Mapped[str] = mapped_column(String(32))  # l1 / l1_variants / l2 / l2_speculative / pipeline / l2_translate
+    payload: Mapped[dict | None] = mapped_column(JSON, nullable=True)
+    status: Mapped[str] = mapped_column(String(16), default="QUEUED", index=True)  # QUEUED / RUNNING / CANCELLING / DONE / ERROR / CANCELLED
+    attempts: Mapped[int] = mapped_column(Integer, default=0)  # 租约过期被回收的次数（进程崩溃），超过上限置 ERROR
+
+    lease_owner: Mapped[str | None] = mapped_column(String(64), nullable=True)
+    lease_expires_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    error_message: Mapped[str | None] = mapped_column(Text, nullable=True)
+
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        default=lambda: datetime.now(timezone.utc),
+        onupdate=lambda: datetime.now(timezone.utc),
+    )
+
+
+class IdempotencyKey(Base):
+    # Idempotency-Key 请求头的去重记录：同一 scope + key 的重复请求直接返回第一次的响应，不再触发新的生成
+    __tablename__ = "idempotency_keys"
+    __table_args__ = (UniqueConstraint("scope", "key", name="uq_idempotency_scope_key"),)
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    scope: Mapped[str] = mapped_column(String(96))  # 接口名[:task_id]
+    key: Mapped[str] = mapped_column(String(128))
+    fingerprint: Mapped[str] = mapped_column(String(40))  # 请求参数哈希：同一 key 搭配不同参数视为误用
+
+    response_json: Mapped[dict | None] = mapped_column(JSON(none_as_null=True), nullable=True)  # 为空表示第一次请求仍在处理中
+
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
@@ -9,6 +9,7 @@ from starlette.middleware.cors import CORSMiddleware
 from starlette.templating import Jinja2Templates
 
 from core import settings
+from core.job_queue import job_queue
 from router.v1_router import combine_router
 from router.various.various_router import router as various_router
 
@@ -38,10 +39,16 @@ def _pick_asset_url(prefix: str, suffix: str) -> str | None:
 async def startup_event():
     async with async_engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+    # 先清理上次进程遗留的孤儿 run，再开始认领任务（租约过期的任务由 worker 自动重新入队）
+    await job_queue.recover()
+    # JOB_WORKER_IN_API=false 时 API 只入队，任务由独立的 worker 进程执行（见 worker.py）
+    if settings.JOB_WORKER_IN_API:
+        job_queue.start()
 
 
 async def shutdown_event():
-    pass
+    # 停止认领新任务，等待在跑任务完成；超时的任务释放租约，下次启动后从断点继续
+    await job_queue.stop(timeout=settings.JOB_DRAIN_TIMEOUT_SEC)
 
 
 @asynccontextmanager
@@ -1,25 +1,34 @@
 import asyncio
+from collections.abc import Awaitable, Callable
 from datetime import datetime, timezone
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Literal
 import uuid
+import hashlib
+import json
 import io
+import weakref
 
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Depends
+from fastapi import APIRouter, UploadFile, File, Form, Header, HTTPException, Depends, Query
 from fastapi.responses import StreamingResponse
-from pydantic import BaseModel
-from sqlalchemy import select, update, desc
+from pydantic import BaseModel, Field
+from sqlalchemy import delete, select, update, desc
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from core.dependences import get_db
 from core import settings
+from core.idempotency import NotAdmitted, run_idempotent
+from core.job_queue import job_queue
 from database.base import AsyncSessionLocal
-from database.models import ScriptTask, TaskRun, TaskProgressEvent
+from database.models import ScriptTask, TaskRun, TaskProgressEvent, TaskRunStage
 from util.files_util import save_image, file_to_text
-from agent.l1_workflow import l1_script_infer
-from agent.l2_workflow import l2_script_infer
-from schema.base import L1VideoScript, ProgressEvent
+from agent.l1_workflow import l1_script_infer, rank_l1_variants, variant_hint_for
+from agent.concurrency import low_priority
+from agent.l2_workflow import L2PartialError, L2Pipeline, l2_script_infer
+from schema.base import ContentBrief, L1Checkpoint, L1StageCheckpoint, L1VideoScript, ProgressEvent, ScriptSection, Section
 from core.compass import CompassSelection
 from agent.compass_agent import CompassChoicesAgent
+from agent.brief_agent import ContentBriefAgent
+from agent.i18n_workflow import l2_translate_sections
 from util.xlsx_export import export_l2_sections_to_xlsx_bytes
 
 router = APIRouter(tags=["Draft"])
@@ -34,6 +43,14 @@ class TaskParamsRequest(BaseModel):
     audience: str
     style: List[str]
     additionalInstructions: Optional[str] = None
+    l1Mode: Optional[Literal["serial", "parallel", "hierarchical"]] = None
+    l1SplitStrategy: Optional[Literal["auto", "rule", "llm"]] = None
+    l2Speculative: Optional[bool] = None
+
+
+class TranslateL2Request(BaseModel):
+    languages: List[str] = Field(..., min_length=1, max_length=8, description="目标语言，例如 [\"English\", \"日本語\"]")
+    run_id: Optional[str] = Field(default=None, description="要翻译的 L2 run；默认最近一次 DONE 的 L2")
 
 
 class TaskCompassRequest(BaseModel):
@@ -49,12 +66,29 @@ async def create_draft(
     doc: Optional[UploadFile] = File(None),
     # 传图片文件（多图）
     images: Optional[List[UploadFile]] = File(None),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
     db: AsyncSession = Depends(get_db),
 
 ):
     """
         Step1：输入内容（text/doc/image）-> 存 SQLite -> 返回 task_id
+        带 Idempotency-Key 的重复提交直接返回第一次创建的 task_id
     """
+    files = [f for f in [doc, *(images or [])] if f is not None]
+    return await run_idempotent(
+        "create_draft",
+        idempotency_key,
+        {"text": text, "files": [(f.filename, f.size) for f in files]},
+        lambda: _create_draft(db, text, doc, images),
+    )
+
+
+async def _create_draft(
+    db: AsyncSession,
+    text: Optional[str],
+    doc: Optional[UploadFile],
+    images: Optional[List[UploadFile]],
+) -> dict:
     if (text is None or not text.strip()) and doc is None:
         raise HTTPException(status_code=422, detail="至少提供 text / doc 之一（用于生成输入文本），images 可选")
 
@@ -254,10 +288,11 @@ async def get_task_progress(
         raise HTTPException(status_code=404, detail=f"task_id 不存在: {task_id}")
 
     if run_id is None:
+        # 默认只看主流程的 L1 / L2 run；简报、投机预生成、多方案、翻译等辅助 run 需显式传 run_id
         latest = (
             await db.execute(
                 select(TaskRun)
-                .where(TaskRun.task_id == task_id)
+                .where(TaskRun.task_id == task_id, TaskRun.phase.in_(("l1", "l2")))
                 .order_by(desc(TaskRun.created_at))
                 .limit(1)
             )
@@ -389,19 +424,366 @@ async def _ensure_task_compass(task_id: str) -> CompassSelection | None:
     return inferred
 
 
+# 同一任务的简报只生成一次：并发的 L2 / 投机 / 流水线任务排队等待同一个结果；
+# 弱引用，没有任务持有或等待某个锁时条目自动回收，不随处理过的任务数增长
+_brief_locks: weakref.WeakValueDictionary[str, asyncio.Lock] = weakref.WeakValueDictionary()
+
+
+async def _ensure_task_brief(task_id: str) -> ContentBrief | None:
+    # 原文不少于 L2_BRIEF_MIN_CHARS 时生成内容简报，L2 各章节用简报代替整篇原文；短原文返回 None（保留原文）
+    # 简报落为 TaskRun(phase=brief)，按原文哈希缓存；生成失败时记录 ERROR 并退回原文
+    lock = _brief_locks.setdefault(task_id, asyncio.Lock())
+    async with lock:
+        async with AsyncSessionLocal() as session:
+            task = (await session.execute(select(ScriptTask).where(ScriptTask.id == task_id))).scalar_one_or_none()
+            if task is None:
+                return None
+            content = task.input_text or ""
+            if settings.L2_BRIEF_MIN_CHARS <= 0 or len(content) < settings.L2_BRIEF_MIN_CHARS:
+                return None
+
+            content_hash = hashlib.sha1(content.encode("utf-8")).hexdigest()
+            cached = (
+                await session.execute(
+                    select(TaskRun)
+                    .where(TaskRun.task_id == task_id, TaskRun.phase == "brief", TaskRun.status == "DONE")
+                    .order_by(desc(TaskRun.created_at))
+                    .limit(1)
+                )
+            ).scalar_one_or_none()
+            if cached is not None and (cached.params_snapshot or {}).get("content_hash") == content_hash:
+                try:
+                    return ContentBrief.model_validate(cached.result_json)
+                except Exception:
+                    pass
+
+        try:
+            brief = await ContentBriefAgent().infer_brief(content=content)
+        except Exception as e:
+            brief, error = None, repr(e)
+        else:
+            error = None
+
+        async with AsyncSessionLocal() as session:
+            session.add(
+                TaskRun(
+                    task_id=task_id,
+                    phase="brief",
+                    status="DONE" if brief is not None else "ERROR",
+                    parent_run_id=None,
+                    params_snapshot={"content_hash": content_hash, "content_chars": len(content)},
+                    compass_snapshot=None,
+                    result_json=brief.model_dump() if brief is not None else None,
+                    error_message=error,
+                )
+            )
+            await session.commit()
+        return brief
+
+
+async def _save_run_stage(row: TaskRunStage) -> None:
+    # 同一 run 的同一 (phase, kind, stage) 只保留一行：run 被重新执行（重启后重新认领等）时覆盖旧断点而不是追加
+    async with AsyncSessionLocal() as session:
+        await session.execute(
+            delete(TaskRunStage).where(
+                TaskRunStage.run_id == row.run_id,
+                TaskRunStage.phase == row.phase,
+                TaskRunStage.kind == row.kind,
+                TaskRunStage.stage == row.stage,
+            )
+        )
+        session.add(row)
+        await session.commit()
+
+
+def _latest_stage_rows(rows: list[TaskRunStage]) -> list[TaskRunStage]:
+    # 兼容旧数据里重复写入的断点：按 id 顺序，同一 (kind, stage) 以最后一行为准
+    latest = {(r.kind, r.stage): r for r in rows}
+    return sorted(latest.values(), key=lambda r: r.id)
+
+
+async def _save_l1_checkpoint(task_id: str, run_id: str, cp: L1StageCheckpoint) -> None:
+    await _save_run_stage(
+        TaskRunStage(
+            task_id=task_id,
+            run_id=run_id,
+            phase="l1",
+            kind=cp.kind,
+            stage=cp.stage,
+            result_json=cp.result,
+            current_second=cp.current_second,
+            previous_json=cp.previous_json,
+        )
+    )
+
+
+async def _load_l1_checkpoints(db: AsyncSession, run_id: str) -> list[TaskRunStage]:
+    rows = (
+        await db.execute(
+            select(TaskRunStage)
+            .where(TaskRunStage.run_id == run_id, TaskRunStage.phase == "l1")
+            .order_by(TaskRunStage.id)
+        )
+    ).scalars().all()
+    return _latest_stage_rows(list(rows))
+
+
+def _l1_checkpoint_from_rows(rows: list[TaskRunStage]) -> L1Checkpoint:
+    return L1Checkpoint.from_stage_checkpoints(
+        [
+            L1StageCheckpoint(
+                kind=r.kind,
+                stage=r.stage,
+                result=r.result_json or {},
+                current_second=r.current_second or 0,
+                previous_json=r.previous_json,
+            )
+            for r in rows
+        ]
+    )
+
+
+async def _infer_l1_for_run(
+    task_id: str,
+    run_id: str,
+    *,
+    resume_from: L1Checkpoint | None = None,
+    variant_hint: str | None = None,
+    on_sections_ready: Callable[[tuple[int, ...], list[ScriptSection]], Awaitable[None]] | None = None,
+    compass: CompassSelection | None = None,
+) -> dict | None:
+    # compass: 调用方已解析好的 Compass（多方案并发时只解析一次）；为空时读取或推断任务的 Compass
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(select(ScriptTask).where(ScriptTask.id == task_id))
+        t = result.scalar_one_or_none()
+        if t is None:
+            return None
+        run = (await session.execute(select(TaskRun).where(TaskRun.id == run_id))).scalar_one()
+        params = run.params_snapshot or t.params or {}
+        content = t.input_text or ""
+        images = list(t.image_paths) if t.image_paths else None
+
+    if compass is None:
+        compass = await _ensure_task_compass(task_id)
+
+    def _on_progress(e: ProgressEvent) -> None:
+        asyncio.create_task(_append_progress_event(task_id, run_id, e))
+
+    async def _on_checkpoint(cp: L1StageCheckpoint) -> None:
+        await _save_l1_checkpoint(task_id, run_id, cp)
+
+    script = await l1_script_infer(
+        content=content,
+        max_duration=int(params.get("durationSec") or 60),
+        target_audience=str(params.get("audience") or "general"),
+        platform=str(params.get("platformFormat") or "抖音"),
+        language=str(params.get("outputLang") or "中文"),
+        images=images,
+        compass=compass,
+        on_progress=_on_progress,
+        show_progress=False,
+        include_stage_result=False,
+        mode=str(params.get("l1Mode") or settings.L1_MODE),
+        parallel_num=settings.L1_PARALLEL_NUM,
+        continuation_token_budget=settings.L1_CONTINUATION_TOKEN_BUDGET,
+        split_strategy=str(params.get("l1SplitStrategy") or settings.L1_SPLIT_STRATEGY),
+        resume_from=resume_from,
+        on_checkpoint=_on_checkpoint,
+        variant_hint=variant_hint,
+        act_duration=settings.L1_ACT_DURATION,
+        max_section_duration=settings.L1_MAX_SECTION_DURATION,
+        on_sections_ready=on_sections_ready,
+    )
+
+    dumped = script.model_dump()
+    body = list(dumped.get("body") or [])
+    for it in body:
+        if isinstance(it, dict) and not it.get("item_id"):
+            it["item_id"] = uuid.uuid4().hex
+    dumped["body"] = body
+    return dumped
+
+
+async def _run_l1_job(task_id: str, run_id: str, *, resume_from: L1Checkpoint | None = None) -> None:
+    try:
+        dumped = await _infer_l1_for_run(task_id, run_id, resume_from=resume_from)
+        if dumped is None:
+            return
+
+        async with AsyncSessionLocal() as session:
+            await session.execute(update(ScriptTask).where(ScriptTask.id == task_id).values(status="L1_DONE"))
+            await session.execute(
+                update(TaskRun)
+                .where(TaskRun.id == run_id)
+                .values(status="DONE", result_json=dumped, error_message=None)
+            )
+            await session.commit()
+    except Exception as e:
+        async with AsyncSessionLocal() as session:
+            await session.execute(update(ScriptTask).where(ScriptTask.id == task_id).values(status="ERROR"))
+            await session.execute(
+                update(TaskRun)
+                .where(TaskRun.id == run_id)
+                .values(status="ERROR", error_message=repr(e))
+            )
+            await session.commit()
+        return
+    await _maybe_start_speculative_l2(task_id, run_id)
+
+
+async def _run_l1_variants_job(task_id: str, run_id: str, variant_run_ids: list[str]) -> None:
+    # 多方案：各方案作为 phase=l1_variant 的兄弟 run 并发生成，本地打分后把最优方案写入主 run
+    try:
+        total = len(variant_run_ids)
+        # 任务还没有 Compass 时只推断一次，各方案共用，避免并发重复请求并互相覆盖
+        compass = await _ensure_task_compass(task_id)
+
+        async def _one(index: int, variant_run_id: str) -> dict | None:
+            # 重启后重新认领：已完成的方案直接沿用结果，未完成的从各自的断点续跑
+            async with AsyncSessionLocal() as session:
+                variant = (await session.execute(select(TaskRun).where(TaskRun.id == variant_run_id))).scalar_one()
+                if variant.status == "DONE" and variant.result_json is not None:
+                    return variant.result_json
+                rows = await _load_l1_checkpoints(session, variant_run_id)
+
+            try:
+                dumped = await _infer_l1_for_run(
+                    task_id,
+                    variant_run_id,
+                    resume_from=_l1_checkpoint_from_rows(rows) if rows else None,
+                    variant_hint=variant_hint_for(index, total),
+                    compass=compass,
+                )
+            except Exception as e:
+                async with AsyncSessionLocal() as session:
+                    await session.execute(
+                        update(TaskRun)
+                        .where(TaskRun.id == variant_run_id)
+                        .values(status="ERROR", error_message=repr(e))
+                    )
+                    await session.commit()
+                raise
+
+            async with AsyncSessionLocal() as session:
+                await session.execute(
+                    update(TaskRun)
+                    .where(TaskRun.id == variant_run_id)
+                    .values(status="DONE", result_json=dumped, error_message=None)
+                )
+                await session.commit()
+            return dumped
+
+        results = await asyncio.gather(
+            *[_one(i, vid) for i, vid in enumerate(variant_run_ids)],
+            return_exceptions=True,
+        )
+        ok = [(vid, r) for vid, r in zip(variant_run_ids, results) if isinstance(r, dict)]
+        if not ok:
+            errors = [r for r in results if isinstance(r, BaseException)]
+            if errors:
+                raise errors[0]
+            return
+
+        async with AsyncSessionLocal() as session:
+            run = (await session.execute(select(TaskRun).where(TaskRun.id == run_id))).scalar_one()
+            params = run.params_snapshot or {}
+
+        ranked = rank_l1_variants(
+            [L1VideoScript.model_validate(r) for _, r in ok],
+            target_duration=int(params.get("durationSec") or 60),
+        )
+        best_run_id, best = ok[ranked[0][0]]
+        await _append_progress_event(
+            task_id,
+            run_id,
+            ProgressEvent(
+                phase="l1",
+                type="variants_ranked",
+                data={
+                    "variants": [{"run_id": ok[i][0], "score": score} for i, score in ranked],
+                    "failed": total - len(ok),
+                    "selected_run_id": best_run_id,
+                },
+            ),
+        )
+
+        async with AsyncSessionLocal() as session:
+            await session.execute(update(ScriptTask).where(ScriptTask.id == task_id).values(status="L1_DONE"))
+            await session.execute(
+                update(TaskRun)
+                .where(TaskRun.id == run_id)
+                .values(status="DONE", result_json=best, error_message=None)
+            )
+            await session.commit()
+    except Exception as e:
+        async with AsyncSessionLocal() as session:
+            await session.execute(update(ScriptTask).where(ScriptTask.id == task_id).values(status="ERROR"))
+            await session.execute(
+                update(TaskRun)
+                .where(TaskRun.id == run_id)
+                .values(status="ERROR", error_message=repr(e))
+            )
+            await session.commit()
+        return
+    await _maybe_start_speculative_l2(task_id, run_id)
+
+
+async def _admit_task(db: AsyncSession, task_id: str, status: str, *, busy: tuple[str, ...]) -> bool:
+    # 条件更新抢占任务状态：并发的重复请求只有一个能从非 busy 状态切换过去，其余直接返回正在执行的 run，
+    # 避免先读状态、再写状态之间的窗口里启动两份付费生成。失败时回滚，不占着数据库写锁
+    res = await db.execute(
+        update(ScriptTask).where(ScriptTask.id == task_id, ScriptTask.status.not_in(busy)).values(status=status)
+    )
+    if res.rowcount:
+        return True
+    await db.rollback()
+    return False
+
+
+async def _busy_response(db: AsyncSession, task_id: str, phase: str) -> dict:
+    # 未抢到状态的请求：返回该阶段最近一次仍在运行的 run
+    status = (await db.execute(select(ScriptTask.status).where(ScriptTask.id == task_id))).scalar_one_or_none()
+    run_id = (
+        await db.execute(
+            select(TaskRun.id)
+            .where(TaskRun.task_id == task_id, TaskRun.phase == phase, TaskRun.status == "RUNNING")
+            .order_by(desc(TaskRun.created_at))
+            .limit(1)
+        )
+    ).scalar_one_or_none()
+    return {"task_id": task_id, "run_id": run_id, "status": status}
+
+
 @router.post("/task/{task_id}/run_l1")
-async def run_l1(task_id: str, db: AsyncSession = Depends(get_db)):
+async def run_l1(
+    task_id: str,
+    variants: int = Query(1, ge=1, le=settings.L1_MAX_VARIANTS),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    启动 L1；带 Idempotency-Key 的重复请求直接返回第一次的响应（同一个 run_id）
+    """
+    return await run_idempotent(
+        f"run_l1:{task_id}",
+        idempotency_key,
+        {"variants": variants},
+        lambda: _start_l1(db, task_id, variants),
+    )
+
+
+async def _start_l1(db: AsyncSession, task_id: str, variants: int) -> dict:
     result = await db.execute(select(ScriptTask).where(ScriptTask.id == task_id))
     task = result.scalar_one_or_none()
     if task is None:
         raise HTTPException(status_code=404, detail=f"task_id 不存在: {task_id}")
 
-    if task.status == "L1_RUNNING":
-        return {"task_id": task.id, "status": task.status}
-
     if not task.params:
         raise HTTPException(status_code=422, detail="请先设置 params，再启动 L1")
 
+    if not await _admit_task(db, task_id, "L1_RUNNING", busy=("L1_RUNNING",)):
+        raise NotAdmitted(await _busy_response(db, task_id, "l1"))
+
     run = TaskRun(
         task_id=task_id,
         phase="l1",
@@ -413,79 +795,537 @@ async def run_l1(task_id: str, db: AsyncSession = Depends(get_db)):
         error_message=None,
     )
     db.add(run)
-    await db.execute(update(ScriptTask).where(ScriptTask.id == task_id).values(status="L1_RUNNING"))
+    await db.flush()
+
+    variant_runs: list[TaskRun] = []
+    if variants > 1:
+        for _ in range(variants):
+            variant_runs.append(
+                TaskRun(
+                    task_id=task_id,
+                    phase="l1_variant",
+                    status="RUNNING",
+                    parent_run_id=run.id,
+                    params_snapshot=task.params,
+                    compass_snapshot=task.compass,
+                    result_json=None,
+                    error_message=None,
+                )
+            )
+        db.add_all(variant_runs)
+        await db.flush()
+
+    variant_run_ids = [v.id for v in variant_runs]
+    if variant_run_ids:
+        job_queue.enqueue(db, task_id=task_id, run_id=run.id, kind="l1_variants", payload={"variant_run_ids": variant_run_ids})
+    else:
+        job_queue.enqueue(db, task_id=task_id, run_id=run.id, kind="l1")
     await db.commit()
     await db.refresh(run)
+    job_queue.notify()
 
-    async def _job() -> None:
-        try:
-            async with AsyncSessionLocal() as session:
-                result = await session.execute(select(ScriptTask).where(ScriptTask.id == task_id))
-                t = result.scalar_one_or_none()
-                if t is None:
-                    return
-                params = t.params or {}
-                content = t.input_text or ""
-                images = list(t.image_paths) if t.image_paths else None
+    if variant_run_ids:
+        return {"task_id": task_id, "run_id": run.id, "variant_run_ids": variant_run_ids, "status": "L1_RUNNING"}
+    return {"task_id": task_id, "run_id": run.id, "status": "L1_RUNNING"}
 
-            compass = await _ensure_task_compass(task_id)
 
-            def _on_progress(e: ProgressEvent) -> None:
-                asyncio.create_task(_append_progress_event(task_id, run.id, e))
+@router.post("/task/{task_id}/resume_l1")
+async def resume_l1(task_id: str, run_id: Optional[str] = None, db: AsyncSession = Depends(get_db)):
+    """
+    从失败（或因进程重启而中断）的 L1 run 的最后一个成功阶段继续生成
+    """
+    result = await db.execute(select(ScriptTask).where(ScriptTask.id == task_id))
+    task = result.scalar_one_or_none()
+    if task is None:
+        raise HTTPException(status_code=404, detail=f"task_id 不存在: {task_id}")
+
+    query = select(TaskRun).where(TaskRun.task_id == task_id, TaskRun.phase == "l1")
+    if run_id is not None:
+        query = query.where(TaskRun.id == run_id)
+    src = (await db.execute(query.order_by(desc(TaskRun.created_at)).limit(1))).scalar_one_or_none()
+    if src is None:
+        raise HTTPException(status_code=404, detail="未找到可续跑的 L1 run")
+
+    if await job_queue.is_active(db, src.id):
+        return {"task_id": task.id, "run_id": src.id, "status": "L1_RUNNING"}
+    if src.status == "DONE":
+        raise HTTPException(status_code=409, detail=f"L1 run 已完成，无需续跑: {src.id}")
+
+    rows = await _load_l1_checkpoints(db, src.id)
+    if not await _admit_task(db, task_id, "L1_RUNNING", busy=("L1_RUNNING",)):
+        return await _busy_response(db, task_id, "l1")
+
+    run = TaskRun(
+        task_id=task_id,
+        phase="l1",
+        status="RUNNING",
+        parent_run_id=src.id,
+        params_snapshot=src.params_snapshot,
+        compass_snapshot=src.compass_snapshot,
+        result_json=None,
+        error_message=None,
+    )
+    db.add(run)
+    await db.flush()
+
+    # 断点复制到新 run，再次失败时仍可从这里继续
+    for r in rows:
+        db.add(
+            TaskRunStage(
+                task_id=task_id,
+                run_id=run.id,
+                phase=r.phase,
+                kind=r.kind,
+                stage=r.stage,
+                result_json=r.result_json,
+                current_second=r.current_second,
+                previous_json=r.previous_json,
+            )
+        )
+    if src.status == "RUNNING":
+        await db.execute(
+            update(TaskRun)
+            .where(TaskRun.id == src.id)
+            .values(status="ERROR", error_message=f"interrupted; resumed as run {run.id}")
+        )
+    # 断点已复制到新 run，任务执行时从中恢复
+    job_queue.enqueue(db, task_id=task_id, run_id=run.id, kind="l1")
+    await db.commit()
+    await db.refresh(run)
+    job_queue.notify()
+    return {
+        "task_id": task_id,
+        "run_id": run.id,
+        "resumed_from": src.id,
+        "checkpoints": len(rows),
+        "status": "L1_RUNNING",
+    }
+
 
-            script = await l1_script_infer(
+def _assign_l2_item_ids(dumped_sections: list[dict | None], l1_json: Any) -> list[dict | None]:
+    # L2 section 与 L1 body 一一对应（失败章节为 None），沿用 L1 的 item_id；镜头 item_id 在 section 内去重
+    l1_body = []
+    if isinstance(l1_json, dict):
+        l1_body = list(l1_json.get("body") or [])
+
+    for i, sec in enumerate(dumped_sections):
+        if not isinstance(sec, dict):
+            continue
+
+        if not sec.get("item_id"):
+            l1_item_id = None
+            if i < len(l1_body) and isinstance(l1_body[i], dict):
+                l1_item_id = l1_body[i].get("item_id")
+            sec["item_id"] = l1_item_id or uuid.uuid4().hex
+
+        sub = list(sec.get("sub_sections") or [])
+        used = {sec.get("item_id")} if sec.get("item_id") else set()
+        for seg in sub:
+            if not isinstance(seg, dict):
+                continue
+
+            seg_id = seg.get("item_id")
+            if (not seg_id) or (seg_id in used):
+                seg_id = uuid.uuid4().hex
+                seg["item_id"] = seg_id
+            used.add(seg_id)
+        sec["sub_sections"] = sub
+    return dumped_sections
+
+
+async def _save_l2_chapter(task_id: str, run_id: str, chapter_index: int, section: Section) -> None:
+    await _save_run_stage(
+        TaskRunStage(
+            task_id=task_id,
+            run_id=run_id,
+            phase="l2",
+            kind="chapter",
+            stage=chapter_index + 1,
+            result_json=section.model_dump(),
+        )
+    )
+
+
+async def _load_l2_chapters(db: AsyncSession, run_id: str) -> list[TaskRunStage]:
+    rows = (
+        await db.execute(
+            select(TaskRunStage)
+            .where(TaskRunStage.run_id == run_id, TaskRunStage.phase == "l2")
+            .order_by(TaskRunStage.id)
+        )
+    ).scalars().all()
+    return _latest_stage_rows(list(rows))
+
+
+def _pipeline_stage(order: tuple[int, ...]) -> int:
+    # 流水线章节在 L1 结束前只有排序键：编码为 stage（前导 1 区分不同层级的排序键）
+    return int("1" + "".join(f"{x:03d}" for x in order))
+
+
+async def _save_pipeline_chapter(
+    task_id: str,
+    run_id: str,
+    order: tuple[int, ...],
+    chapter_hash: str,
+    section: Section,
+) -> None:
+    await _save_run_stage(
+        TaskRunStage(
+            task_id=task_id,
+            run_id=run_id,
+            phase="l2_pipeline",
+            kind="chapter",
+            stage=_pipeline_stage(order),
+            result_json={"order": list(order), "hash": chapter_hash, "section": section.model_dump()},
+        )
+    )
+
+
+async def _load_pipeline_chapters(db: AsyncSession, run_id: str) -> dict[tuple[int, ...], tuple[str, Section]]:
+    # 排序键 -> (对应 L1 段落的内容哈希, 章节)
+    rows = (
+        await db.execute(
+            select(TaskRunStage)
+            .where(TaskRunStage.run_id == run_id, TaskRunStage.phase == "l2_pipeline")
+            .order_by(TaskRunStage.id)
+        )
+    ).scalars().all()
+    return {
+        tuple(r.result_json["order"]): (r.result_json["hash"], Section.model_validate(r.result_json["section"]))
+        for r in _latest_stage_rows(list(rows))
+        if isinstance(r.result_json, dict) and r.result_json.get("hash")
+    }
+
+
+async def _finish_l2_run(
+    task_id: str,
+    run_id: str,
+    l1_json: Any,
+    sections: list[Section | None],
+    error: L2PartialError | None = None,
+) -> None:
+    # 全部成功 -> DONE；部分失败 -> PARTIAL，只落已完成的章节（item_id 仍按 L1 位置对应）
+    dumped_sections = _dump_l2_sections(sections, l1_json)
+    status = "DONE" if error is None else "PARTIAL"
+    async with AsyncSessionLocal() as session:
+        await session.execute(update(ScriptTask).where(ScriptTask.id == task_id).values(status=status))
+        await session.execute(
+            update(TaskRun)
+            .where(TaskRun.id == run_id)
+            .values(status=status, result_json=dumped_sections, error_message=repr(error) if error else None)
+        )
+        await session.commit()
+
+
+def _dump_l2_sections(sections: list[Section | None], l1_json: Any) -> list[dict]:
+    dumped_sections = _assign_l2_item_ids([s.model_dump() if s is not None else None for s in sections], l1_json)
+    return [s for s in dumped_sections if s is not None]
+
+
+async def _save_cancelled_l2_run(task_id: str, run_id: str, l1_json: Any, reason: str) -> None:
+    # 用户取消：本 run 已落盘的章节（含沿用的章节）作为部分结果保留，retry_l2 可补齐其余章节
+    async with AsyncSessionLocal() as session:
+        rows = await _load_l2_chapters(session, run_id)
+        sections: list[Section | None] = [None] * len((l1_json or {}).get("body") or [])
+        for r in rows:
+            if r.result_json and 0 < r.stage <= len(sections):
+                sections[r.stage - 1] = Section.model_validate(r.result_json)
+        await session.execute(
+            update(TaskRun)
+            .where(TaskRun.id == run_id)
+            .values(status="CANCELLED", result_json=_dump_l2_sections(sections, l1_json), error_message=reason)
+        )
+        await session.commit()
+
+
+async def _run_l2_job(task_id: str, run_id: str, l1_json: dict, *, done: dict[int, Section] | None = None) -> None:
+    try:
+        async with AsyncSessionLocal() as session:
+            result = await session.execute(select(ScriptTask).where(ScriptTask.id == task_id))
+            t = result.scalar_one_or_none()
+            if t is None:
+                return
+            run = (await session.execute(select(TaskRun).where(TaskRun.id == run_id))).scalar_one()
+            params = run.params_snapshot or t.params or {}
+            base_script = L1VideoScript.model_validate(l1_json)
+            content = t.input_text or ""
+            images = list(t.image_paths) if t.image_paths else None
+
+        compass = await _ensure_task_compass(task_id)
+        brief = await _ensure_task_brief(task_id)
+
+        def _on_progress(e: ProgressEvent) -> None:
+            asyncio.create_task(_append_progress_event(task_id, run_id, e))
+
+        async def _on_chapter_done(chapter_index: int, section: Section) -> None:
+            await _save_l2_chapter(task_id, run_id, chapter_index, section)
+
+        try:
+            sections = await l2_script_infer(
+                base_script=base_script,
                 content=content,
-                max_duration=int(params.get("durationSec") or 60),
+                batch_num=settings.L2_BATCH_NUM,
                 target_audience=str(params.get("audience") or "general"),
                 platform=str(params.get("platformFormat") or "抖音"),
                 language=str(params.get("outputLang") or "中文"),
                 images=images,
                 compass=compass,
                 on_progress=_on_progress,
-                show_progress=False,
                 include_stage_result=False,
+                done=done,
+                on_chapter_done=_on_chapter_done,
+                brief=brief,
+            )
+        except L2PartialError as e:
+            await _finish_l2_run(task_id, run_id, l1_json, e.sections, e)
+            return
+
+        await _finish_l2_run(task_id, run_id, l1_json, sections)
+    except asyncio.CancelledError:
+        reason = job_queue.cancel_reason(run_id)
+        if reason is not None:
+            await _save_cancelled_l2_run(task_id, run_id, l1_json, reason)
+        raise
+    except Exception as e:
+        async with AsyncSessionLocal() as session:
+            await session.execute(update(ScriptTask).where(ScriptTask.id == task_id).values(status="ERROR"))
+            await session.execute(
+                update(TaskRun)
+                .where(TaskRun.id == run_id)
+                .values(status="ERROR", error_message=repr(e))
+            )
+            await session.commit()
+
+
+def _l1_item_hash(item: dict) -> str:
+    # 只有 section / rationale / duration 影响 L2 输出
+    payload = json.dumps(
+        [item.get("section"), item.get("rationale"), item.get("duration")],
+        ensure_ascii=False,
+    )
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+async def _reusable_l2_chapters(db: AsyncSession, task_id: str, l1_json: dict) -> dict[int, Section]:
+    # 对比新 L1 body 与最近一次 L2 所基于的 L1：item_id 相同且内容哈希不变的章节直接沿用旧 L2 结果
+    prev_l2 = (
+        await db.execute(
+            select(TaskRun)
+            .where(
+                TaskRun.task_id == task_id,
+                TaskRun.phase == "l2",
+                TaskRun.status.in_(("DONE", "PARTIAL", "CANCELLED")),
             )
+            .order_by(desc(TaskRun.created_at))
+            .limit(1)
+        )
+    ).scalar_one_or_none()
+    if prev_l2 is None or not isinstance(prev_l2.result_json, list):
+        return {}
 
+    prev_l1 = await _l2_base_l1_run(db, prev_l2)
+    if prev_l1 is None or not isinstance(prev_l1.result_json, dict):
+        return {}
+
+    prev_hashes = {
+        it.get("item_id"): _l1_item_hash(it)
+        for it in (prev_l1.result_json.get("body") or [])
+        if isinstance(it, dict) and it.get("item_id")
+    }
+    prev_sections = {
+        sec.get("item_id"): sec
+        for sec in prev_l2.result_json
+        if isinstance(sec, dict) and sec.get("item_id")
+    }
+
+    done: dict[int, Section] = {}
+    for i, it in enumerate(l1_json.get("body") or []):
+        if not isinstance(it, dict):
+            continue
+        item_id = it.get("item_id")
+        if not item_id or item_id not in prev_sections:
+            continue
+        if prev_hashes.get(item_id) != _l1_item_hash(it):
+            continue
+        done[i] = Section.model_validate(prev_sections[item_id])
+    return done
+
+
+async def _maybe_start_speculative_l2(task_id: str, l1_run_id: str) -> None:
+    # 投机预生成（需开启）：L1 完成后立即以低优先级生成 L2，用户确认 L1 后 run_l2 直接取用未改动的章节；
+    # 只是可选的提速，入队失败只记一条进度事件，不影响已完成的 L1
+    try:
+        await _enqueue_speculative_l2(task_id, l1_run_id)
+    except Exception as e:
+        await _append_progress_event(
+            task_id,
+            l1_run_id,
+            ProgressEvent(phase="l2", type="speculative_error", data={"error": repr(e)}),
+        )
+
+
+async def _enqueue_speculative_l2(task_id: str, l1_run_id: str) -> None:
+    async with AsyncSessionLocal() as session:
+        l1_run = (await session.execute(select(TaskRun).where(TaskRun.id == l1_run_id))).scalar_one_or_none()
+        if l1_run is None or not isinstance(l1_run.result_json, dict):
+            return
+        params = l1_run.params_snapshot or {}
+        enabled = params.get("l2Speculative")
+        if not (settings.L2_SPECULATIVE if enabled is None else enabled):
+            return
+
+        run = TaskRun(
+            task_id=task_id,
+            phase="l2_speculative",
+            status="RUNNING",
+            parent_run_id=l1_run.id,
+            params_snapshot=l1_run.params_snapshot,
+            compass_snapshot=l1_run.compass_snapshot,
+            result_json=None,
+            error_message=None,
+        )
+        session.add(run)
+        await session.flush()
+        job_queue.enqueue(session, task_id=task_id, run_id=run.id, kind="l2_speculative", payload={"l1_run_id": l1_run.id})
+        await session.commit()
+    job_queue.notify()
+
+
+async def _run_speculative_l2_job(task_id: str, run_id: str, l1_json: dict) -> None:
+    # 结果按 L1 段落内容哈希逐章写入 task_run_stages（phase=l2_speculative），不改变任务状态
+    try:
+        with low_priority():
             async with AsyncSessionLocal() as session:
-                await session.execute(update(ScriptTask).where(ScriptTask.id == task_id).values(status="L1_DONE"))
+                t = (await session.execute(select(ScriptTask).where(ScriptTask.id == task_id))).scalar_one_or_none()
+                if t is None:
+                    return
+                run = (await session.execute(select(TaskRun).where(TaskRun.id == run_id))).scalar_one()
+                params = run.params_snapshot or {}
+                content = t.input_text or ""
+                images = list(t.image_paths) if t.image_paths else None
+                # 与上一次 L2 相比没有改动的章节 run_l2 会直接沿用，不必预生成
+                done = await _reusable_l2_chapters(session, task_id, l1_json)
 
-                dumped = script.model_dump()
-                body = list(dumped.get("body") or [])
-                for it in body:
-                    if isinstance(it, dict) and not it.get("item_id"):
-                        it["item_id"] = uuid.uuid4().hex
-                dumped["body"] = body
+            compass = await _ensure_task_compass(task_id)
+            brief = await _ensure_task_brief(task_id)
+            body = list(l1_json.get("body") or [])
 
-                await session.execute(
-                    update(TaskRun)
-                    .where(TaskRun.id == run.id)
-                    .values(status="DONE", result_json=dumped, error_message=None)
+            async def _on_chapter_done(chapter_index: int, section: Section) -> None:
+                if chapter_index in done:
+                    return
+                await _save_run_stage(
+                    TaskRunStage(
+                        task_id=task_id,
+                        run_id=run_id,
+                        phase="l2_speculative",
+                        kind="chapter",
+                        stage=chapter_index + 1,
+                        result_json={"hash": _l1_item_hash(body[chapter_index]), "section": section.model_dump()},
+                    )
                 )
-                await session.commit()
-        except Exception as e:
-            async with AsyncSessionLocal() as session:
-                await session.execute(update(ScriptTask).where(ScriptTask.id == task_id).values(status="ERROR"))
-                await session.execute(
-                    update(TaskRun)
-                    .where(TaskRun.id == run.id)
-                    .values(status="ERROR", error_message=repr(e))
+
+            status, error = "DONE", None
+            try:
+                await l2_script_infer(
+                    base_script=L1VideoScript.model_validate(l1_json),
+                    content=content,
+                    batch_num=settings.L2_BATCH_NUM,
+                    target_audience=str(params.get("audience") or "general"),
+                    platform=str(params.get("platformFormat") or "抖音"),
+                    language=str(params.get("outputLang") or "中文"),
+                    images=images,
+                    compass=compass,
+                    include_stage_result=False,
+                    done=done,
+                    on_chapter_done=_on_chapter_done,
+                    brief=brief,
                 )
-                await session.commit()
+            except L2PartialError as e:
+                status, error = "PARTIAL", repr(e)
 
-    asyncio.create_task(_job())
-    return {"task_id": task.id, "run_id": run.id, "status": "L1_RUNNING"}
+        async with AsyncSessionLocal() as session:
+            await session.execute(
+                update(TaskRun).where(TaskRun.id == run_id).values(status=status, error_message=error)
+            )
+            await session.commit()
+    except Exception as e:
+        async with AsyncSessionLocal() as session:
+            await session.execute(
+                update(TaskRun).where(TaskRun.id == run_id).values(status="ERROR", error_message=repr(e))
+            )
+            await session.commit()
+
+
+async def _speculative_l2_chapters(
+    db: AsyncSession,
+    task: ScriptTask,
+    l1_json: dict,
+    *,
+    skip: dict[int, Section],
+) -> tuple[dict[int, Section], str | None]:
+    # 取最近一次投机预生成的结果：参数/Compass 未变且段落内容哈希一致才可用，其余视为过期丢弃；
+    # 同时返回仍在排队或在跑的投机 run，由调用方在正式 L2 入队后取消（让位给正式 L2）
+    spec = (
+        await db.execute(
+            select(TaskRun)
+            .where(TaskRun.task_id == task.id, TaskRun.phase == "l2_speculative")
+            .order_by(desc(TaskRun.created_at))
+            .limit(1)
+        )
+    ).scalar_one_or_none()
+    if spec is None:
+        return {}, None
+
+    running = spec.id if spec.status == "RUNNING" else None
+    if spec.params_snapshot != task.params or spec.compass_snapshot != task.compass:
+        return {}, running
+
+    rows = (
+        await db.execute(
+            select(TaskRunStage).where(TaskRunStage.run_id == spec.id, TaskRunStage.phase == "l2_speculative")
+        )
+    ).scalars().all()
+    by_hash = {
+        r.result_json["hash"]: r.result_json["section"]
+        for r in rows
+        if isinstance(r.result_json, dict) and r.result_json.get("hash")
+    }
+
+    out: dict[int, Section] = {}
+    for i, it in enumerate(l1_json.get("body") or []):
+        if i in skip or not isinstance(it, dict):
+            continue
+        sec = by_hash.get(_l1_item_hash(it))
+        if sec is not None:
+            out[i] = Section.model_validate(sec)
+    return out, running
 
 
 @router.post("/task/{task_id}/run_l2")
-async def run_l2(task_id: str, db: AsyncSession = Depends(get_db)):
+async def run_l2(
+    task_id: str,
+    incremental: bool = True,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    启动 L2；incremental=true（默认）时只重新生成相对上一次 L2 新增或改动过的 L1 段落，其余章节沿用上一次的结果。
+    带 Idempotency-Key 的重复请求直接返回第一次的响应（同一个 run_id）
+    """
+    return await run_idempotent(
+        f"run_l2:{task_id}",
+        idempotency_key,
+        {"incremental": incremental},
+        lambda: _start_l2(db, task_id, incremental),
+    )
+
+
+async def _start_l2(db: AsyncSession, task_id: str, incremental: bool) -> dict:
     result = await db.execute(select(ScriptTask).where(ScriptTask.id == task_id))
     task = result.scalar_one_or_none()
     if task is None:
         raise HTTPException(status_code=404, detail=f"task_id 不存在: {task_id}")
 
-    if task.status == "L2_RUNNING":
-        return {"task_id": task.id, "status": task.status}
-
     latest_l1 = (
         await db.execute(
             select(TaskRun)
@@ -500,6 +1340,17 @@ async def run_l2(task_id: str, db: AsyncSession = Depends(get_db)):
     if not task.params:
         raise HTTPException(status_code=422, detail="params 为空，无法启动 L2")
 
+    done = await _reusable_l2_chapters(db, task_id, latest_l1.result_json) if incremental else {}
+    total = len(latest_l1.result_json.get("body") or [])
+    if not await _admit_task(db, task_id, "L2_RUNNING", busy=("L2_RUNNING",)):
+        raise NotAdmitted(await _busy_response(db, task_id, "l2"))
+
+    # 抢到状态后才取用投机预生成的结果，未被受理的重复请求不会动到投机任务
+    speculative, spec_running = ({}, None)
+    if incremental:
+        speculative, spec_running = await _speculative_l2_chapters(db, task, latest_l1.result_json, skip=done)
+    done.update(speculative)
+
     run = TaskRun(
         task_id=task_id,
         phase="l2",
@@ -511,85 +1362,471 @@ async def run_l2(task_id: str, db: AsyncSession = Depends(get_db)):
         error_message=None,
     )
     db.add(run)
-    await db.execute(update(ScriptTask).where(ScriptTask.id == task_id).values(status="L2_RUNNING"))
+    await db.flush()
+
+    # 沿用的章节同样记为本 run 的已完成章节，失败后 retry_l2 不会重跑它们
+    for i, sec in done.items():
+        db.add(
+            TaskRunStage(
+                task_id=task_id,
+                run_id=run.id,
+                phase="l2",
+                kind="chapter",
+                stage=i + 1,
+                result_json=sec.model_dump(),
+            )
+        )
+    job_queue.enqueue(db, task_id=task_id, run_id=run.id, kind="l2", payload={"l1_run_id": latest_l1.id})
     await db.commit()
     await db.refresh(run)
+    job_queue.notify()
+    # 仍在跑的投机任务让位给正式 L2：已完成的章节已取用，剩余章节由本 run 以正常优先级生成
+    if spec_running is not None:
+        await job_queue.request_cancel(spec_running, reason="superseded by run_l2")
+    return {
+        "task_id": task_id,
+        "run_id": run.id,
+        "reused_chapters": len(done) - len(speculative),
+        "speculative_chapters": len(speculative),
+        "regenerate_chapters": total - len(done),
+        "status": "L2_RUNNING",
+    }
+
+
+async def _l2_base_l1_run(db: AsyncSession, run: TaskRun) -> TaskRun | None:
+    # 沿 parent_run_id 找到该 L2 run 所基于的 L1 run（重试产生的 L2 run 指向上一个 L2 run）
+    cur: TaskRun | None = run
+    for _ in range(64):
+        if cur is None or cur.parent_run_id is None:
+            return None
+        cur = (await db.execute(select(TaskRun).where(TaskRun.id == cur.parent_run_id))).scalar_one_or_none()
+        if cur is not None and cur.phase == "l1":
+            return cur
+    return None
+
+
+@router.post("/task/{task_id}/retry_l2")
+async def retry_l2(task_id: str, run_id: Optional[str] = None, db: AsyncSession = Depends(get_db)):
+    """
+    只重跑 PARTIAL / ERROR 的 L2 run 中失败（或未完成）的章节，已完成的章节直接复用
+    """
+    result = await db.execute(select(ScriptTask).where(ScriptTask.id == task_id))
+    task = result.scalar_one_or_none()
+    if task is None:
+        raise HTTPException(status_code=404, detail=f"task_id 不存在: {task_id}")
+
+    query = select(TaskRun).where(TaskRun.task_id == task_id, TaskRun.phase == "l2")
+    if run_id is not None:
+        query = query.where(TaskRun.id == run_id)
+    src = (await db.execute(query.order_by(desc(TaskRun.created_at)).limit(1))).scalar_one_or_none()
+    if src is None:
+        raise HTTPException(status_code=404, detail="未找到可重试的 L2 run")
+
+    if await job_queue.is_active(db, src.id):
+        return {"task_id": task.id, "run_id": src.id, "status": "L2_RUNNING"}
+    if src.status == "DONE":
+        raise HTTPException(status_code=409, detail=f"L2 run 已完成，无需重试: {src.id}")
+
+    l1_run = await _l2_base_l1_run(db, src)
+    if l1_run is None or l1_run.result_json is None:
+        raise HTTPException(status_code=422, detail=f"找不到 L2 run 对应的 L1 结果: {src.id}")
+
+    rows = await _load_l2_chapters(db, src.id)
+    done = {r.stage - 1: Section.model_validate(r.result_json) for r in rows if r.result_json}
+    total = len((l1_run.result_json or {}).get("body") or [])
+    if not await _admit_task(db, task_id, "L2_RUNNING", busy=("L2_RUNNING",)):
+        return await _busy_response(db, task_id, "l2")
+
+    run = TaskRun(
+        task_id=task_id,
+        phase="l2",
+        status="RUNNING",
+        parent_run_id=src.id,
+        params_snapshot=src.params_snapshot,
+        compass_snapshot=src.compass_snapshot,
+        result_json=None,
+        error_message=None,
+    )
+    db.add(run)
+    await db.flush()
+
+    # 已完成章节复制到新 run，再次失败时仍可继续重试
+    for r in rows:
+        db.add(
+            TaskRunStage(
+                task_id=task_id,
+                run_id=run.id,
+                phase=r.phase,
+                kind=r.kind,
+                stage=r.stage,
+                result_json=r.result_json,
+            )
+        )
+    if src.status == "RUNNING":
+        await db.execute(
+            update(TaskRun)
+            .where(TaskRun.id == src.id)
+            .values(status="ERROR", error_message=f"interrupted; retried as run {run.id}")
+        )
+    job_queue.enqueue(db, task_id=task_id, run_id=run.id, kind="l2", payload={"l1_run_id": l1_run.id})
+    await db.commit()
+    await db.refresh(run)
+    job_queue.notify()
+    return {
+        "task_id": task_id,
+        "run_id": run.id,
+        "retried_from": src.id,
+        "reused_chapters": len(done),
+        "retry_chapters": max(0, total - len(done)),
+        "status": "L2_RUNNING",
+    }
+
+
+@router.post("/task/{task_id}/runs/{run_id}/cancel")
+async def cancel_run(task_id: str, run_id: str, db: AsyncSession = Depends(get_db)):
+    """
+    取消排队中或运行中的 run：排队与在途的 LLM 请求（含重试、拆分）立即停止并释放并发名额；
+    已完成的部分保留（L1 断点、L2 已完成章节），run 置为 CANCELLED，之后可用 resume_l1 / retry_l2 继续。
+    L1 备选方案与流水线中的 L2 run 随所属的主任务一起取消；由其他 worker 进程执行的 run 返回 CANCELLING，下次轮询时停止
+    """
+    run = (
+        await db.execute(select(TaskRun).where(TaskRun.id == run_id, TaskRun.task_id == task_id))
+    ).scalar_one_or_none()
+    if run is None:
+        raise HTTPException(status_code=404, detail=f"run 不存在: {run_id}")
+    if run.status == "CANCELLED":
+        return {"task_id": task_id, "run_id": run_id, "status": "CANCELLED"}
+    if run.status != "RUNNING":
+        raise HTTPException(status_code=409, detail=f"run 已结束（{run.status}），无法取消: {run_id}")
+
+    status = await job_queue.request_cancel(run_id)
+    if status is None and run.parent_run_id is not None:
+        status = await job_queue.request_cancel(run.parent_run_id)
+    if status is None:
+        # 没有进行中的任务（例如进程异常退出后遗留的 RUNNING）：直接标记
+        await db.execute(
+            update(TaskRun)
+            .where(TaskRun.id == run_id, TaskRun.status == "RUNNING")
+            .values(status="CANCELLED", error_message="cancelled by user")
+        )
+        await db.commit()
+        status = "CANCELLED"
+    return {"task_id": task_id, "run_id": run_id, "status": status}
+
+
+async def _run_pipeline_job(
+    task_id: str,
+    l1_run_id: str,
+    l2_run_id: str,
+    *,
+    resume_from: L1Checkpoint | None = None,
+    done: dict[tuple[int, ...], tuple[str, Section]] | None = None,
+) -> None:
+    # resume_from / done: 重启后重新认领时 L1 的断点与已落盘的流水线章节（排序键 -> (L1 段落内容哈希, 章节)）
+    # L1 每个阶段拆分完成即提交给 L2；L1 结束后先落 L1 结果（状态 L2_RUNNING），再等 L2 尾部完成
+    current_run_id = l1_run_id
+    pipeline: L2Pipeline | None = None
+    l1_json: dict | None = None
+    try:
+        async with AsyncSessionLocal() as session:
+            result = await session.execute(select(ScriptTask).where(ScriptTask.id == task_id))
+            t = result.scalar_one_or_none()
+            if t is None:
+                return
+            params = t.params or {}
+            content = t.input_text or ""
+            images = list(t.image_paths) if t.image_paths else None
+
+        compass = await _ensure_task_compass(task_id)
+        brief = await _ensure_task_brief(task_id)
+
+        def _on_l2_progress(e: ProgressEvent) -> None:
+            asyncio.create_task(_append_progress_event(task_id, l2_run_id, e))
+
+        # 章节序号要等 L1 结束、最终顺序确定后才知道：此前完成的章节在 L1 结束时统一落盘，之后完成的逐章落盘
+        # 每个章节另按排序键 + L1 段落内容哈希落盘，重启后续跑时 L1 重新给出的段落内容不变即可沿用
+        chapter_index: dict[tuple[int, ...], int] = {}
+        chapter_hashes: dict[tuple[int, ...], str] = {}
+
+        async def _on_chapter_done(order: tuple[int, ...], section: Section) -> None:
+            await _save_pipeline_chapter(task_id, l2_run_id, order, chapter_hashes[order], section)
+            if order in chapter_index:
+                await _save_l2_chapter(task_id, l2_run_id, chapter_index[order], section)
+
+        pipeline = L2Pipeline(
+            content=content,
+            batch_num=settings.L2_BATCH_NUM,
+            target_audience=str(params.get("audience") or "general"),
+            platform=str(params.get("platformFormat") or "抖音"),
+            language=str(params.get("outputLang") or "中文"),
+            images=images,
+            compass=compass,
+            on_progress=_on_l2_progress,
+            include_stage_result=False,
+            brief=brief,
+            on_chapter_done=_on_chapter_done,
+        )
+
+        async def _submit(order: tuple[int, ...], sections: list[ScriptSection]) -> None:
+            reused: dict[int, Section] = {}
+            for i, sec in enumerate(sections):
+                h = chapter_hashes.setdefault((*order, i), _l1_item_hash(sec.model_dump()))
+                prev = (done or {}).get((*order, i))
+                if prev is not None and prev[0] == h:
+                    reused[i] = prev[1]
+            await pipeline.submit(order, sections, done=reused)
 
-    async def _job() -> None:
         try:
-            async with AsyncSessionLocal() as session:
-                result = await session.execute(select(ScriptTask).where(ScriptTask.id == task_id))
-                t = result.scalar_one_or_none()
-                if t is None:
-                    return
-                params = t.params or {}
-                base_script = L1VideoScript.model_validate(latest_l1.result_json)
-                content = t.input_text or ""
-                images = list(t.image_paths) if t.image_paths else None
+            l1_json = await _infer_l1_for_run(task_id, l1_run_id, resume_from=resume_from, on_sections_ready=_submit)
+        except BaseException:
+            pipeline.cancel()
+            raise
+        if l1_json is None:
+            pipeline.cancel()
+            return
+
+        async with AsyncSessionLocal() as session:
+            await session.execute(update(ScriptTask).where(ScriptTask.id == task_id).values(status="L2_RUNNING"))
+            await session.execute(
+                update(TaskRun)
+                .where(TaskRun.id == l1_run_id)
+                .values(status="DONE", result_json=l1_json, error_message=None)
+            )
+            await session.commit()
 
-            compass = await _ensure_task_compass(task_id)
+        current_run_id = l2_run_id
+        chapter_index.update(pipeline.chapter_index())
+        for i, sec in enumerate(pipeline.partial_results()):
+            if sec is not None:
+                await _save_l2_chapter(task_id, l2_run_id, i, sec)
+        try:
+            sections = await pipeline.results()
+        except L2PartialError as e:
+            await _finish_l2_run(task_id, l2_run_id, l1_json, e.sections, e)
+            return
+
+        await _finish_l2_run(task_id, l2_run_id, l1_json, sections)
+    except asyncio.CancelledError:
+        # 用户取消：L1 阶段的断点已逐阶段落盘；L2 阶段把已完成的章节落盘后作为部分结果保留
+        if pipeline is not None:
+            pipeline.cancel()
+        reason = job_queue.cancel_reason(l1_run_id)
+        if reason is not None and current_run_id == l2_run_id and pipeline is not None:
+            for i, sec in enumerate(pipeline.partial_results()):
+                if sec is not None:
+                    await _save_l2_chapter(task_id, l2_run_id, i, sec)
+            await _save_cancelled_l2_run(task_id, l2_run_id, l1_json, reason)
+        raise
+    except Exception as e:
+        async with AsyncSessionLocal() as session:
+            await session.execute(update(ScriptTask).where(ScriptTask.id == task_id).values(status="ERROR"))
+            # L1 失败时两个 run 都置为 ERROR；L1 已完成则只有 L2 run 失败
+            failed = [l1_run_id, l2_run_id] if current_run_id == l1_run_id else [l2_run_id]
+            await session.execute(
+                update(TaskRun)
+                .where(TaskRun.id.in_(failed))
+                .values(status="ERROR", error_message=repr(e))
+            )
+            await session.commit()
 
-            def _on_progress(e: ProgressEvent) -> None:
-                asyncio.create_task(_append_progress_event(task_id, run.id, e))
 
-            sections = await l2_script_infer(
-                base_script=base_script,
-                content=content,
-                batch_num=2,
-                target_audience=str(params.get("audience") or "general"),
-                platform=str(params.get("platformFormat") or "抖音"),
-                language=str(params.get("outputLang") or "中文"),
-                images=images,
-                compass=compass,
-                on_progress=_on_progress,
-                include_stage_result=False,
+async def _run_l2_translate_job(task_id: str, run_id: str, sections_json: list, language: str) -> None:
+    try:
+        def _on_progress(e: ProgressEvent) -> None:
+            asyncio.create_task(_append_progress_event(task_id, run_id, e))
+
+        sections = await l2_translate_sections(
+            [Section.model_validate(s) for s in sections_json],
+            language,
+            batch_chars=settings.L2_TRANSLATE_BATCH_CHARS,
+            on_progress=_on_progress,
+        )
+        async with AsyncSessionLocal() as session:
+            await session.execute(
+                update(TaskRun)
+                .where(TaskRun.id == run_id)
+                .values(status="DONE", result_json=[s.model_dump() for s in sections], error_message=None)
             )
+            await session.commit()
+    except Exception as e:
+        async with AsyncSessionLocal() as session:
+            await session.execute(
+                update(TaskRun).where(TaskRun.id == run_id).values(status="ERROR", error_message=repr(e))
+            )
+            await session.commit()
+        # 交给任务队列把 job 也记为 ERROR，与 run 状态一致
+        raise
 
-            async with AsyncSessionLocal() as session:
-                dumped_sections = [s.model_dump() for s in sections]
-                l1_body = []
-                if isinstance(latest_l1.result_json, dict):
-                    l1_body = list(latest_l1.result_json.get("body") or [])
-
-                for i, sec in enumerate(dumped_sections):
-                    if not isinstance(sec, dict):
-                        continue
-
-                    if not sec.get("item_id"):
-                        l1_item_id = None
-                        if i < len(l1_body) and isinstance(l1_body[i], dict):
-                            l1_item_id = l1_body[i].get("item_id")
-                        sec["item_id"] = l1_item_id or uuid.uuid4().hex
-
-                    sub = list(sec.get("sub_sections") or [])
-                    used = {sec.get("item_id")} if sec.get("item_id") else set()
-                    for seg in sub:
-                        if not isinstance(seg, dict):
-                            continue
-
-                        seg_id = seg.get("item_id")
-                        if (not seg_id) or (seg_id in used):
-                            seg_id = uuid.uuid4().hex
-                            seg["item_id"] = seg_id
-                        used.add(seg_id)
-                    sec["sub_sections"] = sub
-
-                await session.execute(update(ScriptTask).where(ScriptTask.id == task_id).values(status="DONE"))
-                await session.execute(
-                    update(TaskRun)
-                    .where(TaskRun.id == run.id)
-                    .values(status="DONE", result_json=dumped_sections, error_message=None)
-                )
-                await session.commit()
-        except Exception as e:
-            async with AsyncSessionLocal() as session:
-                await session.execute(update(ScriptTask).where(ScriptTask.id == task_id).values(status="ERROR"))
-                await session.execute(
-                    update(TaskRun)
-                    .where(TaskRun.id == run.id)
-                    .values(status="ERROR", error_message=repr(e))
-                )
-                await session.commit()
 
-    asyncio.create_task(_job())
-    return {"task_id": task.id, "run_id": run.id, "status": "L2_RUNNING"}
+@router.post("/task/{task_id}/translate_l2")
+async def translate_l2(task_id: str, req: TranslateL2Request, db: AsyncSession = Depends(get_db)):
+    """
+    把一份已完成的 L2 翻译成多种语言（只翻译文案字段，时长/景别/运镜/item_id 不变）；
+    每种语言一个 run（phase=l2_i18n，parent_run_id 指向源 L2 run），各语言并发执行，不改变任务状态
+    """
+    result = await db.execute(select(ScriptTask).where(ScriptTask.id == task_id))
+    task = result.scalar_one_or_none()
+    if task is None:
+        raise HTTPException(status_code=404, detail=f"task_id 不存在: {task_id}")
+
+    query = select(TaskRun).where(TaskRun.task_id == task_id, TaskRun.phase == "l2", TaskRun.status == "DONE")
+    if req.run_id is not None:
+        query = query.where(TaskRun.id == req.run_id)
+    src = (await db.execute(query.order_by(desc(TaskRun.created_at)).limit(1))).scalar_one_or_none()
+    if src is None or not isinstance(src.result_json, list):
+        raise HTTPException(status_code=404, detail="未找到已完成的 L2 结果（请先运行 L2）")
+
+    languages: list[str] = []
+    for lang in req.languages:
+        lang = lang.strip()
+        if lang and lang not in languages:
+            languages.append(lang)
+    if not languages:
+        raise HTTPException(status_code=422, detail="languages 不能为空")
+
+    runs: list[TaskRun] = []
+    for lang in languages:
+        run = TaskRun(
+            task_id=task_id,
+            phase="l2_i18n",
+            status="RUNNING",
+            parent_run_id=src.id,
+            params_snapshot={**(src.params_snapshot or {}), "outputLang": lang},
+            compass_snapshot=src.compass_snapshot,
+            result_json=None,
+            error_message=None,
+        )
+        db.add(run)
+        runs.append(run)
+    await db.flush()
+    for run, lang in zip(runs, languages):
+        job_queue.enqueue(
+            db,
+            task_id=task_id,
+            run_id=run.id,
+            kind="l2_translate",
+            payload={"source_run_id": src.id, "language": lang},
+        )
+    await db.commit()
+    job_queue.notify()
+    return {
+        "task_id": task_id,
+        "source_run_id": src.id,
+        "runs": [{"language": lang, "run_id": run.id} for run, lang in zip(runs, languages)],
+    }
+
+
+@router.post("/task/{task_id}/run_pipeline")
+async def run_pipeline(task_id: str, db: AsyncSession = Depends(get_db)):
+    """
+    L1 + L2 流水线：L1 的段落一确定就开始对应的 L2，不必等 L1 全部完成；结果与依次调用 run_l1 / run_l2 一致
+    """
+    result = await db.execute(select(ScriptTask).where(ScriptTask.id == task_id))
+    task = result.scalar_one_or_none()
+    if task is None:
+        raise HTTPException(status_code=404, detail=f"task_id 不存在: {task_id}")
+
+    if not task.params:
+        raise HTTPException(status_code=422, detail="请先设置 params，再启动 L1")
+    if not await _admit_task(db, task_id, "L1_RUNNING", busy=("L1_RUNNING", "L2_RUNNING")):
+        return await _busy_response(db, task_id, "l1")
+
+    l1_run = TaskRun(
+        task_id=task_id,
+        phase="l1",
+        status="RUNNING",
+        parent_run_id=None,
+        params_snapshot=task.params,
+        compass_snapshot=task.compass,
+        result_json=None,
+        error_message=None,
+    )
+    db.add(l1_run)
+    await db.flush()
+
+    l2_run = TaskRun(
+        task_id=task_id,
+        phase="l2",
+        status="RUNNING",
+        parent_run_id=l1_run.id,
+        params_snapshot=task.params,
+        compass_snapshot=task.compass,
+        result_json=None,
+        error_message=None,
+    )
+    db.add(l2_run)
+    await db.flush()
+    job_queue.enqueue(db, task_id=task_id, run_id=l1_run.id, kind="pipeline", payload={"l2_run_id": l2_run.id})
+    await db.commit()
+    await db.refresh(l1_run)
+    await db.refresh(l2_run)
+    job_queue.notify()
+    return {"task_id": task_id, "l1_run_id": l1_run.id, "l2_run_id": l2_run.id, "status": "L1_RUNNING"}
+
+
+# 任务队列 handler：只从数据库读取 run 的输入（payload 里只有 id），因此任务可以在重启后、或由其他进程重新执行；
+# L1 从本 run 已落盘的断点继续，L2 跳过本 run 已完成的章节
+async def _l1_job_handler(task_id: str, run_id: str, payload: dict) -> None:
+    async with AsyncSessionLocal() as session:
+        rows = await _load_l1_checkpoints(session, run_id)
+    checkpoint = _l1_checkpoint_from_rows(rows) if rows else None
+    await _run_l1_job(task_id, run_id, resume_from=checkpoint)
+
+
+async def _l1_variants_job_handler(task_id: str, run_id: str, payload: dict) -> None:
+    await _run_l1_variants_job(task_id, run_id, list(payload.get("variant_run_ids") or []))
+
+
+async def _load_run_result(run_id: str | None) -> Any:
+    async with AsyncSessionLocal() as session:
+        run = (await session.execute(select(TaskRun).where(TaskRun.id == run_id))).scalar_one_or_none()
+    if run is None or run.result_json is None:
+        raise RuntimeError(f"source run has no result: {run_id}")
+    return run.result_json
+
+
+async def _l2_job_handler(task_id: str, run_id: str, payload: dict) -> None:
+    l1_json = await _load_run_result(payload.get("l1_run_id"))
+    async with AsyncSessionLocal() as session:
+        rows = await _load_l2_chapters(session, run_id)
+    done = {r.stage - 1: Section.model_validate(r.result_json) for r in rows if r.result_json}
+    await _run_l2_job(task_id, run_id, l1_json, done=done)
+
+
+async def _speculative_l2_job_handler(task_id: str, run_id: str, payload: dict) -> None:
+    await _run_speculative_l2_job(task_id, run_id, await _load_run_result(payload.get("l1_run_id")))
+
+
+async def _pipeline_job_handler(task_id: str, run_id: str, payload: dict) -> None:
+    l2_run_id = str(payload["l2_run_id"])
+    async with AsyncSessionLocal() as session:
+        l1_run = (await session.execute(select(TaskRun).where(TaskRun.id == run_id))).scalar_one()
+        l1_rows = await _load_l1_checkpoints(session, run_id)
+        l2_rows = await _load_l2_chapters(session, l2_run_id)
+        chapters = await _load_pipeline_chapters(session, l2_run_id)
+
+    if l1_run.status == "DONE" and l1_run.result_json is not None:
+        # L1 已完成：只剩 L2。已按序号落盘的章节直接沿用，L1 结束前完成的章节按段落内容哈希对应回 L1 body
+        done = {r.stage - 1: Section.model_validate(r.result_json) for r in l2_rows if r.result_json}
+        by_hash = {h: sec for h, sec in chapters.values()}
+        for i, it in enumerate(l1_run.result_json.get("body") or []):
+            if i not in done and isinstance(it, dict) and _l1_item_hash(it) in by_hash:
+                done[i] = by_hash[_l1_item_hash(it)]
+        await _run_l2_job(task_id, l2_run_id, l1_run.result_json, done=done)
+        return
+
+    checkpoint = _l1_checkpoint_from_rows(l1_rows) if l1_rows else None
+    await _run_pipeline_job(task_id, run_id, l2_run_id, resume_from=checkpoint, done=chapters)
+
+
+async def _l2_translate_job_handler(task_id: str, run_id: str, payload: dict) -> None:
+    sections_json = await _load_run_result(payload.get("source_run_id"))
+    await _run_l2_translate_job(task_id, run_id, list(sections_json), str(payload["language"]))
+
+
+job_queue.register("l1", _l1_job_handler)
+job_queue.register("l1_variants", _l1_variants_job_handler)
+job_queue.register("l2", _l2_job_handler)
+job_queue.register("l2_speculative", _speculative_l2_job_handler)
+job_queue.register("pipeline", _pipeline_job_handler)
+job_queue.register("l2_translate", _l2_translate_job_handler)
@@ -8,8 +8,11 @@ from pydantic import BaseModel, Field
 from sqlalchemy import select, desc
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from agent.l1_workflow import l1_apply_section_instructions, score_l1_script
+from core.compass import CompassSelection, build_compass_prompt
 from core.dependences import get_db
 from database.models import TaskRun
+from schema.base import L1VideoScript
 
 router = APIRouter(prefix="/l1", tags=["L1"])
 
@@ -43,6 +46,15 @@ class L1ItemUpdateRequest(BaseModel):
     duration: Optional[int] = Field(default=None, ge=1)
 
 
+class L1AiAdjustItem(BaseModel):
+    item_id: str
+    instruction: str = Field(..., min_length=1)
+
+
+class L1AiAdjustRequest(BaseModel):
+    items: List[L1AiAdjustItem] = Field(..., min_length=1)
+
+
 async def _get_latest_l1_run(db: AsyncSession, task_id: str) -> TaskRun:
     run = (
         await db.execute(
@@ -256,3 +268,165 @@ async def delete_l1_item(task_id: str, req: L1DeleteRequest, db: AsyncSession =
     await db.refresh(new_run)
 
     return {"task_id": task_id, "run_id": new_run.id, "l1": l1_json}
+
+
+@router.post("/task/{task_id}/ai_adjust")
+async def ai_adjust_l1(task_id: str, req: L1AiAdjustRequest, db: AsyncSession = Depends(get_db)):
+    """
+    按 (item_id, instruction) 批量让模型改写多个 L1 段落（并发执行），结果落为一个新的 L1 run
+    """
+    run = await _get_latest_l1_run(db, task_id)
+    l1_json = _recalc_total_duration(_ensure_item_ids(dict(run.result_json)))
+    body: List[dict] = list(l1_json.get("body") or [])
+
+    instructions: list[tuple[int, str]] = []
+    seen: set[str] = set()
+    for it in req.items:
+        if it.item_id in seen:
+            raise HTTPException(status_code=422, detail=f"item_id 重复: {it.item_id}")
+        seen.add(it.item_id)
+        idx = next((i for i, x in enumerate(body) if isinstance(x, dict) and x.get("item_id") == it.item_id), None)
+        if idx is None:
+            raise HTTPException(status_code=404, detail=f"item_id 不存在: {it.item_id}")
+        instructions.append((idx, it.instruction))
+
+    l1_json["body"] = body
+    compass = run.compass_snapshot or {}
+    compass_prompt = build_compass_prompt(
+        root_dir="./compass",
+        platform=str((run.params_snapshot or {}).get("platformFormat") or "抖音"),
+        selection=CompassSelection(director=compass.get("director"), style=compass.get("style")),
+    )
+
+    try:
+        script = await l1_apply_section_instructions(
+            script=L1VideoScript.model_validate(l1_json),
+            instructions=instructions,
+            compass_prompt=compass_prompt,
+        )
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"AI 修改失败: {e!r}")
+
+    new_body = [sec.model_dump() for sec in script.body]
+    l1_json["body"] = new_body
+    l1_json = _recalc_total_duration(l1_json)
+
+    new_run = TaskRun(
+        task_id=task_id,
+        phase="l1",
+        status="DONE",
+        parent_run_id=run.id,
+        params_snapshot=run.params_snapshot,
+        compass_snapshot=run.compass_snapshot,
+        result_json=l1_json,
+        error_message=None,
+    )
+    db.add(new_run)
+    await db.commit()
+    await db.refresh(new_run)
+
+    return {"task_id": task_id, "run_id": new_run.id, "l1": l1_json}
+
+
+@router.get("/task/{task_id}/variants")
+async def list_l1_variants(task_id: str, run_id: Optional[str] = None, db: AsyncSession = Depends(get_db)):
+    """
+    列出 run_l1?variants=N 生成的各备选方案及本地评分；run_id 缺省时取最近一次多方案 L1
+    """
+    if run_id is None:
+        latest = (
+            await db.execute(
+                select(TaskRun)
+                .where(TaskRun.task_id == task_id, TaskRun.phase == "l1_variant")
+                .order_by(desc(TaskRun.created_at))
+                .limit(1)
+            )
+        ).scalar_one_or_none()
+        if latest is None:
+            raise HTTPException(status_code=404, detail="未找到多方案 L1（请使用 run_l1?variants=N）")
+        run_id = latest.parent_run_id
+
+    variants = (
+        await db.execute(
+            select(TaskRun)
+            .where(
+                TaskRun.task_id == task_id,
+                TaskRun.phase == "l1_variant",
+                TaskRun.parent_run_id == run_id,
+            )
+            .order_by(TaskRun.created_at, TaskRun.id)
+        )
+    ).scalars().all()
+    if not variants:
+        raise HTTPException(status_code=404, detail=f"run_id 没有备选方案: {run_id}")
+
+    current = (
+        await db.execute(
+            select(TaskRun)
+            .where(TaskRun.task_id == task_id, TaskRun.phase == "l1")
+            .order_by(desc(TaskRun.created_at))
+            .limit(1)
+        )
+    ).scalar_one_or_none()
+    current_json = current.result_json if current is not None else None
+
+    items = []
+    for i, v in enumerate(variants):
+        score = None
+        if v.status == "DONE" and v.result_json:
+            params = v.params_snapshot or {}
+            score = score_l1_script(
+                L1VideoScript.model_validate(v.result_json),
+                target_duration=int(params.get("durationSec") or 60),
+            )
+        items.append(
+            {
+                "run_id": v.id,
+                "variant_index": i,
+                "status": v.status,
+                "error_message": v.error_message,
+                "score": score,
+                "selected": current_json is not None and v.result_json == current_json,
+                "l1": v.result_json,
+            }
+        )
+
+    return {"task_id": task_id, "run_id": run_id, "variants": items}
+
+
+@router.post("/task/{task_id}/variants/{variant_run_id}/select")
+async def select_l1_variant(task_id: str, variant_run_id: str, db: AsyncSession = Depends(get_db)):
+    """
+    选用某个备选方案：以该方案结果新建一个 L1 run（parent_run_id 指向该方案），后续编辑/L2 均基于它
+    """
+    variant = (
+        await db.execute(
+            select(TaskRun).where(
+                TaskRun.id == variant_run_id,
+                TaskRun.task_id == task_id,
+                TaskRun.phase == "l1_variant",
+            )
+        )
+    ).scalar_one_or_none()
+    if variant is None:
+        raise HTTPException(status_code=404, detail=f"备选方案不存在: {variant_run_id}")
+    if variant.status != "DONE" or variant.result_json is None:
+        raise HTTPException(status_code=409, detail=f"备选方案未成功生成: {variant.status}")
+
+    l1_json = _recalc_total_duration(_ensure_item_ids(dict(variant.result_json)))
+
+    new_run = TaskRun(
+        task_id=task_id,
+        phase="l1",
+        status="DONE",
+        parent_run_id=variant.id,
+        params_snapshot=variant.params_snapshot,
+        compass_snapshot=variant.compass_snapshot,
+        result_json=l1_json,
+        error_message=None,
+    )
+    db.add(new_run)
+    await db.commit()
+    await db.refresh(new_run)
+
+    return {"task_id": task_id, "run_id": new_run.id, "l1": l1_json}
@@ -1,17 +1,22 @@
 from __future__ import annotations
 
+import hashlib
 import uuid
 from typing import Optional, List
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, Header, HTTPException
 from fastapi.responses import PlainTextResponse
 from pydantic import BaseModel, Field
 from sqlalchemy import select, desc
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from core.compass import CompassSelection
+from core.idempotency import run_idempotent
 from core.dependences import get_db
 from database.models import TaskRun, ScriptTask
 from agent.prompt_export_agent import PromptExportAgent
+from agent.l2_workflow import l2_regenerate_section, l2_regenerate_shot
+from schema.base import ContentBrief, Section, Segment
 
 router = APIRouter(prefix="/l2", tags=["L2"])
 
@@ -130,6 +135,10 @@ class L2SubItemUpdateRequest(BaseModel):
     compliance_notes: Optional[str] = None
 
 
+class L2RegenerateRequest(BaseModel):
+    instruction: Optional[str] = Field(default=None, description="修改要求；为空时在原叙事目标下重新创作")
+
+
 class L2SubItemReorderRequest(BaseModel):
     section_id: str
     from_sub_item_id: str
@@ -144,8 +153,25 @@ async def export_sub_item_prompt(
     section_id: str,
     sub_item_id: str,
     target: str,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
     db: AsyncSession = Depends(get_db),
 ):
+    # 导出会调用一次 LLM：带 Idempotency-Key 的重复请求直接返回第一次导出的结果
+    return await run_idempotent(
+        f"export_prompt:{task_id}",
+        idempotency_key,
+        {"section_id": section_id, "sub_item_id": sub_item_id, "target": target},
+        lambda: _export_sub_item_prompt(db, task_id, section_id, sub_item_id, target),
+    )
+
+
+async def _export_sub_item_prompt(
+    db: AsyncSession,
+    task_id: str,
+    section_id: str,
+    sub_item_id: str,
+    target: str,
+) -> str:
     target_key = (target or "").strip().lower()
     if target_key not in _TARGET_MAX_CHARS:
         raise HTTPException(status_code=422, detail="target 必须是 seedrance2 / sora2 / veo3")
@@ -385,3 +411,197 @@ async def reorder_sub_item(task_id: str, req: L2SubItemReorderRequest, db: Async
     await db.refresh(new_run)
 
     return {"task_id": task_id, "run_id": new_run.id, "sections": sections}
+
+
+async def _cached_brief(db: AsyncSession, task: ScriptTask) -> ContentBrief | None:
+    # 与 L2 生成共用已缓存的内容简报（原文哈希一致才用），没有则直接用原文
+    content = task.input_text or ""
+    brief_run = (
+        await db.execute(
+            select(TaskRun)
+            .where(TaskRun.task_id == task.id, TaskRun.phase == "brief", TaskRun.status == "DONE")
+            .order_by(desc(TaskRun.created_at))
+            .limit(1)
+        )
+    ).scalar_one_or_none()
+    if brief_run is None:
+        return None
+    if (brief_run.params_snapshot or {}).get("content_hash") != hashlib.sha1(content.encode("utf-8")).hexdigest():
+        return None
+    try:
+        return ContentBrief.model_validate(brief_run.result_json)
+    except Exception:
+        return None
+
+
+def _neighbor_shot(sections: list, sec_idx: int, step: int) -> Optional[dict]:
+    # 相邻段落的衔接镜头：前一段的最后一个镜头 / 后一段的第一个镜头
+    j = sec_idx + step
+    if j < 0 or j >= len(sections) or not isinstance(sections[j], dict):
+        return None
+    sub = [x for x in (sections[j].get("sub_sections") or []) if isinstance(x, dict)]
+    if not sub:
+        return None
+    return sub[-1] if step < 0 else sub[0]
+
+
+async def _regenerate_kwargs(db: AsyncSession, task_id: str, run: TaskRun) -> dict:
+    task = (
+        await db.execute(select(ScriptTask).where(ScriptTask.id == task_id))
+    ).scalar_one_or_none()
+    if task is None:
+        raise HTTPException(status_code=404, detail=f"task_id 不存在: {task_id}")
+
+    params = run.params_snapshot or task.params or {}
+    compass = run.compass_snapshot or {}
+    return {
+        "content": task.input_text or "",
+        "brief": await _cached_brief(db, task),
+        "target_audience": str(params.get("audience") or "general"),
+        "platform": str(params.get("platformFormat") or "抖音"),
+        "language": str(params.get("outputLang") or "中文"),
+        "images": list(task.image_paths) if task.image_paths else None,
+        "compass": CompassSelection(director=compass.get("director"), style=compass.get("style")),
+    }
+
+
+@router.post("/task/{task_id}/section/{section_id}/regenerate")
+async def regenerate_section(
+    task_id: str,
+    section_id: str,
+    req: Optional[L2RegenerateRequest] = None,
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    让模型只重写一个 L2 段落（带前后相邻镜头做衔接），段落时长与 item_id 不变，结果落为一个新的 L2 run
+    """
+    run = await _get_latest_l2_run(db, task_id)
+    sections = list(run.result_json or [])
+
+    sec_idx = _find_section_index(sections, section_id)
+    if sec_idx < 0:
+        raise HTTPException(status_code=404, detail=f"section_id 不存在: {section_id}")
+
+    kwargs = await _regenerate_kwargs(db, task_id, run)
+    prev_shot = _neighbor_shot(sections, sec_idx, -1)
+    next_shot = _neighbor_shot(sections, sec_idx, 1)
+    try:
+        new_sec = await l2_regenerate_section(
+            section=Section.model_validate(_recalc_section_duration(dict(sections[sec_idx]))),
+            prev_shot=Segment.model_validate(prev_shot) if prev_shot else None,
+            next_shot=Segment.model_validate(next_shot) if next_shot else None,
+            instruction=req.instruction if req else None,
+            **kwargs,
+        )
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"AI 重写失败: {e!r}")
+
+    sections[sec_idx] = _ensure_sub_item_ids(new_sec.model_dump())
+
+    new_run = TaskRun(
+        task_id=task_id,
+        phase="l2",
+        status="DONE",
+        parent_run_id=run.id,
+        params_snapshot=run.params_snapshot,
+        compass_snapshot=run.compass_snapshot,
+        result_json=sections,
+        error_message=None,
+    )
+    db.add(new_run)
+    await db.commit()
+    await db.refresh(new_run)
+
+    return {"task_id": task_id, "run_id": new_run.id, "sections": sections}
+
+
+@router.post("/task/{task_id}/section/{section_id}/shot/{sub_item_id}/regenerate")
+async def regenerate_shot(
+    task_id: str,
+    section_id: str,
+    sub_item_id: str,
+    req: Optional[L2RegenerateRequest] = None,
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    让模型只重写一个镜头（带前后镜头做衔接），镜头时长与 item_id 不变，结果落为一个新的 L2 run
+    """
+    run = await _get_latest_l2_run(db, task_id)
+    sections = list(run.result_json or [])
+
+    sec_idx = _find_section_index(sections, section_id)
+    if sec_idx < 0:
+        raise HTTPException(status_code=404, detail=f"section_id 不存在: {section_id}")
+
+    sec = _recalc_section_duration(_ensure_sub_item_ids(dict(sections[sec_idx])))
+    sub = list(sec.get("sub_sections") or [])
+    sub_idx = _find_sub_index(sub, sub_item_id)
+    if sub_idx < 0:
+        raise HTTPException(status_code=404, detail=f"sub_item_id 不存在: {sub_item_id}")
+
+    kwargs = await _regenerate_kwargs(db, task_id, run)
+    prev_shot = _neighbor_shot(sections, sec_idx, -1) if sub_idx == 0 else None
+    next_shot = _neighbor_shot(sections, sec_idx, 1) if sub_idx == len(sub) - 1 else None
+    try:
+        new_sec = await l2_regenerate_shot(
+            section=Section.model_validate(sec),
+            shot_index=sub_idx,
+            prev_shot=Segment.model_validate(prev_shot) if prev_shot else None,
+            next_shot=Segment.model_validate(next_shot) if next_shot else None,
+            instruction=req.instruction if req else None,
+            **kwargs,
+        )
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"AI 重写失败: {e!r}")
+
+    sections[sec_idx] = new_sec.model_dump()
+
+    new_run = TaskRun(
+        task_id=task_id,
+        phase="l2",
+        status="DONE",
+        parent_run_id=run.id,
+        params_snapshot=run.params_snapshot,
+        compass_snapshot=run.compass_snapshot,
+        result_json=sections,
+        error_message=None,
+    )
+    db.add(new_run)
+    await db.commit()
+    await db.refresh(new_run)
+
+    return {"task_id": task_id, "run_id": new_run.id, "sections": sections}
+
+
+@router.get("/task/{task_id}/translations")
+async def list_translations(task_id: str, run_id: Optional[str] = None, db: AsyncSession = Depends(get_db)):
+    """
+    列出某个 L2 run（默认最近一次 DONE）的各语言翻译；同一语言只返回最新一次
+    """
+    src = await _get_latest_l2_run(db, task_id) if run_id is None else (
+        await db.execute(select(TaskRun).where(TaskRun.id == run_id, TaskRun.task_id == task_id, TaskRun.phase == "l2"))
+    ).scalar_one_or_none()
+    if src is None:
+        raise HTTPException(status_code=404, detail=f"L2 run 不存在: {run_id}")
+
+    rows = (
+        await db.execute(
+            select(TaskRun)
+            .where(TaskRun.parent_run_id == src.id, TaskRun.phase == "l2_i18n")
+            .order_by(desc(TaskRun.created_at))
+        )
+    ).scalars().all()
+
+    out: dict[str, dict] = {}
+    for r in rows:
+        lang = str((r.params_snapshot or {}).get("outputLang") or "")
+        if lang in out:
+            continue
+        out[lang] = {
+            "language": lang,
+            "run_id": r.id,
+            "status": r.status,
+            "error": r.error_message,
+            "sections": r.result_json,
+        }
+    return {"task_id": task_id, "source_run_id": src.id, "translations": list(out.values())}
@@ -2,6 +2,7 @@ from fastapi import APIRouter, HTTPException, Query
 from typing import Literal, Optional, List, Dict, Union
 from pydantic import BaseModel
 
+from util import metrics
 from core.compass import (
     CompassRegistry,
     CompassDoc,
@@ -218,3 +219,7 @@ async def compass_info():
         raise HTTPException(status_code=500, detail=f"Error getting compass info: {str(e)}")
 
 
+@router.get("/metrics")
+async def get_metrics():
+    """Get in-process metrics (per-model adaptive concurrency, in-flight requests, request counts and latency)"""
+    return metrics.snapshot()
@@ -1,5 +1,7 @@
-from typing import Any, List, Literal, Optional
-from pydantic import BaseModel, Field, conint
+from typing import Any, List, Literal, Optional, Union
+from pydantic import BaseModel, Field, ValidationInfo, conint, model_validator
+
+from schema.repair import is_model_output, repair_script_section_data, repair_section_data, repair_segment_data
 
 
 class ScriptSection(BaseModel):
@@ -11,6 +13,11 @@ class ScriptSection(BaseModel):
         ge=1,
         description="该段落时长（秒），必须 >= 1"
     )
+
+    @model_validator(mode="before")
+    @classmethod
+    def _repair(cls, data: Any, info: ValidationInfo) -> Any:
+        return repair_script_section_data(data) if is_model_output(info) else data
     
     def __str__(self):
         return f"[{self.duration}s] {self.section}\n理由: {self.rationale}"
@@ -56,6 +63,71 @@ class L1VideoScript(BaseModel):
         )
 
 
+class L1OutlineSegment(BaseModel):
+    title: str = Field(..., description="该段大纲标题")
+    brief: str = Field("", description="该段要讲的内容要点（一两句话）")
+    duration: int = Field(
+        ...,
+        ge=1,
+        description="该段目标时长（秒），必须 >= 1"
+    )
+
+
+class L1Outline(BaseModel):
+    title: str = Field(..., description="整条视频标题")
+    keywords: List[str] = Field(default_factory=list)
+    segments: List[L1OutlineSegment] = Field(default_factory=list, description="按时间顺序排列的大纲分段")
+    notes: str = ""
+
+
+class L1StageCheckpoint(BaseModel):
+    # 单个已完成的 L1 步骤：
+    # - stage: 串行续写的第 N 阶段（result 为 L1VideoScript）
+    # - outline: parallel 模式的大纲（stage=0，result 为 L1Outline）
+    # - segment: parallel 模式已扩写的第 N 个分段（result 为 L1VideoScript）
+    # - act: hierarchical 模式第 N 幕的章节大纲（result 为 L1Outline）；
+    #   该模式下章节以 segment 记录，stage = N * L1_HIER_STAGE_STRIDE + 章节序号
+    kind: Literal["stage", "outline", "segment", "act"]
+    stage: int = Field(..., ge=0)
+    result: dict[str, Any]
+    current_second: int = 0
+    previous_json: Optional[str] = None
+
+
+# hierarchical 模式下章节断点的 stage 编码步长：第 a 幕第 c 章 -> (a + 1) * STRIDE + c + 1
+L1_HIER_STAGE_STRIDE = 1000
+
+
+class L1Checkpoint(BaseModel):
+    stages: List[L1VideoScript] = Field(default_factory=list)
+    current_second: int = 0
+    previous_json: Optional[str] = None
+    outline: Optional[L1Outline] = None
+    segments: dict[int, L1VideoScript] = Field(default_factory=dict, description="segment_index -> 扩写结果")
+    acts: dict[int, L1Outline] = Field(default_factory=dict, description="act_index -> 章节大纲（hierarchical 模式）")
+
+    @classmethod
+    def from_stage_checkpoints(cls, items: List[L1StageCheckpoint]) -> "L1Checkpoint":
+        out = cls()
+        # 同一 (kind, stage) 重复出现时以最后一条为准（run 被重新执行过），避免续跑时合并出重复段落
+        latest = {(it.kind, it.stage): it for it in items}
+        for it in sorted(latest.values(), key=lambda x: x.stage):
+            if it.kind == "stage":
+                out.stages.append(L1VideoScript.model_validate(it.result))
+                out.current_second = it.current_second
+                out.previous_json = it.previous_json
+            elif it.kind == "outline":
+                out.outline = L1Outline.model_validate(it.result)
+            elif it.kind == "segment":
+                out.segments[it.stage - 1] = L1VideoScript.model_validate(it.result)
+            elif it.kind == "act":
+                out.acts[it.stage - 1] = L1Outline.model_validate(it.result)
+        return out
+
+    def is_empty(self) -> bool:
+        return not self.stages and self.outline is None
+
+
 from typing import List
 from pydantic import BaseModel, Field, conint
 
@@ -75,6 +147,11 @@ class Segment(BaseModel):
     transition: str = Field("", description="转场到下一镜头（可为空）")
     compliance_notes: str = Field("", description="合规注意事项（可为空）")
 
+    @model_validator(mode="before")
+    @classmethod
+    def _repair(cls, data: Any, info: ValidationInfo) -> Any:
+        return repair_segment_data(data) if is_model_output(info) else data
+
 
 class SubSection(BaseModel):
     sub_section: str = Field(..., description="子段落标题")
@@ -89,6 +166,38 @@ class Section(BaseModel):
     sub_sections: List[Segment] = Field(..., min_items=1, description="镜头列表")
     duration: conint(ge=1) = Field(..., description="本段落总时长（秒），必须与 sub_sections.duration_s 之和一致")
 
+    @model_validator(mode="before")
+    @classmethod
+    def _repair(cls, data: Any, info: ValidationInfo) -> Any:
+        # 模型输出的时长之和不一致、镜头 item_id 重复等在本地修正，不触发重新请求
+        return repair_section_data(data) if is_model_output(info) else data
+
+
+class ContentBrief(BaseModel):
+    # 原文的浓缩上下文：L2 各章节共用，代替整篇原文
+    summary: str = Field(..., description="原文主旨（两三句话）")
+    key_facts: List[str] = Field(default_factory=list, description="必须保留的关键事实/数据/人物/情节")
+    product_attributes: List[str] = Field(default_factory=list, description="产品/品牌的名称、卖点、规格、价格等（无则为空）")
+    tone: str = Field("", description="原文的语气与风格")
+    must_keep: List[str] = Field(default_factory=list, description="需要原样引用的关键词句、口号（可为空）")
+
+    def __str__(self):
+        lines = [f"主旨: {self.summary}"]
+        if self.key_facts:
+            lines.append("关键事实:\n" + "\n".join(f"- {x}" for x in self.key_facts))
+        if self.product_attributes:
+            lines.append("产品属性:\n" + "\n".join(f"- {x}" for x in self.product_attributes))
+        if self.tone:
+            lines.append(f"语气: {self.tone}")
+        if self.must_keep:
+            lines.append("原文引用:\n" + "\n".join(f"- {x}" for x in self.must_keep))
+        return "\n".join(lines)
+
+
+class L2SectionPack(BaseModel):
+    # 章节打包：一次请求扩写多个相邻的短章节
+    sections: List[Section] = Field(..., min_items=1, description="与输入章节一一对应、顺序一致的 L2 段落列表")
+
 
 class TotalVideoScript(BaseModel):
     title: str = Field(..., description="整条视频标题")
@@ -107,3 +216,51 @@ class ProgressEvent(BaseModel):
     type: str
     data: dict[str, Any] = Field(default_factory=dict)
 
+
+# *_stream 异步迭代接口产出的结果事件（进度事件仍为 ProgressEvent）
+class CompassEvent(BaseModel):
+    kind: Literal["compass"] = "compass"
+    director: Optional[str] = None
+    style: Optional[List[str]] = None
+
+
+class L1SectionsEvent(BaseModel):
+    # 一个 L1 阶段/分段/章节已确定（已完成超长拆分）；order 为其在最终 body 中的排序键
+    kind: Literal["l1_sections"] = "l1_sections"
+    order: List[int]
+    sections: List[ScriptSection]
+
+
+class L1ResultEvent(BaseModel):
+    kind: Literal["l1_result"] = "l1_result"
+    script: L1VideoScript
+
+
+class L2SectionEvent(BaseModel):
+    # 一个 L2 段落完成；index 为对应的 L1 body 下标（流水线模式下 L1 未结束时未知，为 None，用 order 排序）
+    kind: Literal["l2_section"] = "l2_section"
+    index: Optional[int] = None
+    order: List[int]
+    section: Section
+
+
+class L2ResultEvent(BaseModel):
+    kind: Literal["l2_result"] = "l2_result"
+    sections: List[Section]
+
+
+class TotalResultEvent(BaseModel):
+    kind: Literal["result"] = "result"
+    script: TotalVideoScript
+
+
+WorkflowEvent = Union[
+    ProgressEvent,
+    CompassEvent,
+    L1SectionsEvent,
+    L1ResultEvent,
+    L2SectionEvent,
+    L2ResultEvent,
+    TotalResultEvent,
+]
+
@@ -0,0 +1,161 @@
+from typing import Any, List, Literal, Optional
+
+from pydantic import BaseModel, Field, conint, model_validator
+
+from schema.base import Section
+from schema.repair import MODEL_OUTPUT_CONTEXT
+from util import metrics
+
+
+# L2 紧凑输出 schema：短字段名 + 景别/运镜代码 + 空字段省略，输出 token 约为完整 Section 的一半；
+# 模型按紧凑格式输出，本地展开成 Section 后再走常规校验（含 schema.repair 的本地修复）
+
+SHOT_CODES: dict[str, str] = {
+    "ECU": "大特写",
+    "CU": "特写",
+    "MCU": "近景",
+    "MS": "中景",
+    "FS": "全景",
+    "LS": "远景",
+    "OTS": "过肩",
+    "POV": "主观视角",
+    "TOP": "俯拍",
+    "AER": "航拍",
+}
+
+CAMERA_CODES: dict[str, str] = {
+    "FIX": "静止",
+    "PUSH": "推",
+    "PULL": "拉",
+    "PAN": "摇",
+    "TILT": "俯仰",
+    "MOVE": "移",
+    "TRK": "跟拍",
+    "ZOOM": "变焦",
+    "HAND": "手持",
+    "ORB": "环绕",
+    "CRANE": "升降",
+}
+
+ShotCode = Literal["ECU", "CU", "MCU", "MS", "FS", "LS", "OTS", "POV", "TOP", "AER"]
+CameraCode = Literal["FIX", "PUSH", "PULL", "PAN", "TILT", "MOVE", "TRK", "ZOOM", "HAND", "ORB", "CRANE"]
+
+COMPACT_HINT = (
+    "## 输出格式（紧凑） "
+    "按紧凑 JSON 输出：h=段落标题 r=rationale d=时长(秒) ss=镜头列表；"
+    "镜头 t=标题 d=秒 s=景别代码 c=运镜代码 l=场景 v=画面 p=道具 o=字幕 a=口播 m=BGM x=转场 n=合规。"
+    f"景别代码：{' '.join(f'{k}={v}' for k, v in SHOT_CODES.items())}；"
+    f"运镜代码：{' '.join(f'{k}={v}' for k, v in CAMERA_CODES.items())}。"
+    "p/o/a/m/x/n 为空时直接省略该字段。"
+)
+
+
+def _to_code(value: Any, codes: dict[str, str], default: str, field: str) -> Any:
+    # 模型偶尔输出中文名称或小写代码：映射回代码；完全无法识别时退到默认值，不触发重新请求
+    if not isinstance(value, str):
+        return value
+    v = value.strip()
+    if v.upper() in codes:
+        return v.upper()
+    for code, name in codes.items():
+        if v == name:
+            return code
+    for code, name in codes.items():
+        if name in v:
+            return code
+    metrics.inc("schema_repairs_total", model="CompactSegment", kind=f"{field}_code")
+    return default
+
+
+class CompactSegment(BaseModel):
+    t: str = Field(..., description="标题")
+    d: conint(ge=1) = Field(..., description="秒")
+    s: ShotCode = Field(..., description="景别代码")
+    c: CameraCode = Field(..., description="运镜代码")
+    l: str = Field(..., description="场景")
+    v: str = Field(..., description="画面")
+    p: Optional[List[str]] = Field(None, description="道具")
+    o: Optional[str] = Field(None, description="字幕")
+    a: Optional[str] = Field(None, description="口播")
+    m: Optional[str] = Field(None, description="BGM")
+    x: Optional[str] = Field(None, description="转场")
+    n: Optional[str] = Field(None, description="合规")
+
+    @model_validator(mode="before")
+    @classmethod
+    def _codes(cls, data: Any) -> Any:
+        if not isinstance(data, dict):
+            return data
+        fixed = dict(data)
+        if "s" in fixed:
+            fixed["s"] = _to_code(fixed["s"], SHOT_CODES, "MS", "shot")
+        if "c" in fixed:
+            fixed["c"] = _to_code(fixed["c"], CAMERA_CODES, "FIX", "camera")
+        return fixed
+
+    def expand(self) -> dict:
+        return {
+            "title": self.t,
+            "duration_s": self.d,
+            "shot": SHOT_CODES[self.s],
+            "camera_move": CAMERA_CODES[self.c],
+            "location": self.l,
+            "props": list(self.p or []),
+            "visual": self.v,
+            "onscreen_text": self.o or "",
+            "audio": self.a or "",
+            "music": self.m or "",
+            "transition": self.x or "",
+            "compliance_notes": self.n or "",
+        }
+
+
+class CompactSection(BaseModel):
+    h: str = Field(..., description="段落标题")
+    r: str = Field(..., description="rationale")
+    d: conint(ge=1) = Field(..., description="总秒数=ss.d之和")
+    ss: List[CompactSegment] = Field(..., min_items=1, description="镜头")
+
+    def to_section(self) -> Section:
+        # 展开结果仍是模型输出，走同样的本地修复
+        return Section.model_validate(
+            {
+                "section": self.h,
+                "rationale": self.r,
+                "duration": self.d,
+                "sub_sections": [s.expand() for s in self.ss],
+            },
+            context=MODEL_OUTPUT_CONTEXT,
+        )
+
+    @classmethod
+    def from_section(cls, section: Section) -> "CompactSection":
+        # 反向转换：基准测试与示例输出用；非代码表内的景别/运镜按最接近的代码处理
+        return cls.model_validate(
+            {
+                "h": section.section,
+                "r": section.rationale,
+                "d": section.duration,
+                "ss": [
+                    {
+                        "t": s.title,
+                        "d": s.duration_s,
+                        "s": s.shot,
+                        "c": s.camera_move,
+                        "l": s.location,
+                        "v": s.visual,
+                        "p": s.props or None,
+                        "o": s.onscreen_text or None,
+                        "a": s.audio or None,
+                        "m": s.music or None,
+                        "x": s.transition or None,
+                        "n": s.compliance_notes or None,
+                    }
+                    for s in section.sub_sections
+                ],
+            }
+        )
+
+
+class CompactSectionPack(BaseModel):
+    xs: List[CompactSection] = Field(..., min_items=1, description="与输入章节一一对应的段落")
@@ -0,0 +1,147 @@
+from __future__ import annotations
+
+from typing import Any
+
+from pydantic import ValidationInfo
+
+from util import metrics
+
+
+# 模型输出的本地修复：在 pydantic 校验之前把“差一点就合法”的结果修正过来，
+# 避免 instructor 因校验失败整段重新请求模型。每次修复计入 schema_repairs_total{model, kind}。
+# 只对模型输出生效：agent 层解析响应时带上 MODEL_OUTPUT_CONTEXT，读库、接口入参等普通校验原样通过。
+
+MODEL_OUTPUT_CONTEXT = {"model_output": True}
+
+# 可为空的字符串字段：模型输出 null 时补成 ""
+_SEGMENT_OPTIONAL_STR = ("onscreen_text", "audio", "music", "transition", "compliance_notes")
+
+
+def _count(model: str, kind: str) -> None:
+    metrics.inc("schema_repairs_total", model=model, kind=kind)
+
+
+def is_model_output(info: ValidationInfo) -> bool:
+    return bool(info.context and info.context.get("model_output"))
+
+
+def _to_int(v: Any) -> int | None:
+    try:
+        return int(round(float(v)))
+    except (TypeError, ValueError):
+        return None
+
+
+def fit_durations(values: list[int], total: int) -> list[int]:
+    # 按比例缩放到总和恰好为 total，每项 >= 1（最大余数法分配取整误差）；total < len(values) 时无法满足，只做 >= 1 截断
+    n = len(values)
+    weights = [max(1, int(v)) for v in values]
+    if n == 0 or total < n or sum(weights) == total:
+        return weights
+    spare = total - n
+    scale = sum(weights)
+    raw = [spare * w / scale for w in weights]
+    out = [1 + int(r) for r in raw]
+    order = sorted(range(n), key=lambda i: raw[i] - int(raw[i]), reverse=True)
+    for i in order[: total - sum(out)]:
+        out[i] += 1
+    return out
+
+
+def _get(obj: Any, key: str) -> Any:
+    return obj.get(key) if isinstance(obj, dict) else getattr(obj, key, None)
+
+
+def _set(obj: Any, **updates: Any) -> Any:
+    if isinstance(obj, dict):
+        return {**obj, **updates}
+    return obj.model_copy(update=updates)
+
+
+def repair_segment_data(data: Any) -> Any:
+    if not isinstance(data, dict):
+        return data
+    fixed = dict(data)
+    for key in _SEGMENT_OPTIONAL_STR:
+        if key in fixed and fixed[key] is None:
+            fixed[key] = ""
+            _count("Segment", "empty_field")
+    if "props" in fixed and fixed["props"] is None:
+        fixed["props"] = []
+        _count("Segment", "empty_field")
+    raw = fixed.get("duration_s")
+    d = _to_int(raw)
+    if d is not None and (d < 1 or (isinstance(raw, float) and raw != d)):
+        fixed["duration_s"] = max(1, d)
+        _count("Segment", "duration_clamp")
+    return fixed
+
+
+def repair_section_data(data: Any) -> Any:
+    # Section：镜头时长之和必须等于 duration；镜头 item_id 在段落内去重（重复的置空，由调用方重新分配）
+    if not isinstance(data, dict):
+        return data
+    segs = data.get("sub_sections")
+    if not isinstance(segs, list) or not segs:
+        return data
+    fixed = dict(data)
+    segs = [repair_segment_data(s) for s in segs]
+
+    seen: set[str] = set()
+    for i, s in enumerate(segs):
+        seg_id = _get(s, "item_id")
+        if not seg_id:
+            continue
+        if seg_id in seen:
+            segs[i] = _set(s, item_id=None)
+            _count("Section", "duplicate_item_id")
+        else:
+            seen.add(seg_id)
+
+    durations = [_to_int(_get(s, "duration_s")) for s in segs]
+    if all(d is not None for d in durations):
+        durations = [max(1, d) for d in durations]
+        total = _to_int(fixed.get("duration"))
+        if total is None or total < 1:
+            fixed["duration"] = sum(durations)
+            _count("Section", "duration_total")
+        elif sum(durations) != total:
+            if total >= len(durations):
+                new = fit_durations(durations, total)
+                segs = [_set(s, duration_s=d) if d != old else s for s, d, old in zip(segs, new, durations)]
+            else:
+                fixed["duration"] = sum(durations)
+            _count("Section", "duration_sum")
+    fixed["sub_sections"] = segs
+    return fixed
+
+
+def repair_script_section_data(data: Any) -> Any:
+    # L1 段落：duration 至少 1 秒，rationale 允许为空
+    if not isinstance(data, dict):
+        return data
+    fixed = dict(data)
+    raw = fixed.get("duration")
+    d = _to_int(raw)
+    if d is not None and (d < 1 or (isinstance(raw, float) and raw != d)):
+        fixed["duration"] = max(1, d)
+        _count("ScriptSection", "duration_clamp")
+    if "rationale" in fixed and fixed["rationale"] is None:
+        fixed["rationale"] = ""
+        _count("ScriptSection", "empty_field")
+    return fixed
+
+
+def fit_section(section: Any, duration: int) -> Any:
+    # 把 L2 Section 的总时长对齐到 L1 章节时长（模型差一两秒时不必重新生成）
+    duration = int(duration)
+    if int(section.duration) == duration or duration < len(section.sub_sections):
+        return section
+    new = fit_durations([int(s.duration_s) for s in section.sub_sections], duration)
+    _count("Section", "chapter_duration")
+    return section.model_copy(
+        update={
+            "duration": duration,
+            "sub_sections": [s.model_copy(update={"duration_s": d}) for s, d in zip(section.sub_sections, new)],
+        }
+    )
@@ -54,3 +54,17 @@ def render_prompt_template(
     return _PLACEHOLDER_RE.sub(_replace, template_text)
 
 
+_CJK_RE = re.compile(r"[\u3000-\u303f\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uff00-\uffef]")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    粗略估算文本 token 数（不依赖具体 tokenizer）
+
+    CJK 字符按 1 字 ≈ 1 token，其余字符按 4 字符 ≈ 1 token 计算，
+    仅用于预算控制（prompt 裁剪、分组打包等），不追求精确。
+    """
+    if not text:
+        return 0
+    cjk = len(_CJK_RE.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
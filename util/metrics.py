@@ -0,0 +1,56 @@
+from __future__ import annotations
+
+import threading
+from typing import Any
+
+
+# 进程内指标（计数器 / 仪表 / 耗时汇总），GET /v1/metrics 以 JSON 输出
+# labels 以排序后的 (key, value) 元组作为键，值统一转成字符串
+
+_lock = threading.Lock()
+_counters: dict[tuple[str, tuple[tuple[str, str], ...]], float] = {}
+_gauges: dict[tuple[str, tuple[tuple[str, str], ...]], float] = {}
+_summaries: dict[tuple[str, tuple[tuple[str, str], ...]], dict[str, float]] = {}
+
+
+def _key(name: str, labels: dict[str, Any]) -> tuple[str, tuple[tuple[str, str], ...]]:
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def inc(name: str, value: float = 1, **labels: Any) -> None:
+    k = _key(name, labels)
+    with _lock:
+        _counters[k] = _counters.get(k, 0) + value
+
+
+def set_gauge(name: str, value: float, **labels: Any) -> None:
+    with _lock:
+        _gauges[_key(name, labels)] = value
+
+
+def observe(name: str, value: float, **labels: Any) -> None:
+    k = _key(name, labels)
+    with _lock:
+        s = _summaries.get(k)
+        if s is None:
+            s = {"count": 0, "sum": 0.0, "max": 0.0}
+            _summaries[k] = s
+        s["count"] += 1
+        s["sum"] += value
+        s["max"] = max(s["max"], value)
+
+
+def snapshot() -> dict[str, list[dict[str, Any]]]:
+    with _lock:
+        return {
+            "counters": [{"name": n, "labels": dict(lb), "value": v} for (n, lb), v in sorted(_counters.items())],
+            "gauges": [{"name": n, "labels": dict(lb), "value": v} for (n, lb), v in sorted(_gauges.items())],
+            "summaries": [{"name": n, "labels": dict(lb), **s} for (n, lb), s in sorted(_summaries.items())],
+        }
+
+
+def reset() -> None:
+    with _lock:
+        _counters.clear()
+        _gauges.clear()
+        _summaries.clear()
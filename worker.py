@@ -0,0 +1,46 @@
+# worker.py
+# 独立的任务 worker 进程：从 task_jobs 表认领并执行 run（L1 / L2 / 流水线 / 投机预生成 / 翻译），不提供 HTTP 接口
+#
+#   python -m worker                     # 并发数取 JOB_WORKER_CONCURRENCY
+#   python -m worker --concurrency 8
+#
+# 配合 API 进程的 JOB_WORKER_IN_API=false 使用：API 只负责入队与读取，生成任务全部在 worker 中执行。
+# 多个 worker（多核 / 多机）共享同一个数据库即可水平扩容，租约保证同一任务同时只由一个 worker 执行；
+# 收到 SIGINT / SIGTERM 后停止认领，等待在跑任务最多 JOB_DRAIN_TIMEOUT_SEC 秒，其余释放租约交给其他 worker。
+import argparse
+import asyncio
+import contextlib
+import signal
+
+from core import settings
+from core.job_queue import job_queue
+from database.base import async_engine
+from database.models import Base
+import router.draft.draft_router  # noqa: F401  注册各类任务的 handler
+
+
+async def main(concurrency: int | None = None) -> None:
+    async with async_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    await job_queue.recover()
+    job_queue.start(concurrency=concurrency)
+    print(f"worker {job_queue.worker_id} started, concurrency={job_queue.concurrency}")
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        with contextlib.suppress(NotImplementedError):
+            loop.add_signal_handler(sig, stop.set)
+    try:
+        await stop.wait()
+    finally:
+        print(f"worker {job_queue.worker_id} draining")
+        await job_queue.stop(timeout=settings.JOB_DRAIN_TIMEOUT_SEC)
+        await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="BestScriptWriter job worker")
+    parser.add_argument("--concurrency", type=int, default=None, help="同时执行的 run 数（默认 JOB_WORKER_CONCURRENCY）")
+    args = parser.parse_args()
+    asyncio.run(main(args.concurrency))